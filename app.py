@@ -4,7 +4,7 @@ import numpy as np
 import json
 import os
 from datetime import datetime
-from utils.data_processing import load_food_data, load_exercise_data, load_user_records
+from utils.datasets import get_dataset
 
 # Set page configuration
 st.set_page_config(
@@ -14,15 +14,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize session state variables if they don't exist
-if 'food_data' not in st.session_state:
-    st.session_state.food_data = load_food_data()
-
-if 'exercise_data' not in st.session_state:
-    st.session_state.exercise_data = load_exercise_data()
-
-if 'user_records' not in st.session_state:
-    st.session_state.user_records = load_user_records()
+# Datasets are loaded once per process and shared by all sessions,
+# session state only holds references to the shared read-only views
+st.session_state.food_data = get_dataset("food_data")
+st.session_state.exercise_data = get_dataset("exercise_data")
+st.session_state.user_records = get_dataset("user_records")
 
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
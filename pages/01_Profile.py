@@ -1,10 +1,10 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 from datetime import datetime
 from utils.data_processing import calculate_bmi, load_user_records
 from utils.user_management import create_new_user, update_user, delete_user, get_user, update_user_progress
 from utils.visualization import create_bmi_chart, create_weight_progress_chart
+from utils.progress import get_progress_series
 
 def main():
     st.title("📝 User Profile")
@@ -73,20 +73,18 @@ def display_existing_profile():
     # Progress tracking
     st.subheader("Weight Progress")
     
-    progress_history = user_data.get('progress_history', [])
-    if progress_history:
-        progress_fig = create_weight_progress_chart(progress_history)
+    series = get_progress_series(user_data, user_id)
+    if len(series) > 0:
+        progress_fig = create_weight_progress_chart(series)
         st.plotly_chart(progress_fig, use_container_width=True)
         
         # Show last few entries in a table
         st.markdown("**Recent Progress Entries**")
         
-        # Convert progress history to DataFrame for display
-        progress_df = pd.DataFrame(progress_history[-5:])  # Show last 5 entries
+        # Show last 5 entries, newest first
+        progress_df = series.to_dataframe().iloc[:-6:-1]
         if not progress_df.empty:
-            progress_df['timestamp'] = pd.to_datetime(progress_df['timestamp'])
             progress_df['timestamp'] = progress_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M')
-            progress_df = progress_df.sort_values('timestamp', ascending=False)
             
             # Rename columns for display
             progress_df = progress_df.rename(columns={
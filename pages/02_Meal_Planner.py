@@ -1,10 +1,203 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from utils.data_processing import load_food_data, filter_foods_by_preference, calculate_calorie_needs, calculate_macros
-from utils.recommendations import generate_meal_plan, recommend_foods_by_goal
+from utils.data_processing import filter_foods_by_preference, calculate_calorie_needs, calculate_macros
+from utils.recommendations import (generate_meal_plan, stream_meal_plan, replan_meal_plan, substitute_plan_food,
+                                   new_plan_seed, recommend_foods_by_goal)
+from utils.food_similarity import suggest_substitutes
+from utils.micronutrients import plan_micronutrients, recommend_gap_foods
+from utils.datasets import get_dataset
 from utils.user_management import get_user
-from utils.visualization import create_macronutrient_chart, create_meal_plan_calories_chart, create_nutrient_comparison_chart
+from utils.visualization import (create_macronutrient_chart, create_meal_plan_calories_chart, create_nutrient_comparison_chart,
+                                 create_micronutrient_coverage_chart)
+
+# Planning methods offered in the forms, mapped to generate_meal_plan's method
+PLANNING_METHODS = {
+    "Balanced (matches calorie and macro targets)": "solver",
+    "Quick (random foods up to calorie target)": "greedy"
+}
+
+# Gap-filling foods suggested under a plan's micronutrient coverage, and
+# their most calories per serving
+GAP_FOOD_SUGGESTIONS = 5
+GAP_FOOD_MAX_CALORIES = 300
+
+def init_plan_code(key):
+    """
+    Prefill a plan code field from a shared link's plan parameter
+    """
+    if key not in st.session_state:
+        st.session_state[key] = st.query_params.get("plan", "")
+
+def parse_plan_code(plan_code):
+    """
+    Convert a plan code to a seed
+
+    Returns:
+    - Tuple: (seed or None for a new plan, error message or None)
+    """
+    plan_code = plan_code.strip()
+    if not plan_code:
+        return None, None
+    if not plan_code.isdigit():
+        return None, "Plan codes are whole numbers, e.g. 123456789"
+    return int(plan_code), None
+
+def show_meal_plan(request_key):
+    """
+    Display the plan of a stored request, day by day as the days are planned.
+    The finished plan is kept in the request for later views
+    """
+    request = st.session_state[request_key]
+    
+    if "plan" in request:
+        display_meal_plan(request["plan"], request_key)
+        return
+    
+    meal_plan, plan_days = stream_meal_plan(
+        request["user_data"],
+        get_dataset("food_data"),
+        days=request["days"],
+        meals_per_day=request["meals_per_day"],
+        method=request["method"],
+        seed=request["seed"]
+    )
+    
+    if "error" in meal_plan:
+        st.error(meal_plan["error"])
+        del st.session_state[request_key]
+        return
+    
+    display_meal_plan(meal_plan, request_key, plan_days, request["days"])
+    
+    # Every day is planned now; keep the plan so reruns neither plan it
+    # again nor rely on it staying in the shared plan cache
+    request["plan"] = meal_plan
+
+def current_meal_plan(request):
+    """
+    Get the plan of a stored request, including any days or meals changed since
+    """
+    if "plan" in request:
+        return request["plan"]
+    
+    return generate_meal_plan(
+        request["user_data"],
+        get_dataset("food_data"),
+        days=request["days"],
+        meals_per_day=request["meals_per_day"],
+        method=request["method"],
+        seed=request["seed"]
+    )
+
+def replan_from_page(request_key, day, meal_number=None):
+    """
+    Button callback: plan one day or meal of the stored plan again
+    """
+    request = st.session_state[request_key]
+    meal_plan = replan_meal_plan(
+        current_meal_plan(request),
+        request["user_data"],
+        get_dataset("food_data"),
+        day,
+        meal_number=meal_number,
+        method=request["method"]
+    )
+    
+    if "error" not in meal_plan:
+        request["plan"] = meal_plan
+
+def substitute_from_page(request_key, day, meal_number, position, substitute):
+    """
+    Button callback: swap one food of the stored plan for a substitute
+    """
+    request = st.session_state[request_key]
+    meal_plan = substitute_plan_food(current_meal_plan(request), day, meal_number, position, substitute)
+    
+    if "error" not in meal_plan:
+        request["plan"] = meal_plan
+
+def display_substitutes(request_key, day_number, meal):
+    """
+    Let the user swap a food of a meal for one with similar calories and macros
+    """
+    widget_key = f"{request_key}_day_{day_number}_meal_{meal['meal_number']}"
+    food_names = [food['name'] for food in meal['foods']]
+    
+    position = st.selectbox(
+        "Swap a food",
+        options=range(len(food_names)),
+        format_func=lambda i: food_names[i],
+        key=f"{widget_key}_swap"
+    )
+    
+    user_data = st.session_state[request_key]["user_data"]
+    substitutes = suggest_substitutes(food_names[position], get_dataset("food_data"), k=3,
+                                      diet=user_data.get('diet', 'both'), allergies=user_data.get('allergies'))
+    
+    if not substitutes:
+        st.caption("No similar foods found.")
+    
+    for i, substitute in enumerate(substitutes):
+        st.button(
+            f"Use {substitute['name']} ({substitute['calories']:.0f} kcal, P: {substitute['protein']:.1f}g, "
+            f"C: {substitute['carbs']:.1f}g, F: {substitute['fat']:.1f}g per serving)",
+            key=f"{widget_key}_use_{i}",
+            on_click=substitute_from_page,
+            args=(request_key, day_number, meal['meal_number'], position, substitute)
+        )
+
+def display_micronutrients(meal_plan, user_data=None):
+    """
+    Show a plan's vitamin and mineral coverage and foods that fill its gaps
+    """
+    food_data = get_dataset("food_data")
+    report = plan_micronutrients(meal_plan, food_data)
+    
+    with st.expander("Micronutrient Coverage"):
+        coverage_fig = create_micronutrient_coverage_chart(report["columns"], report["coverage"])
+        st.plotly_chart(coverage_fig, use_container_width=True)
+        if report["flagged_foods"]:
+            st.caption(f"{report['flagged_foods']} food entries of this plan have implausible vitamin and "
+                       f"mineral values in the food data and are left out of the coverage.")
+        
+        gap_foods = recommend_gap_foods(meal_plan, food_data, user_data, k=GAP_FOOD_SUGGESTIONS,
+                                        max_calories=GAP_FOOD_MAX_CALORIES)
+        if not gap_foods:
+            st.success("This plan meets the reference intake of every vitamin and mineral.")
+            return
+        
+        st.markdown(f"**Foods to close the gaps** (up to {GAP_FOOD_MAX_CALORIES} kcal per serving)")
+        gap_df = pd.DataFrame(
+            [[food['name'], f"{food['calories']:.0f} kcal", f"{food['gap_filled']:.0%}", ", ".join(food['nutrients'])]
+             for food in gap_foods],
+            columns=['Food', 'Calories', 'Gap Filled', 'Main Nutrients']
+        )
+        st.table(gap_df)
+        st.caption("Gap Filled is the share of the plan's missing daily vitamins and minerals one serving adds.")
+
+def request_meal_plan(request_key, user_data, days, meals_per_day, method, plan_code):
+    """
+    Remember the plan asked for by a form submission; show_meal_plan
+    generates and displays it
+    """
+    seed, error = parse_plan_code(plan_code)
+    if error:
+        st.error(error)
+        return
+    
+    if seed is None:
+        seed = new_plan_seed()
+    
+    # Rerunning the page shows the same plan again, and the link shares it
+    st.session_state[request_key] = {
+        "user_data": user_data,
+        "days": days,
+        "meals_per_day": meals_per_day,
+        "method": method,
+        "seed": seed
+    }
+    st.query_params["plan"] = str(seed)
 
 def main():
     st.title("🍽️ Meal Planner")
@@ -17,6 +210,7 @@ def main():
         # Show demo version with limited functionality
         st.subheader("Demo Version")
         st.markdown("Try out the meal planner with default settings:")
+        init_plan_code("demo_plan_code")
         
         with st.form(key="demo_meal_plan_form"):
             col1, col2 = st.columns(2)
@@ -24,6 +218,12 @@ def main():
             with col1:
                 days = st.slider("Number of Days", min_value=1, max_value=14, value=3)
                 meals_per_day = st.slider("Meals per Day", min_value=3, max_value=6, value=3)
+                planning_method = st.selectbox("Planning Method", options=list(PLANNING_METHODS.keys()))
+                st.text_input(
+                    "Plan Code",
+                    key="demo_plan_code",
+                    help="Leave empty for a new plan, or enter the code of an earlier plan to see it again"
+                )
             
             with col2:
                 diet_pref = st.selectbox(
@@ -51,19 +251,17 @@ def main():
                     "goal": goal
                 }
                 
-                # Generate meal plan
-                with st.spinner("Generating your meal plan..."):
-                    meal_plan = generate_meal_plan(
-                        default_user,
-                        st.session_state.food_data,
-                        days=days,
-                        meals_per_day=meals_per_day
-                    )
-                
-                if "error" in meal_plan:
-                    st.error(meal_plan["error"])
-                else:
-                    display_meal_plan(meal_plan)
+                request_meal_plan(
+                    "demo_meal_plan_request",
+                    default_user,
+                    days,
+                    meals_per_day,
+                    PLANNING_METHODS[planning_method],
+                    st.session_state.demo_plan_code
+                )
+        
+        if "demo_meal_plan_request" in st.session_state:
+            show_meal_plan("demo_meal_plan_request")
         
         return
     
@@ -108,6 +306,7 @@ def main():
     
     # Meal plan generator form
     st.subheader("Generate Meal Plan")
+    init_plan_code("plan_code")
     
     with st.form(key="meal_plan_form"):
         col1, col2 = st.columns(2)
@@ -115,6 +314,12 @@ def main():
         with col1:
             days = st.slider("Number of Days", min_value=1, max_value=30, value=7)
             meals_per_day = st.slider("Meals per Day", min_value=3, max_value=6, value=3)
+            planning_method = st.selectbox("Planning Method", options=list(PLANNING_METHODS.keys()))
+            st.text_input(
+                "Plan Code",
+                key="plan_code",
+                help="Leave empty for a new plan, or enter the code of an earlier plan to see it again"
+            )
         
         with col2:
             # Allow user to override diet preference
@@ -150,25 +355,23 @@ def main():
             user_data_copy['diet'] = diet_preference
             user_data_copy['goal'] = goal_setting
             
-            # Generate meal plan
-            with st.spinner("Generating your personalized meal plan..."):
-                meal_plan = generate_meal_plan(
-                    user_data_copy,
-                    st.session_state.food_data,
-                    days=days,
-                    meals_per_day=meals_per_day
-                )
-            
-            if "error" in meal_plan:
-                st.error(meal_plan["error"])
-            else:
-                display_meal_plan(meal_plan)
+            request_meal_plan(
+                f"meal_plan_request_{user_id}",
+                user_data_copy,
+                days,
+                meals_per_day,
+                PLANNING_METHODS[planning_method],
+                st.session_state.plan_code
+            )
+    
+    if f"meal_plan_request_{user_id}" in st.session_state:
+        show_meal_plan(f"meal_plan_request_{user_id}")
     
     # Food recommendations based on goal
     st.subheader("Recommended Foods Based on Your Goal")
     
     with st.spinner("Finding the best foods for your goal..."):
-        recommended_foods = recommend_foods_by_goal(user_data, st.session_state.food_data, num_recommendations=10)
+        recommended_foods = recommend_foods_by_goal(user_data, get_dataset("food_data"), num_recommendations=10)
     
     if recommended_foods:
         # Display top recommended foods
@@ -201,8 +404,9 @@ def main():
     if search_query:
         # Filter foods based on query
         query_lower = search_query.lower()
-        filtered_foods = st.session_state.food_data[
-            st.session_state.food_data["Food Name"].str.lower().str.contains(query_lower, na=False)
+        food_data = get_dataset("food_data")
+        filtered_foods = food_data[
+            food_data["Food Name"].str.lower().str.contains(query_lower, na=False)
         ]
         
         if filtered_foods.empty:
@@ -221,34 +425,40 @@ def main():
             
             st.dataframe(display_df, use_container_width=True)
 
-def display_meal_plan(meal_plan):
-    """
-    Display the generated meal plan
+def display_meal_plan(meal_plan, request_key=None, plan_days=None, day_count=None):
     """
-    st.subheader(f"Your {len(meal_plan['days'])}-Day Meal Plan")
+    Display the generated meal plan, with buttons to change single days and
+    meals when request_key names the stored request the plan came from
     
-    # Display overall plan metrics
-    metrics_col1, metrics_col2, metrics_col3 = st.columns(3)
-    
-    with metrics_col1:
-        st.metric("Daily Calorie Target", f"{meal_plan['daily_calories']} kcal")
+    With plan_days, an iterator from stream_meal_plan, and day_count, each
+    day's tab is filled as soon as the day is planned and the plan summary
+    follows once every day is done.
+    """
+    if plan_days is None:
+        plan_days = meal_plan['days']
+        day_count = len(meal_plan['days'])
     
-    with metrics_col2:
-        avg_calories = sum(day['total_calories'] for day in meal_plan['days']) / len(meal_plan['days'])
-        st.metric("Average Daily Calories", f"{avg_calories:.0f} kcal")
+    st.subheader(f"Your {day_count}-Day Meal Plan")
     
-    with metrics_col3:
-        avg_protein = sum(day['total_protein'] for day in meal_plan['days']) / len(meal_plan['days'])
-        st.metric("Average Daily Protein", f"{avg_protein:.1f} g")
+    if 'seed' in meal_plan:
+        if meal_plan.get('edits'):
+            st.caption(f"Plan code: {meal_plan['seed']} (gives this plan as it was before your changes)")
+        else:
+            st.caption(f"Plan code: {meal_plan['seed']} (enter it again or share this page's link to get the same plan)")
     
-    # Display calories chart
-    calories_fig = create_meal_plan_calories_chart(meal_plan)
-    st.plotly_chart(calories_fig, use_container_width=True)
+    # The summary needs every day, it is filled in below once the last day is planned
+    summary = st.container()
+    status = st.empty()
     
     # Display meal plan details with tabs for each day
-    day_tabs = st.tabs([f"Day {day['day']}" for day in meal_plan['days']])
+    day_tabs = st.tabs([f"Day {day}" for day in range(1, day_count + 1)])
     
-    for i, day in enumerate(meal_plan['days']):
+    for i, day in enumerate(plan_days):
+        if i + 1 < day_count:
+            status.caption(f"Planning day {i + 2} of {day_count}...")
+        else:
+            status.empty()
+        
         with day_tabs[i]:
             # Display day summary
             st.markdown(f"**Total Calories:** {day['total_calories']:.0f} kcal")
@@ -257,6 +467,14 @@ def display_meal_plan(meal_plan):
             if 'exercise_focus' in day:
                 st.markdown(f"**Exercise Focus:** {day['exercise_focus']}")
             
+            if request_key:
+                st.button(
+                    "New Plan for This Day",
+                    key=f"{request_key}_day_{day['day']}",
+                    on_click=replan_from_page,
+                    args=(request_key, day['day'])
+                )
+            
             # Display meals
             for meal in day['meals']:
                 with st.expander(f"{meal['meal_name']} - {meal['calories']:.0f} kcal"):
@@ -264,8 +482,9 @@ def display_meal_plan(meal_plan):
                     if meal['foods']:
                         food_data = []
                         for food in meal['foods']:
+                            servings = food.get('servings', 1)
                             food_data.append([
-                                food['name'],
+                                food['name'] if servings == 1 else f"{food['name']} (x{servings})",
                                 f"{food['calories']:.0f} kcal",
                                 f"{food['protein']:.1f}g",
                                 f"{food['carbs']:.1f}g",
@@ -278,8 +497,51 @@ def display_meal_plan(meal_plan):
                         )
                         
                         st.table(food_df)
+                        
+                        if request_key:
+                            display_substitutes(request_key, day['day'], meal)
                     else:
                         st.info("No foods selected for this meal.")
+                    
+                    if request_key:
+                        st.button(
+                            "Swap This Meal",
+                            key=f"{request_key}_day_{day['day']}_meal_{meal['meal_number']}",
+                            on_click=replan_from_page,
+                            args=(request_key, day['day'], meal['meal_number'])
+                        )
+    
+    with summary:
+        # Display overall plan metrics
+        metrics_col1, metrics_col2, metrics_col3, metrics_col4 = st.columns(4)
+        
+        with metrics_col1:
+            st.metric("Daily Calorie Target", f"{meal_plan['daily_calories']} kcal")
+        
+        with metrics_col2:
+            avg_calories = sum(day['total_calories'] for day in meal_plan['days']) / len(meal_plan['days'])
+            st.metric("Average Daily Calories", f"{avg_calories:.0f} kcal")
+        
+        with metrics_col3:
+            avg_protein = sum(day['total_protein'] for day in meal_plan['days']) / len(meal_plan['days'])
+            st.metric("Average Daily Protein", f"{avg_protein:.1f} g")
+        
+        with metrics_col4:
+            variety = meal_plan.get('variety')
+            if variety:
+                st.metric(
+                    "Food Variety",
+                    f"{variety['unique_foods']} foods",
+                    help=f"{variety['unique_share']:.0%} of the plan's food entries are different foods. "
+                         f"No food appears more than {variety['max_weekly_repeats']} times in a week."
+                )
+        
+        # Display calories chart
+        calories_fig = create_meal_plan_calories_chart(meal_plan)
+        st.plotly_chart(calories_fig, use_container_width=True)
+        
+        user_data = st.session_state[request_key]["user_data"] if request_key else None
+        display_micronutrients(meal_plan, user_data)
     
     # Option to save or print the meal plan
     st.subheader("Save Your Meal Plan")
@@ -336,7 +598,9 @@ def convert_plan_to_text(meal_plan):
             text += f"{meal['meal_name']} - {meal['calories']:.0f} kcal\n"
             
             for food in meal['foods']:
-                text += f"  • {food['name']} - {food['calories']:.0f} kcal (P: {food['protein']:.1f}g, C: {food['carbs']:.1f}g, F: {food['fat']:.1f}g)\n"
+                servings = food.get('servings', 1)
+                name = food['name'] if servings == 1 else f"{food['name']} (x{servings})"
+                text += f"  • {name} - {food['calories']:.0f} kcal (P: {food['protein']:.1f}g, C: {food['carbs']:.1f}g, F: {food['fat']:.1f}g)\n"
             
             text += "\n"
         
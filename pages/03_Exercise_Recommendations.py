@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from utils.recommendations import recommend_exercises
+from utils.recommendations import recommend_exercises, new_plan_seed
+from utils.datasets import get_dataset
 from utils.user_management import get_user
 from utils.visualization import create_exercise_distribution_chart
 
@@ -65,8 +66,9 @@ def main():
     if search_query:
         # Filter exercises based on query
         query_lower = search_query.lower()
-        filtered_exercises = st.session_state.exercise_data[
-            st.session_state.exercise_data["Exercise"].str.lower().str.contains(query_lower, na=False)
+        exercise_data = get_dataset("exercise_data")
+        filtered_exercises = exercise_data[
+            exercise_data["Exercise"].str.lower().str.contains(query_lower, na=False)
         ]
         
         if filtered_exercises.empty:
@@ -130,8 +132,13 @@ def display_exercise_recommendations(user_data):
         """)
     
     # Get personalized exercise recommendations
+    # One seed per session, so reruns of the page keep the same exercises
+    if "exercise_seed" not in st.session_state:
+        st.session_state.exercise_seed = new_plan_seed()
+    
     with st.spinner("Generating exercise recommendations..."):
-        exercise_recommendations = recommend_exercises(user_data, st.session_state.exercise_data)
+        exercise_recommendations = recommend_exercises(user_data, get_dataset("exercise_data"),
+                                                       seed=st.session_state.exercise_seed)
     
     if "error" in exercise_recommendations:
         st.error(exercise_recommendations["error"])
@@ -1,6 +1,7 @@
 import streamlit as st
 import time
 from utils.chatbot import NutritionChatbot
+from utils.datasets import get_dataset
 from utils.user_management import get_user
 
 def main():
@@ -10,10 +11,9 @@ def main():
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
-    # Check if food and exercise data is loaded
-    if not hasattr(st.session_state, 'food_data') or not hasattr(st.session_state, 'exercise_data'):
-        st.error("Required data is not loaded. Please restart the application.")
-        return
+    # Food and exercise data are shared by all sessions in this process
+    food_data = get_dataset("food_data")
+    exercise_data = get_dataset("exercise_data")
     
     # Get user data if logged in
     user_data = None
@@ -30,8 +30,8 @@ def main():
     
     # Initialize the chatbot
     chatbot = NutritionChatbot(
-        st.session_state.food_data,
-        st.session_state.exercise_data,
+        food_data,
+        exercise_data,
         user_data
     )
     
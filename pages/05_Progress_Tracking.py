@@ -1,11 +1,11 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from utils.user_management import get_user, update_user_progress
 from utils.visualization import create_weight_progress_chart, create_bmi_chart
+from utils.progress import get_progress_series
 
 def main():
     st.title("📈 Progress Tracking")
@@ -31,11 +31,14 @@ def main():
     # Display user info
     st.subheader(f"Progress Tracking for {user_data.get('name', 'User').title()}")
     
+    # Parse the progress history once for every chart on the page
+    series = get_progress_series(user_data, user_id)
+    
     # Overview metrics
-    display_overview_metrics(user_data)
+    display_overview_metrics(user_data, series)
     
     # Progress charts
-    display_progress_charts(user_data)
+    display_progress_charts(user_data, series)
     
     # Quick update form
     st.subheader("Quick Update")
@@ -54,12 +57,10 @@ def main():
         with update_col2:
             # Calculate days since last update
             last_update = "No previous updates"
-            if user_data.get('progress_history') and len(user_data['progress_history']) > 0:
-                last_entry = user_data['progress_history'][-1]
-                if 'timestamp' in last_entry:
-                    last_update_time = datetime.strptime(last_entry['timestamp'], "%Y-%m-%d %H:%M:%S")
-                    days_since = (datetime.now() - last_update_time).days
-                    last_update = f"{days_since} days ago" if days_since > 0 else "Today"
+            last_update_time = series.last_date()
+            if last_update_time is not None:
+                days_since = (datetime.now() - last_update_time).days
+                last_update = f"{days_since} days ago" if days_since > 0 else "Today"
             
             st.markdown(f"**Last Update:** {last_update}")
             st.markdown(f"**Current Weight:** {user_data.get('weight', 'N/A')} kg")
@@ -77,7 +78,7 @@ def main():
                 st.error(message)
     
     # Goal tracking
-    display_goal_tracking(user_data)
+    display_goal_tracking(user_data, series)
     
     # Progress journal
     st.subheader("Progress Journal")
@@ -91,9 +92,9 @@ def main():
         st.success("Journal entry saved! (Note: This is a demo feature - entries are not permanently stored in this version)")
     
     # Full progress history
-    display_full_history(user_data)
+    display_full_history(series)
 
-def display_overview_metrics(user_data):
+def display_overview_metrics(user_data, series):
     """
     Display overview metrics for the user
     """
@@ -110,7 +111,7 @@ def display_overview_metrics(user_data):
         st.metric(
             label="Current BMI",
             value=f"{user_data.get('bmi', 0):.1f}",
-            delta=get_bmi_delta(user_data)
+            delta=get_bmi_delta(series)
         )
     
     with col3:
@@ -119,22 +120,20 @@ def display_overview_metrics(user_data):
             value=user_data.get('health_status', 'N/A')
         )
 
-def get_bmi_delta(user_data):
+def get_bmi_delta(series):
     """
     Calculate BMI change from previous entry
     """
-    progress_history = user_data.get('progress_history', [])
-    
-    if len(progress_history) > 1:
-        current_bmi = progress_history[-1].get('bmi', 0)
-        previous_bmi = progress_history[-2].get('bmi', 0)
+    if len(series) > 1:
+        current_bmi = series.bmis[-1]
+        previous_bmi = series.bmis[-2]
         
         delta = current_bmi - previous_bmi
         return f"{delta:.2f}"
     
     return None
 
-def display_progress_charts(user_data):
+def display_progress_charts(user_data, series):
     """
     Display progress charts for the user
     """
@@ -144,15 +143,14 @@ def display_progress_charts(user_data):
     chart_tabs = st.tabs(["Weight History", "BMI", "Trends"])
     
     with chart_tabs[0]:
-        progress_history = user_data.get('progress_history', [])
-        if progress_history:
-            weight_fig = create_weight_progress_chart(progress_history)
+        if len(series) > 0:
+            weight_fig = create_weight_progress_chart(series)
             st.plotly_chart(weight_fig, use_container_width=True)
             
             # Add insight about weight change
-            if len(progress_history) > 1:
-                first_weight = progress_history[0].get('weight', 0)
-                current_weight = progress_history[-1].get('weight', 0)
+            if len(series) > 1:
+                first_weight = float(series.weights[0])
+                current_weight = float(series.weights[-1])
                 total_change = current_weight - first_weight
                 
                 if abs(total_change) > 0.1:  # Only show if there's a meaningful change
@@ -180,15 +178,12 @@ def display_progress_charts(user_data):
         """)
     
     with chart_tabs[2]:
-        progress_history = user_data.get('progress_history', [])
-        if progress_history and len(progress_history) > 2:
+        if len(series) > 2:
             # Create a weekly average chart to show trend
-            df = pd.DataFrame(progress_history)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df = df.sort_values('timestamp')
+            df = series.to_dataframe()
             
             # Create a 7-day moving average
-            df['weight_ma'] = df['weight'].rolling(window=min(7, len(df)), min_periods=1).mean()
+            df['weight_ma'] = series.moving_average(7)
             
             # Create the trend chart
             trend_fig = px.line(
@@ -214,8 +209,8 @@ def display_progress_charts(user_data):
             st.plotly_chart(trend_fig, use_container_width=True)
             
             # Calculate rate of change per week
-            if len(df) > 7:
-                weekly_change = calculate_weekly_change(df)
+            if len(series) > 7:
+                weekly_change = series.weekly_change()
                 
                 if weekly_change is not None:
                     if weekly_change < 0:
@@ -231,31 +226,6 @@ def display_progress_charts(user_data):
         else:
             st.info("Need more data points to analyze trends. Continue updating your progress regularly.")
 
-def calculate_weekly_change(df):
-    """
-    Calculate average weekly weight change
-    """
-    try:
-        # Get first and last entries
-        first_entry = df.iloc[0]
-        last_entry = df.iloc[-1]
-        
-        # Calculate total days
-        days_diff = (last_entry['timestamp'] - first_entry['timestamp']).days
-        
-        if days_diff < 1:
-            return None
-        
-        # Calculate weight change
-        weight_diff = last_entry['weight'] - first_entry['weight']
-        
-        # Calculate weekly change
-        weekly_change = weight_diff * 7 / days_diff
-        
-        return weekly_change
-    except:
-        return None
-
 def provide_trend_recommendation(goal, weekly_change):
     """
     Provide recommendations based on goal and weekly weight change
@@ -290,31 +260,30 @@ def provide_trend_recommendation(goal, weekly_change):
         else:
             st.info("Your weight is changing slightly. If maintenance is your goal, small adjustments to diet or activity may help.")
 
-def display_goal_tracking(user_data):
+def display_goal_tracking(user_data, series):
     """
     Display goal tracking section
     """
     st.subheader("Goal Tracking")
     
     goal = user_data.get('goal', 'Not specified')
-    progress_history = user_data.get('progress_history', [])
     
     st.markdown(f"**Current Goal:** {goal}")
     
     if 'weight loss' in goal.lower():
-        display_weight_loss_goal(progress_history)
+        display_weight_loss_goal(series)
     elif 'weight gain' in goal.lower():
-        display_weight_gain_goal(progress_history)
+        display_weight_gain_goal(series)
     elif 'muscle gain' in goal.lower():
-        display_muscle_gain_goal(progress_history)
+        display_muscle_gain_goal(series)
     else:
         st.info("Set a specific weight or fitness goal in your profile to track progress toward that goal.")
 
-def display_weight_loss_goal(progress_history):
+def display_weight_loss_goal(series):
     """
     Display weight loss goal tracking
     """
-    if not progress_history or len(progress_history) < 2:
+    if len(series) < 2:
         st.info("Need more data to track weight loss progress. Update your weight regularly.")
         return
     
@@ -323,8 +292,8 @@ def display_weight_loss_goal(progress_history):
     
     with col1:
         # Get starting weight
-        starting_weight = progress_history[0].get('weight', 0)
-        current_weight = progress_history[-1].get('weight', 0)
+        starting_weight = float(series.weights[0])
+        current_weight = float(series.weights[-1])
         
         weight_lost = starting_weight - current_weight
         
@@ -352,14 +321,9 @@ def display_weight_loss_goal(progress_history):
         st.markdown(f"**{progress_pct:.1f}% of goal achieved**")
     
     # Calculate estimated completion
-    if len(progress_history) > 2 and weight_lost > 0:
-        # Create a dataframe of progress history
-        df = pd.DataFrame(progress_history)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp')
-        
+    if len(series) > 2 and weight_lost > 0:
         # Calculate weekly rate of loss
-        weekly_change = calculate_weekly_change(df)
+        weekly_change = series.weekly_change()
         
         if weekly_change and weekly_change < 0:
             # Calculate remaining weight to lose
@@ -375,11 +339,11 @@ def display_weight_loss_goal(progress_history):
         else:
             st.warning("Your weight isn't currently decreasing. Adjust your calorie intake or activity level to create a deficit.")
 
-def display_weight_gain_goal(progress_history):
+def display_weight_gain_goal(series):
     """
     Display weight gain goal tracking
     """
-    if not progress_history or len(progress_history) < 2:
+    if len(series) < 2:
         st.info("Need more data to track weight gain progress. Update your weight regularly.")
         return
     
@@ -388,8 +352,8 @@ def display_weight_gain_goal(progress_history):
     
     with col1:
         # Get starting weight
-        starting_weight = progress_history[0].get('weight', 0)
-        current_weight = progress_history[-1].get('weight', 0)
+        starting_weight = float(series.weights[0])
+        current_weight = float(series.weights[-1])
         
         weight_gained = current_weight - starting_weight
         
@@ -417,14 +381,9 @@ def display_weight_gain_goal(progress_history):
         st.markdown(f"**{progress_pct:.1f}% of goal achieved**")
     
     # Calculate estimated completion
-    if len(progress_history) > 2 and weight_gained > 0:
-        # Create a dataframe of progress history
-        df = pd.DataFrame(progress_history)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp')
-        
+    if len(series) > 2 and weight_gained > 0:
         # Calculate weekly rate of gain
-        weekly_change = calculate_weekly_change(df)
+        weekly_change = series.weekly_change()
         
         if weekly_change and weekly_change > 0:
             # Calculate remaining weight to gain
@@ -440,7 +399,7 @@ def display_weight_gain_goal(progress_history):
         else:
             st.warning("Your weight isn't currently increasing. Consider increasing your calorie intake to create a surplus.")
 
-def display_muscle_gain_goal(progress_history):
+def display_muscle_gain_goal(series):
     """
     Display muscle gain goal information
     """
@@ -462,26 +421,22 @@ def display_muscle_gain_goal(progress_history):
     """)
     
     # Show weight chart as supplementary data
-    if progress_history:
-        weight_fig = create_weight_progress_chart(progress_history)
+    if len(series) > 0:
+        weight_fig = create_weight_progress_chart(series)
         st.plotly_chart(weight_fig, use_container_width=True)
 
-def display_full_history(user_data):
+def display_full_history(series):
     """
     Display full progress history
     """
     st.subheader("Full Progress History")
     
-    progress_history = user_data.get('progress_history', [])
-    
-    if not progress_history:
+    if len(series) == 0:
         st.info("No progress history available yet.")
         return
     
-    # Convert to DataFrame for display
-    df = pd.DataFrame(progress_history)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values('timestamp', ascending=False)
+    # Convert to DataFrame for display, newest first
+    df = series.to_dataframe().iloc[::-1]
     
     # Format for display
     display_df = df.copy()
@@ -540,17 +495,19 @@ def display_demo_progress():
         'progress_history': progress_history
     }
     
+    series = get_progress_series(user_data)
+    
     # Display metrics
-    display_overview_metrics(user_data)
+    display_overview_metrics(user_data, series)
     
     # Display charts
-    display_progress_charts(user_data)
+    display_progress_charts(user_data, series)
     
     # Display goal tracking
-    display_goal_tracking(user_data)
+    display_goal_tracking(user_data, series)
     
     # Display full history
-    display_full_history(user_data)
+    display_full_history(series)
     
     # Add demo disclaimer
     st.info("This is a demo view with sample data. Create a profile to track your own progress!")
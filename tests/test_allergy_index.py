@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from utils.allergy_index import ExclusionCache, FoodTokenIndex, parse_allergies
+
+FOOD_NAMES = [
+    'cheddar cheese',
+    'whole milk',
+    'peanuts roasted',
+    'peanut butter',
+    'cashew butter',
+    'coconut milk',
+    'almond milk',
+    'soy milk',
+    'butter salted',
+    'greek yogurt',
+    'walnuts',
+    'butternut squash soup',
+    'water chestnut stir fry',
+    'shrimp cooked',
+    'crab',
+    'eggs scrambled',
+    'bread white',
+    'apple'
+]
+
+def excluded_names(allergies, names=FOOD_NAMES):
+    index = FoodTokenIndex(names)
+    mask = index.unpack(index.exclusion_bitmap(parse_allergies(allergies)))
+    return {name for name, excluded in zip(names, mask) if excluded}
+
+@pytest.mark.parametrize('field, expected', [
+    ('Peanuts, dairy', ('dairy', 'peanut')),
+    ('eggs; soy/ wheat\nberries', ('berry', 'egg', 'soy', 'wheat')),
+    ('Shellfish and Tree Nuts', ('shellfish', 'tree nut')),
+    ('allergic to tree nuts and shellfish', ('shellfish', 'tree nut')),
+    ('lactose intolerance', ('lactose',)),
+    (['Peanuts', 'Dairy'], ('dairy', 'peanut'))
+])
+def test_parse_allergies(field, expected):
+    assert parse_allergies(field) == expected
+
+@pytest.mark.parametrize('field', ['None', 'none', '', '  ', 'n/a', 'No', None, float('nan'), []])
+def test_parse_no_allergies(field):
+    assert parse_allergies(field) == ()
+
+def test_peanut_and_dairy_exclusions():
+    excluded = excluded_names('Peanuts, dairy')
+    assert {'cheddar cheese', 'whole milk', 'butter salted', 'greek yogurt',
+            'peanuts roasted', 'peanut butter'} <= excluded
+    assert not excluded & {'cashew butter', 'coconut milk', 'almond milk', 'soy milk', 'apple'}
+
+def test_group_expansion():
+    assert excluded_names('tree nuts') == {'cashew butter', 'almond milk', 'walnuts'}
+    assert excluded_names('shellfish') == {'shrimp cooked', 'crab'}
+    assert excluded_names('nuts') == {'peanuts roasted', 'peanut butter', 'cashew butter', 'almond milk', 'walnuts'}
+
+def test_foods_named_like_nuts_are_kept():
+    for allergies in ('tree nuts', 'nuts'):
+        assert not excluded_names(allergies) & {'butternut squash soup', 'water chestnut stir fry'}
+    assert excluded_names('eggs') == {'eggs scrambled'}
+
+def test_unknown_allergy_matches_its_name():
+    assert excluded_names('apples') == {'apple'}
+    assert excluded_names('kiwi') == set()
+
+def test_rare_and_common_tokens_agree():
+    # Among enough foods 'milk' is common enough for a bitmap, while
+    # 'cashew' is stored as a food id list
+    names = FOOD_NAMES + [f"filler food {i}" for i in range(64)]
+    index = FoodTokenIndex(names)
+    assert 'milk' in index.bitmaps and 'cashew' in index.food_ids
+    assert excluded_names('Peanuts, dairy', names) == excluded_names('Peanuts, dairy')
+    assert excluded_names('tree nuts', names) == {'cashew butter', 'almond milk', 'walnuts'}
+
+def test_exclusion_cache_is_bounded():
+    index = FoodTokenIndex(FOOD_NAMES)
+    cache = ExclusionCache(index, max_size=2)
+
+    dairy = cache.mask(('dairy',))
+    cache.mask(('peanut',))
+    cache.mask(('dairy',))
+    cache.mask(('egg',))
+
+    assert len(cache) == 2
+    # The least recently used set is dropped, the others are kept
+    assert set(cache._bitmaps) == {('dairy',), ('egg',)}
+    assert np.array_equal(dairy, index.unpack(index.exclusion_bitmap(('dairy',))))
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+from utils import datasets
+from utils.datasets import get_dataset, get_dataset_artifact, invalidate_dataset
+
+@pytest.fixture
+def nested_dataset(monkeypatch):
+    monkeypatch.setitem(datasets.DATASET_LOADERS, "test_nested", lambda: {
+        "records": {"u1": {"name": "Ann", "progress": [{"weight": 70.0}], "tags": {"a"}}}
+    })
+    yield get_dataset("test_nested")
+    invalidate_dataset("test_nested")
+
+def test_dict_dataset_is_read_only_all_the_way_down(nested_dataset):
+    user = nested_dataset["records"]["u1"]
+    with pytest.raises(TypeError):
+        nested_dataset["records"]["u2"] = {}
+    with pytest.raises(TypeError):
+        user["name"] = "Bob"
+    with pytest.raises(TypeError):
+        user["progress"][0]["weight"] = 80.0
+    with pytest.raises(AttributeError):
+        user["progress"].append({"weight": 80.0})
+    assert user["tags"] == frozenset({"a"})
+
+def test_dict_dataset_keeps_its_values(nested_dataset):
+    assert nested_dataset["records"]["u1"]["name"] == "Ann"
+    assert nested_dataset["records"]["u1"]["progress"][0]["weight"] == 70.0
+    assert get_dataset("test_nested") is nested_dataset
+
+def test_artifacts_are_cached_for_registry_views_only(monkeypatch):
+    monkeypatch.setitem(datasets.DATASET_LOADERS, "test_frame", lambda: pd.DataFrame({"value": [1, 2, 3, 4]}))
+    try:
+        view = get_dataset("test_frame")
+        builds = []
+
+        def build(data):
+            builds.append(len(data))
+            return list(data["value"])
+
+        assert get_dataset_artifact(view, "values", build) == [1, 2, 3, 4]
+        assert get_dataset_artifact(get_dataset("test_frame"), "values", build) == [1, 2, 3, 4]
+        assert builds == [4]
+
+        # Derived frames keep the version stamp in attrs, but not the rows
+        assert get_dataset_artifact(view.head(2), "values", build) == [1, 2]
+        assert get_dataset_artifact(view[view["value"] > 2], "values", build) == [3, 4]
+        assert get_dataset_artifact(view.reset_index(drop=True), "values", build) == [1, 2, 3, 4]
+        assert builds == [4, 2, 2, 4]
+    finally:
+        invalidate_dataset("test_frame")
@@ -0,0 +1,51 @@
+import pytest
+from utils.diet_classifier import classify_food_names
+
+def classify(name):
+    vegetarian, vegan = classify_food_names([name])
+    return bool(vegetarian[0]), bool(vegan[0])
+
+@pytest.mark.parametrize('name', [
+    'Duck Sauce',
+    'Hot Dog Bun',
+    'hot dog buns',
+    'hotdog roll',
+    'Hamburger Bun',
+    'Chicken of the woods mushroom',
+    'lambs quarters cooked',
+    'red kidney beans canned',
+    'artichoke hearts',
+    'peanut butter',
+    'coconut milk',
+    'hearts of palm',
+    'meatless chicken nuggets'
+])
+def test_plant_foods_named_after_animal_foods_are_vegetarian(name):
+    assert classify(name)[0]
+
+@pytest.mark.parametrize('name', [
+    'chicken mushroom soup',
+    'hotdog with chili',
+    'hot dog',
+    'duck liver raw',
+    'beef heart cooked',
+    'chicken wing roasted',
+    'fish sauce',
+    'oyster sauce',
+    'bean with frankfurters soup'
+])
+def test_meat_is_not_vegetarian(name):
+    assert classify(name) == (False, False)
+
+@pytest.mark.parametrize('name, expected', [
+    ('quail eggs', (True, False)),
+    ('cheddar cheese', (True, False)),
+    ('soy milk', (True, True)),
+    ('apple', (True, True))
+])
+def test_animal_products_are_vegetarian_not_vegan(name, expected):
+    assert classify(name) == expected
+
+def test_missing_names_count_as_plant_foods():
+    vegetarian, vegan = classify_food_names([None, float('nan')])
+    assert vegetarian.all() and vegan.all()
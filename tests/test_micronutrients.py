@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from utils.datasets import get_dataset
+from utils.micronutrients import (MAX_SERVING_SHARE, get_micronutrient_table, plan_micronutrients,
+                                  recommend_gap_foods)
+from utils.recommendations import generate_meal_plan
+
+# Most reference intakes a whole day of ordinary food plausibly covers
+PLAUSIBLE_DAILY_SHARE = 10.0
+
+def profile(diet, goal):
+    return {
+        'age': 30,
+        'gender': 'Male',
+        'weight': 70,
+        'height': 175,
+        'activity_level': 'Moderately Active',
+        'goal': goal,
+        'diet': diet,
+        'allergies': ''
+    }
+
+@pytest.fixture(scope='module')
+def food_data():
+    return get_dataset('food_data')
+
+@pytest.mark.parametrize('diet, goal', [
+    ('vegan', 'muscle gain'),
+    ('both', 'weight loss'),
+    ('vegetarian', 'maintenance')
+])
+def test_plan_coverage_is_plausible(food_data, diet, goal):
+    plan = generate_meal_plan(profile(diet, goal), food_data, seed=3)
+    report = plan_micronutrients(plan, food_data)
+
+    coverage = dict(zip(report["columns"], report["coverage"]))
+    implausible = {name: share for name, share in coverage.items() if share > PLAUSIBLE_DAILY_SHARE}
+    assert not implausible
+    assert np.median(report["coverage"]) > 0.25
+
+def test_flagged_foods_are_left_out(food_data):
+    table = get_micronutrient_table(food_data)
+    assert table.flagged.any()
+    assert not table.shares[table.flagged].any()
+    assert table.shares.max() <= MAX_SERVING_SHARE
+
+    # The banana row lists its minerals about 1000 times too high
+    banana = table.matrix.row_for('banana')
+    assert table.flagged[banana]
+
+def test_gap_foods_are_not_flagged(food_data):
+    plan = generate_meal_plan(profile('vegan', 'muscle gain'), food_data, seed=3)
+    table = get_micronutrient_table(food_data)
+
+    for food in recommend_gap_foods(plan, food_data, k=20):
+        assert not table.flagged[table.matrix.row_for(food['name'])]
@@ -0,0 +1,20 @@
+import numpy as np
+from utils.progress import build_progress_series
+
+def series(weights):
+    return build_progress_series([
+        {'timestamp': f'2024-01-{day:02d} 08:00:00', 'weight': weight}
+        for day, weight in enumerate(weights, start=1)
+    ])
+
+def test_moving_average_skips_missing_weights():
+    averages = series([80.0, None, 82.0, 84.0]).moving_average(2)
+    np.testing.assert_allclose(averages, [80.0, 80.0, 82.0, 83.0])
+
+def test_moving_average_of_window_without_weights_is_nan():
+    averages = series([None, None, 70.0]).moving_average(2)
+    assert np.isnan(averages[:2]).all()
+    assert averages[2] == 70.0
+
+def test_moving_average_of_no_entries():
+    assert len(series([]).moving_average()) == 0
@@ -0,0 +1,55 @@
+import pytest
+from utils.user_store import JsonUserStore, SqliteUserStore
+
+USER = {
+    'name': 'Ann',
+    'weight': 70.0,
+    'height': 170.0,
+    'progress_history': [
+        {'timestamp': '2024-01-01 08:00:00', 'weight': 71.0, 'bmi': 24.57},
+        {'timestamp': '2024-01-08 08:00:00', 'weight': 70.0, 'bmi': 24.22}
+    ]
+}
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'json':
+        return JsonUserStore(str(tmp_path / 'records.json'))
+    return SqliteUserStore(str(tmp_path / 'users.db'))
+
+def test_update_changes_profile_fields(store):
+    user_id = store.add_user(dict(USER))
+
+    def update(user_data):
+        user_data['weight'] = 68.0
+
+    assert store.update_user(user_id, update)
+    user = store.get_user(user_id)
+    assert user['weight'] == 68.0
+    assert [entry['weight'] for entry in user['progress_history']] == [71.0, 70.0]
+
+def test_update_sees_and_replaces_progress_history(store):
+    user_id = store.add_user(dict(USER))
+    seen = []
+
+    def update(user_data):
+        seen.append(len(user_data['progress_history']))
+        user_data['progress_history'] = user_data['progress_history'][1:]
+
+    assert store.update_user(user_id, update)
+    assert seen == [2]
+    history = store.get_user(user_id)['progress_history']
+    assert [(entry['timestamp'], entry['weight']) for entry in history] == [('2024-01-08 08:00:00', 70.0)]
+
+def test_update_edits_progress_entries_in_place(store):
+    user_id = store.add_user(dict(USER))
+
+    def update(user_data):
+        user_data['progress_history'][0]['weight'] = 72.5
+
+    assert store.update_user(user_id, update)
+    assert [entry['weight'] for entry in store.get_user(user_id)['progress_history']] == [72.5, 70.0]
+
+def test_update_of_unknown_user_fails(store):
+    with pytest.raises(KeyError):
+        store.update_user('999', lambda user_data: None)
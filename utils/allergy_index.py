@@ -0,0 +1,295 @@
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.datasets import get_dataset_artifact
+from utils.diet_classifier import (DAIRY_TERMS, EGG_TERMS, FISH_TERMS, SHELLFISH_TERMS, PLANT_PHRASES,
+                                   word_forms)
+
+TREE_NUT_TERMS = [
+    'nut', 'almond', 'walnut', 'cashew', 'pecan', 'hazelnut', 'filbert', 'pistachio', 'macadamia',
+    'brazil nut', 'pine nut', 'chestnut', 'hickory', 'praline', 'marzipan', 'nutella'
+]
+
+GLUTEN_TERMS = [
+    'wheat', 'gluten', 'flour', 'bread', 'breadcrumb', 'pasta', 'spaghetti', 'macaroni', 'noodle',
+    'barley', 'rye', 'spelt', 'kamut', 'triticale', 'bulgur', 'couscous', 'semolina', 'seitan', 'malt',
+    'cracker', 'biscuit', 'bagel', 'croissant', 'muffin', 'pancake', 'waffle', 'pretzel', 'pizza',
+    'cake', 'cookie', 'pie', 'pastry', 'tortilla', 'pita', 'croutons', 'cereal', 'bran', 'weetabix'
+]
+
+SOY_TERMS = ['soy', 'soya', 'soybean', 'soymilk', 'tofu', 'tempeh', 'miso', 'edamame', 'natto']
+
+# Allergy names and the food name terms they exclude. Any other allergy
+# excludes foods naming it. Terms of several words must all be in a name
+ALLERGEN_GROUPS = {
+    'dairy': DAIRY_TERMS,
+    'milk': DAIRY_TERMS,
+    'lactose': DAIRY_TERMS,
+    'egg': EGG_TERMS,
+    'fish': FISH_TERMS,
+    'shellfish': SHELLFISH_TERMS,
+    'seafood': FISH_TERMS + SHELLFISH_TERMS,
+    'peanut': ['peanut', 'groundnut'],
+    'tree nut': TREE_NUT_TERMS,
+    'nut': TREE_NUT_TERMS + ['peanut'],
+    'gluten': GLUTEN_TERMS,
+    'wheat': GLUTEN_TERMS,
+    'celiac': GLUTEN_TERMS,
+    'soy': SOY_TERMS,
+    'sesame': ['sesame', 'tahini', 'halva', 'hummus']
+}
+
+# Foods that are not nuts despite their names
+NOT_NUT_PHRASES = ['butternut squash', 'water chestnut']
+
+# Plant foods that name an allergen of a group without containing it,
+# e.g. peanut butter for a dairy allergy
+ALLERGEN_EXCEPTIONS = {
+    'dairy': PLANT_PHRASES,
+    'milk': PLANT_PHRASES,
+    'lactose': PLANT_PHRASES,
+    'tree nut': NOT_NUT_PHRASES,
+    'nut': NOT_NUT_PHRASES
+}
+
+# Allergy field values meaning no allergies
+NO_ALLERGY_VALUES = {'', 'none', 'no', 'nil', 'n/a', 'na', 'nothing', '-'}
+
+# Words describing an allergy rather than naming it
+IGNORED_ALLERGY_WORDS = {'allergy', 'allergies', 'allergic', 'intolerance', 'intolerant', 'to', 'severe', 'mild'}
+
+# Tokens found in more than one in this many foods are stored as bitmaps,
+# rarer tokens as food id lists, whichever is smaller
+BITMAP_TOKEN_SHARE = 32
+
+# Allergy sets whose exclusion bitmaps are kept per food dataset version;
+# beyond this the least recently used set is dropped
+MAX_CACHED_ALLERGY_SETS = 256
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_SEPARATOR_PATTERN = re.compile(r"[,;/\n]|\band\b")
+
+def singular(word):
+    """
+    Singular of an English plural, e.g. 'berries' -> 'berry', other words unchanged
+    """
+    if len(word) > 3 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if len(word) > 2 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+def parse_allergies(allergies):
+    """
+    Normalize a profile's allergies field
+
+    Parameters:
+    - allergies: Comma-separated string as stored by the Profile page, or a
+      list of allergy names
+
+    Returns:
+    - Sorted tuple of singular allergy names, e.g. ('peanut', 'tree nut')
+      for "Peanuts, tree nuts"; empty for no allergies
+    """
+    if allergies is None or (isinstance(allergies, float) and np.isnan(allergies)):
+        return ()
+    if isinstance(allergies, str):
+        # Checked whole first, "n/a" would otherwise split into "n" and "a"
+        if allergies.strip().lower() in NO_ALLERGY_VALUES:
+            return ()
+        parts = _SEPARATOR_PATTERN.split(allergies.lower())
+    else:
+        parts = [str(part).lower() for part in allergies]
+
+    names = set()
+    for part in parts:
+        words = _TOKEN_PATTERN.findall(part)
+        words = [word for word in words if word not in IGNORED_ALLERGY_WORDS]
+        if not words:
+            continue
+        if ' '.join(words) in NO_ALLERGY_VALUES:
+            continue
+        words[-1] = singular(words[-1])
+        names.add(' '.join(words))
+
+    return tuple(sorted(names))
+
+class FoodTokenIndex:
+    """
+    Inverted index from the words of food names to the foods naming them
+
+    Food ids are positions in the list of names the index was built from.
+    Each word maps to a packed bitmap of food ids when it is common, or to
+    a sorted array of food ids when that is smaller. Exclusions are worked
+    out with bitwise set operations on the bitmaps, not by scanning names.
+    """
+    def __init__(self, names):
+        self.size = len(names)
+        self.bitmap_bytes = (self.size + 7) // 8
+
+        postings = {}
+        for food_id, name in enumerate(names):
+            if not isinstance(name, str):
+                continue
+            for token in set(_TOKEN_PATTERN.findall(name.lower())):
+                postings.setdefault(token, []).append(food_id)
+
+        self.bitmaps = {}
+        self.food_ids = {}
+        for token, ids in postings.items():
+            ids = np.array(ids, dtype=np.int32)
+            if len(ids) * BITMAP_TOKEN_SHARE > self.size:
+                self.bitmaps[token] = self._pack(ids)
+            else:
+                self.food_ids[token] = ids
+
+    def __len__(self):
+        return self.size
+
+    def _pack(self, ids):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[ids] = True
+        return np.packbits(mask)
+
+    def empty(self):
+        """
+        Bitmap of no foods
+        """
+        return np.zeros(self.bitmap_bytes, dtype=np.uint8)
+
+    def token_bitmap(self, token):
+        """
+        Bitmap of the foods naming a word
+        """
+        if token in self.bitmaps:
+            return self.bitmaps[token]
+        if token in self.food_ids:
+            return self._pack(self.food_ids[token])
+        return self.empty()
+
+    def term_bitmap(self, term):
+        """
+        Bitmap of the foods naming every word of a term, in singular or plural
+        """
+        result = None
+        for forms in zip(*word_forms(term)):
+            # The plurals of each word differ only in the last word
+            word_bitmap = self.empty()
+            for form in set(forms):
+                np.bitwise_or(word_bitmap, self.token_bitmap(form), out=word_bitmap)
+            result = word_bitmap if result is None else result & word_bitmap
+        return result if result is not None else self.empty()
+
+    def allergen_bitmap(self, allergy):
+        """
+        Bitmap of the foods to avoid for one allergy name from parse_allergies
+        """
+        bitmap = self.empty()
+        for term in ALLERGEN_GROUPS.get(allergy, [allergy]):
+            np.bitwise_or(bitmap, self.term_bitmap(term), out=bitmap)
+
+        for phrase in ALLERGEN_EXCEPTIONS.get(allergy, []):
+            exception = self.term_bitmap(phrase)
+            if exception.any():
+                bitmap &= ~exception
+        return bitmap
+
+    def exclusion_bitmap(self, allergies):
+        """
+        Bitmap of the foods to avoid for a tuple of allergy names
+        """
+        bitmap = self.empty()
+        for allergy in allergies:
+            np.bitwise_or(bitmap, self.allergen_bitmap(allergy), out=bitmap)
+        return bitmap
+
+    def unpack(self, bitmap):
+        """
+        Boolean mask over food ids of a bitmap
+        """
+        return np.unpackbits(bitmap, count=self.size).astype(bool)
+
+class ExclusionCache:
+    """
+    Exclusion bitmaps of the allergy sets used most recently
+
+    Allergies are free text, so there is no end to the allergy sets
+    profiles can ask for. Only a bitmap of one bit per food is kept for
+    each, at most max_size of them, and the least recently used set is
+    worked out again when it comes back.
+    """
+    def __init__(self, index, max_size=MAX_CACHED_ALLERGY_SETS):
+        self.index = index
+        self.max_size = max_size
+        self._bitmaps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bitmaps)
+
+    def bitmap(self, allergies):
+        """
+        Bitmap of the foods to avoid for a tuple of allergy names
+        """
+        with self._lock:
+            if allergies in self._bitmaps:
+                self._bitmaps.move_to_end(allergies)
+                return self._bitmaps[allergies]
+
+        bitmap = self.index.exclusion_bitmap(allergies)
+
+        with self._lock:
+            self._bitmaps[allergies] = bitmap
+            self._bitmaps.move_to_end(allergies)
+            while len(self._bitmaps) > self.max_size:
+                self._bitmaps.popitem(last=False)
+        return bitmap
+
+    def mask(self, allergies):
+        """
+        Boolean mask over food ids of the foods to avoid for a tuple of allergy names
+        """
+        return self.index.unpack(self.bitmap(allergies))
+
+def get_food_token_index(food_data):
+    """
+    Get the token index of a food table's names, built once per food dataset version
+    """
+    def build(data):
+        names = data['Food Name'].tolist() if 'Food Name' in data.columns else [None] * len(data)
+        return FoodTokenIndex(names)
+
+    return get_dataset_artifact(food_data, 'food_token_index', build)
+
+def get_exclusion_cache(food_data):
+    """
+    Get the exclusion bitmap cache of a food table, one per food dataset version
+    """
+    return get_dataset_artifact(food_data, 'allergy_exclusions',
+                                lambda data: ExclusionCache(get_food_token_index(data)))
+
+def get_exclusion_mask(food_data, allergies):
+    """
+    Foods a profile's allergies rule out
+
+    The mask's bitmap is kept per set of allergies and food dataset version
+    in an ExclusionCache, so it is shared by every profile with the same
+    allergies. Diet-level pools, rankings and similarity indexes are
+    cached without allergies and cut down with this mask when used.
+
+    Parameters:
+    - food_data: DataFrame with food nutrition data
+    - allergies: Allergies field of a profile, or a tuple from parse_allergies
+
+    Returns:
+    - Boolean array, True for rows of food_data to leave out
+    """
+    if not isinstance(allergies, tuple):
+        allergies = parse_allergies(allergies)
+    if not allergies:
+        return np.zeros(len(food_data), dtype=bool)
+
+    return get_exclusion_cache(food_data).mask(allergies)
@@ -0,0 +1,416 @@
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from utils.data_processing import calculate_bmi_batch
+from utils.datasets import invalidate_dataset
+from utils.progress import normalize_progress_entry
+from utils.user_store import get_user_store
+
+IMPORT_BATCH_SIZE = 1000
+
+# Columns of the profile and progress CSV exports, in order
+PROFILE_COLUMNS = ['user_id', 'name', 'gender', 'age', 'height', 'weight', 'bmi', 'health_status',
+                   'goal', 'diet', 'activity_level', 'health_conditions', 'allergies',
+                   'preferred_cuisines']
+PROGRESS_COLUMNS = ['user_id', 'timestamp', 'weight', 'bmi']
+
+# Input columns interpreted by the import, any other column is copied into
+# the profile as given
+IMPORT_COLUMNS = {'_line', 'user_id', 'name', 'first_name', 'last_name', 'gender', 'height',
+                  'weight', 'bmi', 'health_status', 'age', 'goal', 'diet', 'health_conditions',
+                  'progress_history'}
+
+# Accepted values, matching the limits of the Profile page form
+HEIGHT_RANGE = (50.0, 250.0)
+WEIGHT_RANGE = (20.0, 250.0)
+AGE_RANGE = (10, 100)
+
+PROGRESS_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def import_users(profiles_path, progress_path=None, store=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import user profiles, and optionally their progress entries, into the user store
+
+    Both files are read in batches of batch_size rows and every batch is
+    written to the store in one go, so the records file is rewritten once
+    per batch instead of once per user. Rows that fail validation are
+    skipped and reported.
+
+    Profiles need name (or first_name and last_name), gender, height and
+    weight; diet, goal, health_conditions and age are optional and any other
+    column (activity_level, allergies, ...) is copied as given. BMI and
+    health status are computed the same way as for profiles created in the
+    app. JSON Lines profiles may carry their own progress_history list,
+    otherwise a profile starts with one entry for its current weight unless
+    a progress file is given.
+
+    Progress rows need user_id, timestamp and weight, with an optional bmi.
+    user_id refers to the user_id column of the profiles file, so the
+    profiles file must have one when progress is imported. Progress entries
+    do not change the imported profile's current weight.
+
+    Parameters:
+    - profiles_path: CSV or JSON Lines (.jsonl) file of profiles
+    - progress_path: Optional CSV or JSON Lines file of progress entries
+    - store: User store to import into, defaults to the configured store
+    - batch_size: Rows per batch
+
+    Returns:
+    - Dict with the number of imported users and progress entries and a list
+      of (file, line, message) errors
+    """
+    store = store or get_user_store()
+    summary = {"users": 0, "progress_entries": 0, "errors": []}
+
+    # Source user ID -> (store user ID, height) for the progress pass
+    imported = {}
+
+    for chunk in read_rows(profiles_path, batch_size, summary["errors"]):
+        records, source_ids, errors = prepare_profiles(chunk, initial_entry=not progress_path)
+        summary["errors"].extend((profiles_path, line, message) for line, message in errors)
+        if not records:
+            continue
+
+        new_ids = store.add_users(records)
+        if new_ids is None:
+            summary["errors"].append((profiles_path, int(chunk['_line'].iloc[0]), "Failed to write batch"))
+            continue
+
+        summary["users"] += len(new_ids)
+        summary["progress_entries"] += sum(len(record['progress_history']) for record in records)
+        for source_id, new_id, record in zip(source_ids, new_ids, records):
+            if source_id is not None:
+                imported[source_id] = (new_id, record['height'])
+
+    if progress_path:
+        for chunk in read_rows(progress_path, batch_size, summary["errors"]):
+            items, errors = prepare_progress(chunk, imported)
+            summary["errors"].extend((progress_path, line, message) for line, message in errors)
+            if items:
+                summary["progress_entries"] += store.append_progress_batch(items)
+
+    # Sessions share one copy of the user records, reload it on next access
+    invalidate_dataset("user_records")
+
+    return summary
+
+def export_users(profiles_path, progress_path=None, store=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Export every user in the store, writing users as they are read
+
+    A JSON Lines profile export holds complete records, including the
+    progress history unless progress_path is given. A CSV profile export
+    holds the PROFILE_COLUMNS fields, use JSON Lines for a lossless copy.
+
+    Parameters:
+    - profiles_path: CSV or JSON Lines (.jsonl) file to write profiles to
+    - progress_path: Optional CSV or JSON Lines file to write progress entries to
+    - store: User store to export, defaults to the configured store
+    - batch_size: Users read from the store per query
+
+    Returns:
+    - Tuple: (number of users, number of progress entries) written
+    """
+    store = store or get_user_store()
+    user_count = 0
+    entry_count = 0
+
+    with RowWriter(profiles_path, PROFILE_COLUMNS) as profile_writer, \
+            RowWriter(progress_path, PROGRESS_COLUMNS) as progress_writer:
+        for user_id, user_data in store.iter_users(batch_size):
+            progress_history = user_data.get('progress_history', [])
+
+            row = {"user_id": user_id, **user_data}
+            if progress_writer.enabled:
+                row.pop('progress_history', None)
+                for entry in progress_history:
+                    progress_writer.write({"user_id": user_id, **entry})
+            if progress_writer.enabled or profile_writer.is_jsonl:
+                entry_count += len(progress_history)
+
+            profile_writer.write(row)
+            user_count += 1
+
+    return user_count, entry_count
+
+def read_rows(path, batch_size, errors):
+    """
+    Read a CSV or JSON Lines file as DataFrames of up to batch_size rows
+
+    Every value is kept as read (strings for CSV). A '_line' column holds
+    the line number of each row. Unreadable JSON lines are added to errors.
+    """
+    if _is_jsonl(path):
+        rows = []
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    errors.append((path, line_number, f"Invalid JSON: {e.msg}"))
+                    continue
+                if not isinstance(row, dict):
+                    errors.append((path, line_number, "Expected a JSON object"))
+                    continue
+
+                row['_line'] = line_number
+                rows.append(row)
+                if len(rows) >= batch_size:
+                    yield pd.DataFrame(rows)
+                    rows = []
+        if rows:
+            yield pd.DataFrame(rows)
+    else:
+        for chunk in pd.read_csv(path, chunksize=batch_size, dtype=str, keep_default_na=False):
+            # Line 1 is the header
+            chunk['_line'] = chunk.index + 2
+            yield chunk
+
+def prepare_profiles(chunk, initial_entry=True):
+    """
+    Validate a batch of profile rows and build user records from them
+
+    Parameters:
+    - chunk: DataFrame of profile rows
+    - initial_entry: Start profiles without a progress_history with an
+      entry for their current weight
+
+    Returns:
+    - Tuple: (list of records, list of source user IDs or None, list of
+      (line, message) errors)
+    """
+    lines = chunk['_line'].to_numpy()
+    problems = np.full(len(chunk), None, dtype=object)
+
+    names = _names(chunk)
+    gender = _text_column(chunk, 'gender')
+    height = _numeric_column(chunk, 'height')
+    weight = _numeric_column(chunk, 'weight')
+    age = _numeric_column(chunk, 'age')
+    has_age = _text_column(chunk, 'age') != ''
+
+    # Later checks win, so order them from least to most fundamental
+    problems[has_age & ~((age >= AGE_RANGE[0]) & (age <= AGE_RANGE[1]))] = \
+        f"age must be between {AGE_RANGE[0]} and {AGE_RANGE[1]}"
+    problems[~((weight >= WEIGHT_RANGE[0]) & (weight <= WEIGHT_RANGE[1]))] = \
+        f"weight must be a number between {WEIGHT_RANGE[0]} and {WEIGHT_RANGE[1]} kg"
+    problems[~((height >= HEIGHT_RANGE[0]) & (height <= HEIGHT_RANGE[1]))] = \
+        f"height must be a number between {HEIGHT_RANGE[0]} and {HEIGHT_RANGE[1]} cm"
+    problems[gender == ''] = "gender is required"
+    problems[names == ''] = "name is required"
+
+    valid = np.array([problem is None for problem in problems], dtype=bool)
+    errors = [(int(line), problem) for line, problem in zip(lines[~valid], problems[~valid])]
+
+    # One vectorized pass for every valid row
+    bmis, statuses = calculate_bmi_batch(weight[valid], height[valid])
+
+    diet = _text_column(chunk, 'diet', 'Both')
+    goal = _text_column(chunk, 'goal', 'Not specified')
+    health_conditions = _text_column(chunk, 'health_conditions', 'None')
+    source_ids = _text_column(chunk, 'user_id')
+    extra_columns = [column for column in chunk.columns if column not in IMPORT_COLUMNS]
+    histories = chunk['progress_history'] if 'progress_history' in chunk.columns else None
+    timestamp = datetime.now().strftime(PROGRESS_TIMESTAMP_FORMAT)
+
+    records = []
+    record_source_ids = []
+    for j, i in enumerate(np.flatnonzero(valid)):
+        record = {
+            "name": names[i],
+            "gender": gender[i].lower(),
+            "height": float(height[i]),
+            "weight": float(weight[i]),
+            "bmi": float(bmis[j]),
+            "goal": goal[i],
+            "diet": diet[i],
+            "health_conditions": health_conditions[i],
+            "health_status": str(statuses[j])
+        }
+
+        if has_age[i]:
+            record["age"] = int(age[i])
+        for column in extra_columns:
+            value = chunk[column].iloc[i]
+            if isinstance(value, (list, dict)) or _present(value):
+                record[column] = value
+
+        history = histories.iloc[i] if histories is not None else None
+        if isinstance(history, list):
+            record["progress_history"] = [normalize_progress_entry(entry) for entry in history]
+        elif initial_entry:
+            record["progress_history"] = [{
+                "timestamp": timestamp,
+                "weight": record["weight"],
+                "bmi": record["bmi"]
+            }]
+        else:
+            record["progress_history"] = []
+
+        records.append(record)
+        record_source_ids.append(source_ids[i] or None)
+
+    return records, record_source_ids, errors
+
+def prepare_progress(chunk, imported):
+    """
+    Validate a batch of progress rows against the imported users
+
+    Parameters:
+    - chunk: DataFrame of progress rows
+    - imported: Dict of source user ID -> (store user ID, height)
+
+    Returns:
+    - Tuple: (list of (user_id, entry, updates) items, list of (line, message) errors)
+    """
+    lines = chunk['_line'].to_numpy()
+    problems = np.full(len(chunk), None, dtype=object)
+
+    source_ids = _text_column(chunk, 'user_id')
+    weight = _numeric_column(chunk, 'weight')
+    bmi = _numeric_column(chunk, 'bmi')
+    timestamps = pd.to_datetime(pd.Series(_text_column(chunk, 'timestamp')), errors='coerce', format='mixed')
+
+    known = np.array([source_id in imported for source_id in source_ids], dtype=bool)
+    heights = np.array([imported[source_id][1] if ok else np.nan
+                        for source_id, ok in zip(source_ids, known)])
+
+    problems[~((weight >= WEIGHT_RANGE[0]) & (weight <= WEIGHT_RANGE[1]))] = \
+        f"weight must be a number between {WEIGHT_RANGE[0]} and {WEIGHT_RANGE[1]} kg"
+    problems[timestamps.isna().to_numpy()] = "timestamp is missing or unreadable"
+    problems[~known] = "user_id does not match an imported profile"
+
+    valid = np.array([problem is None for problem in problems], dtype=bool)
+    errors = [(int(line), problem) for line, problem in zip(lines[~valid], problems[~valid])]
+
+    # Fill in missing BMIs from the user's height in one pass
+    computed_bmi, _ = calculate_bmi_batch(weight, heights)
+    bmi = np.where(np.isnan(bmi), computed_bmi, bmi)
+    timestamp_text = timestamps.dt.strftime(PROGRESS_TIMESTAMP_FORMAT).to_numpy()
+
+    items = []
+    for i in np.flatnonzero(valid):
+        entry = {
+            "timestamp": timestamp_text[i],
+            "weight": float(weight[i]),
+            "bmi": round(float(bmi[i]), 2)
+        }
+        items.append((imported[source_ids[i]][0], entry, {}))
+
+    return items, errors
+
+class RowWriter:
+    """
+    Streams dict rows to a CSV or JSON Lines file
+
+    With no path every write is ignored, so optional outputs need no
+    special casing.
+    """
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.enabled = path is not None
+        self.is_jsonl = self.enabled and _is_jsonl(path)
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'w', newline='')
+            if not self.is_jsonl:
+                self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+                self._writer.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._file is not None:
+            self._file.close()
+
+    def write(self, row):
+        if not self.enabled:
+            return
+        if self.is_jsonl:
+            self._file.write(json.dumps(row) + "\n")
+        else:
+            self._writer.writerow(row)
+
+def _is_jsonl(path):
+    return os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson')
+
+def _present(value):
+    """
+    True for values that were actually given (not empty, None or NaN)
+    """
+    if value is None:
+        return False
+    if isinstance(value, float) and np.isnan(value):
+        return False
+    return str(value).strip() != ''
+
+def _text_column(chunk, column, default=''):
+    """
+    Column as an array of stripped strings, default where missing or empty
+    """
+    if column not in chunk.columns:
+        return np.full(len(chunk), default, dtype=object)
+    values = [str(value).strip() if _present(value) else default for value in chunk[column]]
+    return np.array(values, dtype=object)
+
+def _numeric_column(chunk, column):
+    """
+    Column as a float array, NaN where missing or not a number
+    """
+    if column not in chunk.columns:
+        return np.full(len(chunk), np.nan)
+    return pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=np.float64)
+
+def _names(chunk):
+    """
+    Lowercase full names, from 'name' or from 'first_name' and 'last_name'
+    """
+    if 'name' in chunk.columns:
+        return np.array([name.lower() for name in _text_column(chunk, 'name')], dtype=object)
+
+    first = _text_column(chunk, 'first_name')
+    last = _text_column(chunk, 'last_name')
+    return np.array([f"{f.lower()} {l.lower()}" if f and l else ''
+                     for f, l in zip(first, last)], dtype=object)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk user import and export")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import profiles (and progress) from CSV or JSON Lines")
+    import_parser.add_argument("profiles", help="Profiles file (.csv or .jsonl)")
+    import_parser.add_argument("--progress", help="Progress entries file (.csv or .jsonl)")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per batch")
+
+    export_parser = subparsers.add_parser("export", help="Export profiles (and progress) to CSV or JSON Lines")
+    export_parser.add_argument("profiles", help="Profiles file (.csv or .jsonl)")
+    export_parser.add_argument("--progress", help="Progress entries file (.csv or .jsonl)")
+    export_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Users per query")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        summary = import_users(args.profiles, args.progress, batch_size=args.batch_size)
+        print(f"Imported {summary['users']} users and {summary['progress_entries']} progress entries")
+        if summary["errors"]:
+            print(f"Skipped {len(summary['errors'])} invalid rows:")
+            for path, line, message in summary["errors"][:20]:
+                print(f"  {path}:{line}: {message}")
+            if len(summary["errors"]) > 20:
+                print(f"  ... and {len(summary['errors']) - 20} more")
+    elif args.command == "export":
+        user_count, entry_count = export_users(args.profiles, args.progress, batch_size=args.batch_size)
+        print(f"Exported {user_count} users and {entry_count} progress entries")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,16 @@ import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from utils.allergy_index import parse_allergies, get_exclusion_mask
+from utils.data_processing import filter_foods_by_preference
+from utils.exercise_index import get_muscle_index
+from utils.scoring import get_scorer, get_goal_scorer, get_food_ranking
+
+# Best foods for a goal that food recommendations are drawn from
+GOAL_FOOD_CHOICES = 25
+
+# Muscles named as worked under exercise recommendations
+MUSCLES_WORKED_SHOWN = 3
 
 class NutritionChatbot:
     def __init__(self, food_data, exercise_data, user_data=None):
@@ -89,19 +99,15 @@ class NutritionChatbot:
             if exercise_name and exercise_name in message:
                 return exercise
         
-        # Check if message mentions a specific muscle group
-        muscle_groups = [
-            'neck', 'shoulder', 'upper arms', 'forearm', 'back', 'chest', 
-            'hips', 'thighs', 'calves', 'waist', 'abs', 'core', 'glutes',
-            'quadriceps', 'hamstrings', 'biceps', 'triceps'
-        ]
-        
-        for muscle in muscle_groups:
-            if muscle in message:
-                # Return a random exercise for this muscle group
-                matching_exercises = self.exercise_data[self.exercise_data['Main Muscle'].str.lower().str.contains(muscle, na=False)]
-                if not matching_exercises.empty:
-                    return matching_exercises.sample(1).iloc[0]
+        # Check if message mentions a specific muscle or muscle group,
+        # preferring exercises that target it over those it assists in
+        muscle_index = get_muscle_index(self.exercise_data)
+        exercise_ids = muscle_index.exercises_for(message, targets_only=True)
+        if len(exercise_ids) == 0:
+            exercise_ids = muscle_index.exercises_for(message)
+        if len(exercise_ids):
+            # Return a random exercise for this muscle
+            return self.exercise_data.iloc[random.choice(exercise_ids.tolist())]
         
         return None
     
@@ -280,28 +286,20 @@ class NutritionChatbot:
         """
         user_goal = self.user_data.get('goal', '').lower() if self.user_data else ''
         diet_pref = self.user_data.get('diet', '').lower() if self.user_data else ''
+        allergies = parse_allergies(self.user_data.get('allergies')) if self.user_data else ()
         
         # Default recommendations
         if not isinstance(self.food_data, pd.DataFrame) or self.food_data.empty:
             return "I'd recommend incorporating a variety of whole foods including lean proteins, fruits, vegetables, whole grains, and healthy fats. This ensures you get a wide range of nutrients to support your health goals."
         
-        # Filter by dietary preference if specified
-        if diet_pref in ['vegetarian', 'vegan']:
-            filtered_foods = self.food_data[~self.food_data['Food Name'].str.lower().str.contains('meat|chicken|beef|pork|fish|seafood', na=False)]
-            if diet_pref == 'vegan':
-                filtered_foods = filtered_foods[~filtered_foods['Food Name'].str.lower().str.contains('milk|cheese|egg|yogurt|butter', na=False)]
-        else:
-            filtered_foods = self.food_data
-        
-        # Get a few random, healthy food options
-        healthy_foods = filtered_foods[
-            (filtered_foods['Calories'] > 0) & 
-            (filtered_foods['Calories'] < 500) &
-            (filtered_foods['Protein'] > 3)
-        ]
+        # Draw a few of the best foods for the goal, scored like the Meal Planner's recommendations
+        ranking = get_food_ranking(self.food_data, get_goal_scorer(user_goal), diet_pref or 'both', allergies)
+        best_foods, scores = ranking.top_foods(self.food_data, GOAL_FOOD_CHOICES)
+        healthy_foods = best_foods[scores > 0]
         
         if healthy_foods.empty:
-            healthy_foods = filtered_foods
+            allowed_foods = self.food_data[~get_exclusion_mask(self.food_data, allergies)]
+            healthy_foods = filter_foods_by_preference(allowed_foods, diet_pref or 'both')
         
         # Select 3-5 foods
         sample_size = min(5, len(healthy_foods))
@@ -330,11 +328,9 @@ class NutritionChatbot:
         if not isinstance(self.food_data, pd.DataFrame) or self.food_data.empty:
             return "Low-calorie foods include leafy greens, berries, broccoli, cauliflower, cucumber, lean proteins like chicken breast and white fish, and eggs. These foods provide nutrients while keeping calories low."
         
-        # Find low calorie foods
-        low_cal_foods = self.food_data[
-            (self.food_data['Calories'] > 0) & 
-            (self.food_data['Calories'] < 100)
-        ].sort_values('Calories')
+        # Find low calorie foods, lowest first
+        ranking = get_food_ranking(self.food_data, get_scorer('low calorie'), 'both', parse_allergies(self.user_data.get('allergies')))
+        low_cal_foods, _ = ranking.top_foods(self.food_data, 5)
         
         if low_cal_foods.empty:
             return "I couldn't find specific low-calorie foods in my database, but generally, vegetables, lean proteins, and fruits are good low-calorie options."
@@ -359,11 +355,9 @@ class NutritionChatbot:
         if not isinstance(self.food_data, pd.DataFrame) or self.food_data.empty:
             return "High-protein foods include chicken breast, turkey, fish, lean beef, eggs, Greek yogurt, cottage cheese, tofu, legumes, and protein supplements like whey protein. These support muscle recovery and growth."
         
-        # Find high protein foods
-        high_protein_foods = self.food_data[
-            (self.food_data['Protein'] > 10) & 
-            (self.food_data['Calories'] > 0)
-        ].sort_values('Protein', ascending=False)
+        # Find high protein foods, most protein first
+        ranking = get_food_ranking(self.food_data, get_scorer('high protein'), 'both', parse_allergies(self.user_data.get('allergies')))
+        high_protein_foods, _ = ranking.top_foods(self.food_data, 5)
         
         if high_protein_foods.empty:
             return "I couldn't find specific high-protein foods in my database, but chicken, fish, eggs, dairy, legumes, and tofu are excellent protein sources."
@@ -421,6 +415,13 @@ class NutritionChatbot:
             
             response += f"🏋️‍♂️ **{exercise_name}** ({equipment}) - Targets: {target}\n"
         
+        # Muscles the recommended exercises work most, from the muscle index
+        muscle_index = get_muscle_index(self.exercise_data)
+        coverage = muscle_index.coverage(self.exercise_data.index.get_indexer(recommendations.index))
+        worked = [muscle_index.muscles[i] for i in np.argsort(-coverage)[:MUSCLES_WORKED_SHOWN] if coverage[i] > 0]
+        if worked:
+            response += f"\nTogether these work your {', '.join(worked)}.\n"
+        
         # Add goal-specific advice
         if 'weight loss' in user_goal:
             response += "\nFor weight loss, focus on creating a calorie deficit through a mix of cardio and strength training. Aim for consistency rather than intensity when starting out! 🔥"
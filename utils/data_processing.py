@@ -1,50 +1,214 @@
 import pandas as pd
+import numpy as np
+import hashlib
 import json
 import os
+import tempfile
 from datetime import datetime
+from utils.diet_classifier import DIET_CLASSIFIER_VERSION, classify_food_names
+from utils.exercise_classifier import DEFAULT_CATEGORY, classify_equipment_types
 
-def load_food_data():
+FOOD_DATA_PATH = 'attached_assets/cleaned_food_data_refined.csv'
+FOOD_CACHE_PATH = 'attached_assets/.cache/food_data.npz'
+EXERCISE_DATA_PATH = 'attached_assets/cleaned_exercise_data_refined.csv'
+USER_RECORDS_PATH = 'attached_assets/records.json'
+
+# Bump when the layout of the compiled food cache changes
+FOOD_CACHE_VERSION = 1
+
+# Columns coerced to numeric when parsing the food CSV
+NUMERIC_FOOD_COLUMNS = ['Calories', 'Total Fat', 'Saturated Fat', 'Monounsaturated Fat',
+                        'Polyunsaturated Fat', 'Carbs', 'Sugar', 'Protein', 'Dietary Fiber',
+                        'Cholesterol', 'Sodium', 'Water']
+
+def load_food_data(use_cache=True):
     """
     Load the food dataset
+    
+    The parsed table is kept in a compiled cache next to the CSV, keyed by the
+    CSV's modification time and content hash, so only the first load after the
+    CSV changes pays for parsing it. The is_vegetarian and is_vegan columns
+    are worked out while parsing and cached with the table.
+    
+    Parameters:
+    - use_cache: Read from (and refresh) the compiled cache when True
+    
+    Returns:
+    - DataFrame with food nutrition data
     """
     try:
-        food_data = pd.read_csv('attached_assets/cleaned_food_data_refined.csv')
-        # Clean up column names and data
-        food_data.columns = food_data.columns.str.strip()
-        # Ensure numeric columns are treated as numeric
-        numeric_cols = ['Calories', 'Total Fat', 'Saturated Fat', 'Monounsaturated Fat', 
-                       'Polyunsaturated Fat', 'Carbs', 'Sugar', 'Protein', 'Dietary Fiber', 
-                       'Cholesterol', 'Sodium', 'Water']
-        for col in numeric_cols:
-            if col in food_data.columns:
-                food_data[col] = pd.to_numeric(food_data[col], errors='coerce')
+        if not use_cache:
+            return parse_food_csv(FOOD_DATA_PATH)
+        
+        csv_stat = os.stat(FOOD_DATA_PATH)
+        meta = read_food_cache_meta(FOOD_CACHE_PATH)
         
+        if (meta is not None and meta.get('cache_version') == FOOD_CACHE_VERSION and
+                meta.get('diet_classifier_version') == DIET_CLASSIFIER_VERSION):
+            # Cheap check first: unchanged mtime and size means unchanged content
+            if meta.get('mtime_ns') == csv_stat.st_mtime_ns and meta.get('size') == csv_stat.st_size:
+                return read_food_cache(FOOD_CACHE_PATH)
+            
+            # The file was touched, only rebuild if the content really changed
+            csv_hash = file_sha256(FOOD_DATA_PATH)
+            if meta.get('sha256') == csv_hash:
+                food_data = read_food_cache(FOOD_CACHE_PATH)
+                write_food_cache(food_data, FOOD_CACHE_PATH, csv_stat, csv_hash)
+                return food_data
+        
+        food_data = parse_food_csv(FOOD_DATA_PATH)
+        write_food_cache(food_data, FOOD_CACHE_PATH, csv_stat, file_sha256(FOOD_DATA_PATH))
         return food_data
     except Exception as e:
         print(f"Error loading food data: {e}")
         # Return empty DataFrame if file not found or other error
         return pd.DataFrame()
 
+def parse_food_csv(path):
+    """
+    Parse the food CSV into a DataFrame with cleaned columns
+    """
+    food_data = pd.read_csv(path)
+    # Clean up column names and data
+    food_data.columns = food_data.columns.str.strip()
+    # Ensure numeric columns are treated as numeric
+    for col in NUMERIC_FOOD_COLUMNS:
+        if col in food_data.columns:
+            food_data[col] = pd.to_numeric(food_data[col], errors='coerce')
+    
+    add_diet_flags(food_data)
+    return food_data
+
+def add_diet_flags(food_data):
+    """
+    Add the is_vegetarian and is_vegan columns classified from the food names
+    """
+    if 'Food Name' in food_data.columns:
+        is_vegetarian, is_vegan = classify_food_names(food_data['Food Name'])
+    else:
+        is_vegetarian = is_vegan = np.ones(len(food_data), dtype=bool)
+    food_data['is_vegetarian'] = is_vegetarian
+    food_data['is_vegan'] = is_vegan
+
+def add_exercise_categories(exercise_data):
+    """
+    Add the Category column classified from the equipment types
+    """
+    if 'Equipment Type' in exercise_data.columns:
+        exercise_data['Category'] = classify_equipment_types(exercise_data['Equipment Type'])
+    else:
+        exercise_data['Category'] = DEFAULT_CATEGORY
+
+def file_sha256(path):
+    """
+    Compute the SHA-256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_food_cache_meta(cache_path):
+    """
+    Read the metadata stored in a compiled food cache
+    
+    Returns:
+    - Dict with cache metadata, or None if the cache is missing or unreadable
+    """
+    if not os.path.exists(cache_path):
+        return None
+    
+    try:
+        # npz archives are opened lazily, so this only reads the metadata entry
+        with np.load(cache_path, allow_pickle=False) as cache:
+            return json.loads(str(cache['__meta__']))
+    except Exception as e:
+        print(f"Ignoring unreadable food cache: {e}")
+        return None
+
+def read_food_cache(cache_path):
+    """
+    Rebuild the food DataFrame from a compiled cache
+    """
+    with np.load(cache_path, allow_pickle=False) as cache:
+        meta = json.loads(str(cache['__meta__']))
+        
+        columns = {}
+        for i, col in enumerate(meta['columns']):
+            values = cache[f'col_{i}']
+            if meta['kinds'][i] == 'text':
+                # Text is stored as fixed-width unicode plus a missing-value mask
+                values = values.astype(object)
+                values[cache[f'null_{i}']] = np.nan
+            columns[col] = values
+    
+    return pd.DataFrame(columns, columns=meta['columns'])
+
+def write_food_cache(food_data, cache_path, csv_stat, csv_hash):
+    """
+    Write the food DataFrame to a compiled cache of typed column arrays
+    
+    The cache is written to a temporary file and moved into place, so readers
+    never see a partially written cache. Failing to write the cache is not an
+    error: the data is simply parsed from the CSV again next time.
+    """
+    try:
+        arrays = {}
+        kinds = []
+        for i, col in enumerate(food_data.columns):
+            series = food_data[col]
+            if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                arrays[f'col_{i}'] = series.to_numpy()
+                kinds.append('numeric')
+            else:
+                nulls = series.isna().to_numpy()
+                arrays[f'col_{i}'] = series.fillna('').astype(str).to_numpy(dtype=str)
+                arrays[f'null_{i}'] = nulls
+                kinds.append('text')
+        
+        meta = {
+            "cache_version": FOOD_CACHE_VERSION,
+            "diet_classifier_version": DIET_CLASSIFIER_VERSION,
+            "mtime_ns": csv_stat.st_mtime_ns,
+            "size": csv_stat.st_size,
+            "sha256": csv_hash,
+            "columns": list(food_data.columns),
+            "kinds": kinds
+        }
+        arrays['__meta__'] = np.array(json.dumps(meta))
+        
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+        return True
+    except Exception as e:
+        print(f"Error writing food cache: {e}")
+        return False
+
 def load_exercise_data():
     """
     Load the exercise dataset
     """
     try:
-        exercise_data = pd.read_csv('attached_assets/cleaned_exercise_data_refined.csv')
+        exercise_data = pd.read_csv(EXERCISE_DATA_PATH)
         # Clean up column names
         exercise_data.columns = exercise_data.columns.str.strip()
+        add_exercise_categories(exercise_data)
         return exercise_data
     except Exception as e:
         print(f"Error loading exercise data: {e}")
         # Return empty DataFrame if file not found or other error
         return pd.DataFrame()
 
-def load_user_records():
+def load_user_records(path=USER_RECORDS_PATH):
     """
     Load user records from JSON file
     """
     try:
-        with open('attached_assets/records.json', 'r') as f:
+        with open(path, 'r') as f:
             user_records = json.load(f)
         return user_records
     except Exception as e:
@@ -52,16 +216,28 @@ def load_user_records():
         # Return empty dict if file not found or other error
         return {"records": {}}
 
-def save_user_records(user_records):
+def save_user_records(user_records, path=USER_RECORDS_PATH):
     """
     Save user records to JSON file
+    
+    The records are written to a temporary file in the same directory and
+    moved over the old file with os.replace, so readers always see either
+    the old or the new file, never a partially written one.
     """
+    tmp_path = None
     try:
-        with open('attached_assets/records.json', 'w') as f:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
             json.dump(user_records, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
         return True
     except Exception as e:
         print(f"Error saving user records: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return False
 
 def calculate_bmi(weight, height):
@@ -83,6 +259,70 @@ def calculate_bmi(weight, height):
         
     return round(bmi, 2), status
 
+def calculate_bmi_batch(weights, heights):
+    """
+    Calculate BMI and status for many people at once
+    
+    Gives the same values as calling calculate_bmi for each pair.
+    
+    Parameters:
+    - weights: Array-like of weights in kg
+    - heights: Array-like of heights in cm
+    
+    Returns:
+    - Tuple: (float array of BMIs rounded to 2 decimals, array of status strings)
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    
+    bmi = weights / (heights / 100) ** 2
+    
+    # Status uses the unrounded BMI, like calculate_bmi
+    status = np.select(
+        [bmi < 18.5, bmi < 25, bmi < 30],
+        ["Underweight", "Healthy", "Overweight"],
+        default="Obese"
+    )
+    
+    # np.round can differ from round() right at a half, redo those with round()
+    rounded = np.round(bmi, 2)
+    scaled = bmi * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(bmi[i]), 2)
+    
+    return rounded, status
+
+# Activity multipliers applied to the BMR
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,  # Little or no exercise
+    'lightly_active': 1.375,  # Light exercise 1-3 days per week
+    'moderately_active': 1.55,  # Moderate exercise 3-5 days per week
+    'very_active': 1.725,  # Hard exercise 6-7 days per week
+    'extra_active': 1.9  # Very hard exercise & physical job or training twice a day
+}
+
+# Daily calorie adjustment per goal, the first key found in the goal text applies
+GOAL_CALORIE_ADJUSTMENTS = {
+    'weight loss': -500,  # 500 calorie deficit
+    'weight gain': 500,   # 500 calorie surplus
+    'maintain weight': 0,
+    'muscle gain': 300,   # Moderate surplus for muscle gain
+    'not specified': 0
+}
+
+def goal_calorie_adjustment(goal):
+    """
+    Daily calorie adjustment for a goal, 0 if the goal is not recognized
+    """
+    # Clean up goal text and default to no adjustment if goal not recognized
+    clean_goal = goal.lower().strip()
+    
+    for key, value in GOAL_CALORIE_ADJUSTMENTS.items():
+        if key in clean_goal:
+            return value
+    return 0
+
 def calculate_calorie_needs(weight, height, age, gender, activity_level, goal):
     """
     Calculate daily calorie needs based on user data
@@ -104,72 +344,110 @@ def calculate_calorie_needs(weight, height, age, gender, activity_level, goal):
     else:
         bmr = 10 * weight + 6.25 * height - 5 * age - 161
     
-    # Apply activity multiplier
-    activity_multipliers = {
-        'sedentary': 1.2,  # Little or no exercise
-        'lightly_active': 1.375,  # Light exercise 1-3 days per week
-        'moderately_active': 1.55,  # Moderate exercise 3-5 days per week
-        'very_active': 1.725,  # Hard exercise 6-7 days per week
-        'extra_active': 1.9  # Very hard exercise & physical job or training twice a day
-    }
-    
-    # Default to moderately active if not specified
-    activity_multiplier = activity_multipliers.get(activity_level.lower(), 1.55)
+    # Apply activity multiplier, default to moderately active if not specified
+    activity_multiplier = ACTIVITY_MULTIPLIERS.get(activity_level.lower(), 1.55)
     
     tdee = bmr * activity_multiplier
     
     # Adjust based on goal
-    goal_adjustments = {
-        'weight loss': -500,  # 500 calorie deficit
-        'weight gain': 500,   # 500 calorie surplus
-        'maintain weight': 0,
-        'muscle gain': 300,   # Moderate surplus for muscle gain
-        'not specified': 0
-    }
-    
-    # Clean up goal text and default to no adjustment if goal not recognized
-    clean_goal = goal.lower().strip()
-    calorie_adjustment = 0
-    
-    for key, value in goal_adjustments.items():
-        if key in clean_goal:
-            calorie_adjustment = value
-            break
+    calorie_adjustment = goal_calorie_adjustment(goal)
     
     daily_calories = tdee + calorie_adjustment
     
     # Round to nearest 50 calories
     return round(daily_calories / 50) * 50
 
-def calculate_macros(calories, goal):
+def macro_split(goal):
     """
-    Calculate macronutrient distribution based on calorie needs and goal
+    Shares of calories from protein, fat and carbs for a goal
     
     Returns:
-    - Dict containing protein, carbs, and fat in grams
+    - Tuple: (protein_pct, fat_pct, carbs_pct)
     """
     goal = goal.lower() if goal else ""
     
     if "muscle gain" in goal:
         # Higher protein for muscle gain
-        protein_pct = 0.30
-        fat_pct = 0.25
-        carbs_pct = 0.45
+        return 0.30, 0.25, 0.45
     elif "weight loss" in goal:
         # Higher protein, moderate fat, lower carbs for weight loss
-        protein_pct = 0.35
-        fat_pct = 0.30
-        carbs_pct = 0.35
+        return 0.35, 0.30, 0.35
     elif "weight gain" in goal:
         # Balanced macros with emphasis on carbs for weight gain
-        protein_pct = 0.20
-        fat_pct = 0.30
-        carbs_pct = 0.50
+        return 0.20, 0.30, 0.50
     else:
         # Balanced distribution for maintenance or unspecified
-        protein_pct = 0.25
-        fat_pct = 0.30
-        carbs_pct = 0.45
+        return 0.25, 0.30, 0.45
+
+def calculate_calorie_needs_batch(weights, heights, ages, genders, activity_levels, goals):
+    """
+    Calculate daily calorie needs for many people at once
+    
+    Gives the same values as calling calculate_calorie_needs for each person.
+    
+    Parameters:
+    - weights, heights, ages: Array-likes in kg, cm and years
+    - genders, activity_levels, goals: Sequences of strings
+    
+    Returns:
+    - Integer array of daily calorie needs
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    ages = np.asarray(ages, dtype=np.float64)
+    
+    # Calculate BMR using Mifflin-St Jeor Equation
+    is_male = np.array([gender.lower() == 'male' for gender in genders], dtype=bool)
+    bmr = 10 * weights + 6.25 * heights - 5 * ages + np.where(is_male, 5, -161)
+    
+    # Look each distinct activity level and goal up once
+    multipliers = _lookup_batch(activity_levels, lambda level: ACTIVITY_MULTIPLIERS.get(level.lower(), 1.55))
+    adjustments = _lookup_batch(goals, goal_calorie_adjustment)
+    
+    daily_calories = bmr * multipliers + adjustments
+    
+    # Round to nearest 50 calories, half to even like round()
+    return (np.round(daily_calories / 50) * 50).astype(np.int64)
+
+def calculate_macros_batch(calories, goals):
+    """
+    Calculate macronutrient targets for many people at once
+    
+    Gives the same values as calling calculate_macros for each person.
+    
+    Returns:
+    - Dict of integer arrays with protein, carbs, and fat in grams
+    """
+    calories = np.asarray(calories, dtype=np.float64)
+    splits = np.array([_lookup_batch(goals, lambda goal: macro_split(goal)[i]) for i in range(3)])
+    protein_pct, fat_pct, carbs_pct = splits
+    
+    return {
+        "protein": np.round(calories * protein_pct / 4).astype(np.int64),
+        "carbs": np.round(calories * carbs_pct / 4).astype(np.int64),
+        "fat": np.round(calories * fat_pct / 9).astype(np.int64)
+    }
+
+def _lookup_batch(values, lookup):
+    """
+    Apply lookup to every value, calling it once per distinct value
+    """
+    cache = {}
+    result = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        if value not in cache:
+            cache[value] = lookup(value)
+        result[i] = cache[value]
+    return result
+
+def calculate_macros(calories, goal):
+    """
+    Calculate macronutrient distribution based on calorie needs and goal
+    
+    Returns:
+    - Dict containing protein, carbs, and fat in grams
+    """
+    protein_pct, fat_pct, carbs_pct = macro_split(goal)
     
     # Calculate grams of each macronutrient
     protein_grams = (calories * protein_pct) / 4  # 4 calories per gram of protein
@@ -186,30 +464,28 @@ def calculate_macros(calories, goal):
 def filter_foods_by_preference(food_data, diet_preference):
     """
     Filter foods based on user's dietary preference
+    
+    Uses the is_vegetarian and is_vegan columns added when the food data is
+    loaded, and classifies the food names on the spot for tables without them.
+    
+    Parameters:
+    - food_data: DataFrame with food nutrition data
+    - diet_preference: 'vegetarian', 'vegan', or anything else for all foods
+    
+    Returns:
+    - DataFrame with the matching foods
     """
-    # For simplicity, we'll use some keywords to filter foods
-    if diet_preference.lower() == 'vegetarian':
-        # Filter out obvious meat-containing foods
-        meat_keywords = ['beef', 'chicken', 'pork', 'lamb', 'turkey', 'duck', 'veal', 
-                        'ham', 'bacon', 'sausage', 'salmon', 'fish', 'seafood', 'shrimp',
-                        'crab', 'lobster', 'meatball', 'meatloaf', 'steak']
-        
-        # Create a filter condition based on food names not containing meat keywords
-        filter_condition = ~food_data['Food Name'].str.lower().str.contains('|'.join(meat_keywords), na=False)
-        
-        return food_data[filter_condition]
-        
-    elif diet_preference.lower() == 'vegan':
-        # Filter out animal products
-        animal_keywords = ['beef', 'chicken', 'pork', 'lamb', 'turkey', 'duck', 'veal', 
-                          'ham', 'bacon', 'sausage', 'salmon', 'fish', 'seafood', 'shrimp',
-                          'crab', 'lobster', 'cheese', 'milk', 'cream', 'butter', 'egg',
-                          'yogurt', 'honey', 'meat', 'whey', 'casein', 'gelatin']
-        
-        filter_condition = ~food_data['Food Name'].str.lower().str.contains('|'.join(animal_keywords), na=False)
-        
-        return food_data[filter_condition]
-        
-    else:
+    diet_preference = (diet_preference or 'both').lower()
+    if diet_preference not in ('vegetarian', 'vegan'):
         # Return all foods for 'both' or any other preference
         return food_data
+    
+    column = f'is_{diet_preference}'
+    if column in food_data.columns:
+        return food_data[food_data[column].to_numpy(dtype=bool)]
+    
+    if 'Food Name' not in food_data.columns:
+        return food_data
+    
+    is_vegetarian, is_vegan = classify_food_names(food_data['Food Name'])
+    return food_data[is_vegan if diet_preference == 'vegan' else is_vegetarian]
@@ -0,0 +1,168 @@
+import threading
+import weakref
+from types import MappingProxyType
+import pandas as pd
+from utils.data_processing import load_food_data, load_exercise_data
+from utils.user_store import load_user_records_from_store
+
+# Loaders for the datasets shared by every session in this process
+DATASET_LOADERS = {
+    "food_data": load_food_data,
+    "exercise_data": load_exercise_data,
+    "user_records": load_user_records_from_store
+}
+
+_datasets = {}
+_versions = {}
+_artifacts = {}
+# The DataFrame views handed out by get_dataset, by id. Only these exact
+# objects may use cached artifacts
+_views = weakref.WeakValueDictionary()
+_lock = threading.RLock()
+
+def get_dataset(name):
+    """
+    Get a shared, read-only view of a dataset
+
+    Each dataset is loaded once per process and then handed out to every
+    session. DataFrames are returned as shallow copies that share the loaded
+    data, so callers must not modify their values in place. Dict datasets
+    are frozen all the way down when loaded: every nested dict is a
+    read-only mapping and every list a tuple.
+
+    Parameters:
+    - name: Dataset name, one of DATASET_LOADERS
+
+    Returns:
+    - DataFrame or read-only mapping with the dataset
+    """
+    with _lock:
+        if name not in _datasets:
+            _load_dataset(name)
+        data = _datasets[name]
+
+    if isinstance(data, pd.DataFrame):
+        view = data.copy(deep=False)
+        # attrs are copied shallowly, keep the version stamp per view
+        view.attrs = dict(data.attrs)
+        with _lock:
+            _views[id(view)] = view
+        return view
+
+    return data
+
+def get_dataset_version(name):
+    """
+    Get the version number of a dataset
+
+    The version starts at 1 and increases every time the dataset is reloaded,
+    so pages can compare it against a stored value to detect a reload.
+
+    Returns:
+    - Version number, or 0 if the dataset has not been loaded yet
+    """
+    with _lock:
+        return _versions.get(name, 0)
+
+def reload_dataset(name):
+    """
+    Reload a dataset from disk and bump its version
+
+    Returns:
+    - The new version number
+    """
+    with _lock:
+        _load_dataset(name)
+        return _versions[name]
+
+def invalidate_dataset(name):
+    """
+    Drop a loaded dataset so the next get_dataset call reloads it
+    """
+    with _lock:
+        _datasets.pop(name, None)
+        _drop_artifacts(name)
+
+def get_dataset_artifact(data, key, builder):
+    """
+    Get a structure derived from a dataset, building it once per dataset version
+
+    Derived structures (indexes, matrices, rankings) are cached against the
+    version stamped on views handed out by get_dataset. Only those exact
+    view objects use the cache. pandas copies the stamp into frames derived
+    from a view (masks, head, iloc, reset_index), whose rows no longer
+    match the cached artifacts, so they and any other DataFrame are built
+    every call.
+
+    Parameters:
+    - data: DataFrame returned by get_dataset (or any other DataFrame)
+    - key: Hashable key naming the artifact
+    - builder: Function taking the DataFrame and returning the artifact
+
+    Returns:
+    - The artifact
+    """
+    name = data.attrs.get('dataset_name') if isinstance(data, pd.DataFrame) else None
+    version = data.attrs.get('dataset_version') if name else None
+
+    with _lock:
+        registered = _views.get(id(data)) is data
+
+    if name is None or version is None or not registered:
+        return builder(data)
+
+    cache_key = (name, version, key)
+    with _lock:
+        if cache_key in _artifacts:
+            return _artifacts[cache_key]
+
+    # Build outside the lock, a concurrent duplicate build is harmless
+    artifact = builder(data)
+
+    with _lock:
+        # Only keep artifacts for the current version of the dataset
+        if _versions.get(name) == version:
+            _artifacts.setdefault(cache_key, artifact)
+            artifact = _artifacts[cache_key]
+
+    return artifact
+
+def _load_dataset(name):
+    """
+    Load a dataset and stamp it with a new version (caller holds the lock)
+    """
+    if name not in DATASET_LOADERS:
+        raise KeyError(f"Unknown dataset: {name}")
+
+    data = DATASET_LOADERS[name]()
+    version = _versions.get(name, 0) + 1
+
+    if isinstance(data, pd.DataFrame):
+        data.attrs['dataset_name'] = name
+        data.attrs['dataset_version'] = version
+    else:
+        data = _freeze(data)
+
+    _drop_artifacts(name)
+    _datasets[name] = data
+    _versions[name] = version
+
+def _freeze(value):
+    """
+    Read-only copy of nested dicts and lists: dicts become read-only
+    mappings, lists and tuples become tuples and sets frozensets
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+def _drop_artifacts(name):
+    """
+    Remove cached artifacts derived from a dataset (caller holds the lock)
+    """
+    for cache_key in [k for k in _artifacts if k[0] == name]:
+        del _artifacts[cache_key]
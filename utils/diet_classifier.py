@@ -0,0 +1,231 @@
+import re
+from collections import deque
+import numpy as np
+
+# Bump when the terms below change, so cached classifications are rebuilt
+DIET_CLASSIFIER_VERSION = 3
+
+# Meat, poultry and meat products
+LAND_MEAT_TERMS = [
+    # Meat and poultry
+    'meat', 'beef', 'veal', 'pork', 'ham', 'bacon', 'lamb', 'mutton', 'goat meat', 'venison', 'bison',
+    'chicken', 'turkey', 'duck', 'goose', 'quail', 'pheasant', 'ostrich', 'emu', 'rabbit',
+    'steak', 'sirloin', 'tenderloin', 'brisket', 'porterhouse', 'chuck', 'loin', 'spareribs', 'backribs',
+    'ribs', 'chops', 'drumstick', 'wing', 'thigh', 'breast',
+    # Offal
+    'liver', 'kidney', 'heart', 'tongue', 'tripe', 'brain', 'lungs', 'spleen', 'pancreas',
+    'thymus', 'gizzard',
+    # Processed meat and meat dishes
+    'sausage', 'salami', 'bologna', 'pastrami', 'pepperoni', 'frankfurter', 'hotdog', 'hot dog',
+    'wurst', 'bratwurst', 'knackwurst', 'liverwurst', 'yachtwurst', 'chorizo', 'prosciutto', 'jerky',
+    'corned', 'luncheon meat', 'cold cuts', 'meatball', 'meatloaf', 'hamburger', 'cheeseburger',
+    'whopper', 'big mac', 'quarter pounder', 'mcchicken', 'mcnuggets', 'nuggets', 'carne', 'cerdo',
+    'lard', 'tallow', 'gelatin', 'broth', 'stock', 'gravy'
+]
+
+FISH_TERMS = [
+    'fish', 'seafood', 'fillet', 'filet', 'roe', 'salmon', 'tuna', 'trout', 'seatrout', 'cod', 'lingcod',
+    'haddock', 'halibut', 'herring', 'mackerel', 'sardine', 'anchovy', 'pike', 'perch', 'bass', 'carp',
+    'catfish', 'tilapia', 'pollock', 'snapper', 'flounder', 'sole', 'whiting', 'smelt', 'sturgeon',
+    'swordfish', 'shark', 'eel', 'grouper', 'mullet', 'pompano', 'turbot', 'burbot', 'walleye',
+    'whitefish', 'wolffish', 'butterfish', 'milkfish', 'monkfish', 'sablefish', 'tilefish', 'rockfish',
+    'bluefish', 'dolphinfish', 'sunfish', 'croaker', 'scup', 'sheepshead', 'shad', 'cisco', 'cusk',
+    'pout', 'drum', 'roughy', 'yellowtail', 'yellowfin', 'bluefin', 'sockeye', 'chinook', 'coho',
+    'chum', 'ling', 'sucker'
+]
+
+SHELLFISH_TERMS = [
+    'shellfish', 'seafood', 'shrimp', 'prawn', 'crab', 'lobster', 'crayfish', 'scallop', 'clam',
+    'oyster', 'mussel', 'whelk', 'squid', 'octopus', 'cuttlefish', 'calamari'
+]
+
+# Foods naming any of these, or a fish or shellfish term, are not vegetarian
+MEAT_TERMS = LAND_MEAT_TERMS + FISH_TERMS + SHELLFISH_TERMS + ['jellyfish']
+
+DAIRY_TERMS = [
+    'milk', 'buttermilk', 'cream', 'butter', 'ghee', 'cheese', 'cheesecake', 'queso', 'mozzarella',
+    'parmesan', 'provolone', 'ricotta', 'feta', 'brie', 'yogurt', 'yoghurt', 'whey', 'casein', 'custard',
+    'ranch', 'butterscotch', 'milky way'
+]
+
+EGG_TERMS = ['egg', 'eggnog', 'yolk', 'omelet', 'omelette', 'mayonnaise', 'custard', 'mcmuffin']
+
+# Foods naming any of these are vegetarian but not vegan
+ANIMAL_PRODUCT_TERMS = DAIRY_TERMS + EGG_TERMS + ['honey', 'parfait']
+
+# Plant foods whose names contain one of the terms above. A match inside
+# one of these phrases does not count
+PLANT_PHRASES = [
+    'peanut butter', 'almond butter', 'cashew butter', 'apple butter', 'sesame butter', 'seed butter',
+    'cocoa butter', 'nutmeg butter', 'ucuhuba butter', 'coconut milk', 'coconut cream', 'soy milk',
+    'almond milk', 'rice milk', 'oat milk', 'cream of tartar', 'cream soda', 'tofu yogurt',
+    'vegetable broth', 'vegetable stock', 'mushroom gravy', 'onion gravy', 'mock duck', 'coconut meat',
+    'meat extender', 'hearts of palm', 'oyster mushroom', 'scallop squash', 'drumstick leaves',
+    'drumstick pods', 'steak sauce'
+]
+
+# Phrases using a meat term for something that is not meat. Only the meat
+# terms inside them do not count
+NOT_MEAT_PHRASES = [
+    'quail egg', 'duck egg', 'goose egg', 'mozzarella steak',
+    # Sauces, breads and plants named after a meat
+    'duck sauce', 'wing sauce', 'hot dog bun', 'hot dog roll', 'hotdog bun', 'hotdog roll',
+    'hamburger bun', 'hamburger roll', 'chicken of the woods', 'lambs quarters', 'lambs lettuce',
+    'kidney bean', 'artichoke heart', 'celery heart', 'palm heart'
+]
+
+# Words marking a meat substitute, e.g. "meatless chicken": meat terms in
+# the same name do not count
+MEATLESS_TERMS = ['meatless', 'veggie', 'vegetarian', 'vegan']
+
+MEAT, ANIMAL_PRODUCT, PLANT, NOT_MEAT, MEATLESS = range(5)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def word_forms(term):
+    """
+    Token sequences matching a term and its plural
+
+    Only the last word of a term is made plural: "egg" also matches
+    "eggs", "anchovy" also matches "anchovies".
+    """
+    words = term.lower().split()
+    last = words[-1]
+    plurals = {last, last + 's', last + 'es'}
+    if len(last) > 1 and last.endswith('y') and last[-2] not in 'aeiou':
+        plurals.add(last[:-1] + 'ies')
+    return [tuple(words[:-1]) + (plural,) for plural in sorted(plurals)]
+
+class DietClassifier:
+    """
+    Aho-Corasick automaton over the words of food names
+
+    Patterns are sequences of whole words, so "ham" matches "ham sandwich"
+    but not "graham crackers", and one pass over the words of a name finds
+    every term in it. Classifying a name costs one step per word however
+    many terms there are.
+    """
+    def __init__(self, terms):
+        # Node 0 is the root. Each node has its word transitions, failure
+        # link and the (pattern length, kind) pairs ending there
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for term, kind in terms:
+            for words in word_forms(term):
+                node = 0
+                for word in words:
+                    next_node = self.goto[node].get(word)
+                    if next_node is None:
+                        next_node = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.output.append([])
+                        self.goto[node][word] = next_node
+                    node = next_node
+                if (len(words), kind) not in self.output[node]:
+                    self.output[node].append((len(words), kind))
+
+        # Breadth-first, so the failure link of a node is final before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def matches(self, words):
+        """
+        Every pattern found in a list of words
+
+        Returns:
+        - List of (first word, last word, kind) tuples
+        """
+        found = []
+        node = 0
+        for end, word in enumerate(words):
+            while node and word not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(word, 0)
+            for length, kind in self.output[node]:
+                found.append((end - length + 1, end, kind))
+        return found
+
+    def classify(self, name):
+        """
+        Classify one food name
+
+        Returns:
+        - Tuple: (is_vegetarian, is_vegan)
+        """
+        if not isinstance(name, str):
+            return True, True
+
+        found = self.matches(_TOKEN_PATTERN.findall(name.lower()))
+        if not found:
+            return True, True
+
+        plant_spans = [(start, end) for start, end, kind in found if kind == PLANT]
+        not_meat_spans = [(start, end) for start, end, kind in found if kind == NOT_MEAT]
+        meatless = any(kind == MEATLESS for _, _, kind in found)
+
+        def inside(start, end, spans):
+            return any(span_start <= start and end <= span_end for span_start, span_end in spans)
+
+        has_meat = has_animal_product = False
+        for start, end, kind in found:
+            if kind not in (MEAT, ANIMAL_PRODUCT) or inside(start, end, plant_spans):
+                continue
+            if kind == MEAT and inside(start, end, not_meat_spans):
+                continue
+            if kind == MEAT and not meatless:
+                has_meat = True
+            else:
+                # A meat substitute may still hold animal products, but is not vegan
+                has_animal_product = True
+
+        return not has_meat, not (has_meat or has_animal_product)
+
+_classifier = None
+
+def get_diet_classifier():
+    """
+    Get the shared classifier built from the term lists above
+    """
+    global _classifier
+    if _classifier is None:
+        terms = ([(term, MEAT) for term in MEAT_TERMS] +
+                 [(term, ANIMAL_PRODUCT) for term in ANIMAL_PRODUCT_TERMS] +
+                 [(term, PLANT) for term in PLANT_PHRASES] +
+                 [(term, NOT_MEAT) for term in NOT_MEAT_PHRASES] +
+                 [(term, MEATLESS) for term in MEATLESS_TERMS])
+        _classifier = DietClassifier(terms)
+    return _classifier
+
+def classify_food_names(names):
+    """
+    Classify food names as vegetarian and vegan
+
+    Parameters:
+    - names: Iterable of food names; missing names count as plant foods
+
+    Returns:
+    - Tuple of boolean arrays: (is_vegetarian, is_vegan)
+    """
+    classifier = get_diet_classifier()
+    # Repeated names are common, classify each once
+    classes = {}
+    flags = []
+    for name in names:
+        key = name if isinstance(name, str) else None
+        if key not in classes:
+            classes[key] = classifier.classify(key)
+        flags.append(classes[key])
+
+    flags = np.array(flags, dtype=bool).reshape(-1, 2)
+    return flags[:, 0], flags[:, 1]
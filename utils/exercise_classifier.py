@@ -0,0 +1,43 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Exercise categories, in the order recommendations list them
+EXERCISE_CATEGORIES = ['Cardio', 'Strength', 'Flexibility']
+
+# Equipment type keywords of each category, tried in this order
+CATEGORY_KEYWORDS = {
+    'Cardio': ['Cardio', 'HIIT', 'Aerobic'],
+    'Strength': ['Strength', 'Resistance', 'Weight', 'Bodyweight'],
+    'Flexibility': ['Stretch', 'Yoga', 'Mobility', 'Flexibility']
+}
+
+# Category of exercises whose equipment type matches no keyword
+DEFAULT_CATEGORY = 'Strength'
+
+def classify_equipment_types(equipment_types):
+    """
+    Classify exercises as Cardio, Strength or Flexibility by equipment type
+
+    An exercise gets the first category with a keyword contained in its
+    equipment type, ignoring case. Each distinct equipment type is only
+    matched once, however many exercises share it.
+
+    Parameters:
+    - equipment_types: Iterable of equipment types; missing values match no keyword
+
+    Returns:
+    - Array of category names
+    """
+    codes, types = pd.factorize(pd.Series(list(equipment_types), dtype=object).fillna('').astype(str))
+    types = pd.Series(types, dtype=object)
+
+    categories = np.full(len(types), DEFAULT_CATEGORY, dtype=object)
+    assigned = np.zeros(len(types), dtype=bool)
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        pattern = '|'.join(re.escape(keyword) for keyword in keywords)
+        matched = types.str.contains(pattern, case=False, regex=True).to_numpy(dtype=bool) & ~assigned
+        categories[matched] = category
+        assigned |= matched
+
+    return categories[codes] if len(codes) else np.array([], dtype=object)
@@ -0,0 +1,305 @@
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils.allergy_index import singular
+from utils.datasets import get_dataset_artifact
+from utils.exercise_classifier import EXERCISE_CATEGORIES, classify_equipment_types
+
+# Weights of an exercise's target and synergist muscles in the incidence matrix
+TARGET_WEIGHT = 1.0
+SYNERGIST_WEIGHT = 0.5
+
+# Items of the muscle lists that name a part of the muscle before them,
+# e.g. "Trapezius, Upper" or "Adductor Magnus, ischial fibers"
+MUSCLE_QUALIFIERS = {
+    'upper', 'middle', 'lower', 'lower fibers', 'anterior', 'anterior fibers', 'posterior', 'lateral',
+    'sternal', 'clavicular', 'long head', 'general', 'hip', 'cervicis & capitis fibers', 'ischial fibers'
+}
+
+# Everyday names of muscles, mapped to the muscles and main muscle groups they mean
+MUSCLE_ALIASES = {
+    'abs': ['obliques', 'waist'],
+    'core': ['obliques', 'erector spinae', 'waist'],
+    'glutes': ['gluteus maximus', 'gluteus medius', 'gluteus minimus'],
+    'quads': ['quadriceps', 'rectus femoris'],
+    'biceps': ['biceps brachii'],
+    'lats': ['latissimus dorsi'],
+    'traps': ['trapezius'],
+    'pecs': ['pectoralis major', 'pectoralis minor'],
+    'delts': ['deltoid'],
+    'calf': ['calves'],
+    'hip flexors': ['iliopsoas', 'rectus femoris'],
+    'lower back': ['erector spinae', 'back']
+}
+
+_PARENTHESES_PATTERN = re.compile(r"\([^)]*\)")
+_WORD_PATTERN = re.compile(r"[a-z0-9&]+")
+
+def muscle_balance_weights(muscles):
+    """
+    Sampling probabilities giving every main muscle the same total weight
+
+    Parameters:
+    - muscles: Array of main muscle names, one per exercise
+
+    Returns:
+    - Array of probabilities summing to 1, or an empty array for no exercises
+    """
+    if len(muscles) == 0:
+        return np.array([], dtype=np.float64)
+    codes, _ = pd.factorize(pd.Series(muscles, dtype=object).fillna(''))
+    weights = 1.0 / np.bincount(codes)[codes]
+    return weights / weights.sum()
+
+class ExerciseIndex:
+    """
+    Row positions of the exercises of each category
+
+    Rows are positions in the exercise DataFrame the index was built from.
+    Exercises without a name are left out. Each category also keeps the
+    probabilities of its exercises for sampling, weighted so every main
+    muscle of the category is as likely as any other, however many
+    exercises it has.
+    """
+    def __init__(self, exercise_data):
+        if 'Exercise' in exercise_data.columns:
+            named = (exercise_data['Exercise'].fillna('').astype(str).str.strip() != '').to_numpy()
+        else:
+            named = np.zeros(len(exercise_data), dtype=bool)
+
+        if 'Category' in exercise_data.columns:
+            categories = exercise_data['Category'].to_numpy(dtype=object)
+        else:
+            categories = classify_equipment_types(exercise_data.get('Equipment Type', pd.Series([''] * len(exercise_data))))
+
+        if 'Main Muscle' in exercise_data.columns:
+            muscles = exercise_data['Main Muscle'].fillna('').astype(str).str.strip().to_numpy(dtype=object)
+        else:
+            muscles = np.full(len(exercise_data), '', dtype=object)
+
+        self.rows = np.flatnonzero(named)
+        self.weights = muscle_balance_weights(muscles[self.rows])
+
+        self.category_rows = {}
+        self.category_weights = {}
+        for category in EXERCISE_CATEGORIES:
+            rows = np.flatnonzero(named & (categories == category))
+            self.category_rows[category] = rows
+            self.category_weights[category] = muscle_balance_weights(muscles[rows])
+
+    def sample(self, count, rng, category=None):
+        """
+        Draw different exercises at random
+
+        Parameters:
+        - count: Number of exercises, fewer if the category has fewer
+        - rng: numpy random Generator
+        - category: Category to draw from, or None for any exercise
+
+        Returns:
+        - Array of exercise rows
+        """
+        if category is None:
+            rows, weights = self.rows, self.weights
+        else:
+            rows, weights = self.category_rows.get(category, self.rows[:0]), self.category_weights.get(category)
+
+        count = min(count, len(rows))
+        if count <= 0:
+            return rows[:0]
+        return rows[rng.choice(len(rows), size=count, replace=False, p=weights)]
+
+def get_exercise_index(exercise_data):
+    """
+    Get the category index of an exercise DataFrame, built once per dataset version
+    """
+    return get_dataset_artifact(exercise_data, 'exercise_index', ExerciseIndex)
+
+def exercise_records(exercise_data, rows):
+    """
+    Exercise dicts, as listed by recommend_exercises, of rows of an exercise DataFrame
+    """
+    fields = {
+        "name": 'Exercise',
+        "type": 'Equipment Type',
+        "main_muscle": 'Main Muscle',
+        "preparation": 'Preparation',
+        "execution": 'Execution',
+        "target_muscles": 'Target Muscles',
+        "synergist_muscles": 'Synergist Muscles'
+    }
+    exercises = exercise_data.iloc[rows]
+    values = [
+        exercises[column].fillna('').astype(str).str.strip().tolist() if column in exercises.columns
+        else [''] * len(exercises)
+        for column in fields.values()
+    ]
+    return [dict(zip(fields, exercise)) for exercise in zip(*values)]
+
+def parse_muscle_list(text):
+    """
+    Muscles named by a Target Muscles or Synergist Muscles entry
+
+    Parts of a muscle and remarks in parentheses are dropped, so
+    "Trapezius, Upper (Part 1), Erector Spinae" gives Trapezius and
+    Erector Spinae.
+
+    Returns:
+    - List of muscle names in order, without repeats
+    """
+    if not isinstance(text, str):
+        return []
+
+    muscles = []
+    for item in text.split(','):
+        item = ' '.join(_PARENTHESES_PATTERN.sub(' ', item).split())
+        if not item or item == '0':
+            continue
+        if item.lower() in MUSCLE_QUALIFIERS and muscles:
+            continue
+        if item not in muscles:
+            muscles.append(item)
+    return muscles
+
+def phrase_key(text):
+    """
+    Lookup key of a muscle name or query phrase: its singular lowercase words
+    """
+    return tuple(singular(word) for word in _WORD_PATTERN.findall(text.lower()))
+
+class MuscleIndex:
+    """
+    Inverted index from muscles to the exercises working them
+
+    Exercise ids are row positions in the exercise DataFrame. Muscle names
+    from the Target and Synergist Muscles lists form the vocabulary, and
+    incidence is a sparse (exercises x muscles) matrix holding TARGET_WEIGHT
+    where a muscle is a target and SYNERGIST_WEIGHT where it only assists.
+    Main muscle groups ("Thighs", "Back") are indexed separately. Queries
+    are matched word by word against the muscle, group and alias phrases,
+    so a lookup costs the same however many exercises there are.
+    """
+    def __init__(self, exercise_data):
+        def column(name):
+            if name in exercise_data.columns:
+                return exercise_data[name].tolist()
+            return [None] * len(exercise_data)
+
+        self.muscles = []
+        muscle_index = {}
+        # (exercise id, muscle id) -> weight. Targets come last, so they win
+        # over a synergist entry for the same pair
+        pairs = {}
+        for weight, name in ((SYNERGIST_WEIGHT, 'Synergist Muscles'), (TARGET_WEIGHT, 'Target Muscles')):
+            for exercise_id, text in enumerate(column(name)):
+                for muscle in parse_muscle_list(text):
+                    key = muscle.lower()
+                    if key not in muscle_index:
+                        muscle_index[key] = len(self.muscles)
+                        self.muscles.append(muscle)
+                    pairs[(exercise_id, muscle_index[key])] = weight
+
+        exercise_ids = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        muscle_ids = np.array([pair[1] for pair in pairs], dtype=np.int64)
+        incidence = sparse.coo_matrix((np.array(list(pairs.values()), dtype=np.float32), (exercise_ids, muscle_ids)),
+                                      shape=(len(exercise_data), len(self.muscles)))
+        self.incidence = incidence.tocsr()
+        self.muscle_index = muscle_index
+
+        # In column-major form each muscle's column lists the exercise ids
+        # working it and their weights, the muscle's posting list
+        by_muscle = self.incidence.tocsc()
+        by_muscle.sort_indices()
+        self.postings = {}
+        for muscle_id in range(len(self.muscles)):
+            entries = slice(by_muscle.indptr[muscle_id], by_muscle.indptr[muscle_id + 1])
+            self.postings[muscle_id] = (by_muscle.indices[entries], by_muscle.data[entries])
+
+        self.groups = {}
+        for exercise_id, group in enumerate(column('Main Muscle')):
+            if isinstance(group, str) and group.strip():
+                self.groups.setdefault(group.strip().lower(), []).append(exercise_id)
+        self.groups = {group: np.array(ids, dtype=np.int64) for group, ids in self.groups.items()}
+
+        # Query phrases, each mapped to the (muscle ids, group names) it names
+        self.phrases = {}
+        for key, muscle_id in muscle_index.items():
+            self._add_phrase(key, [muscle_id], [])
+        for group in self.groups:
+            self._add_phrase(group, [], [group])
+        for alias, names in MUSCLE_ALIASES.items():
+            self._add_phrase(alias, [muscle_index[name] for name in names if name in muscle_index],
+                             [name for name in names if name in self.groups])
+        self.max_phrase_words = max((len(key) for key in self.phrases), default=0)
+
+    def _add_phrase(self, text, muscle_ids, groups):
+        key = phrase_key(text)
+        if not key or not (muscle_ids or groups):
+            return
+        known_muscles, known_groups = self.phrases.setdefault(key, (set(), set()))
+        known_muscles.update(muscle_ids)
+        known_groups.update(groups)
+
+    def find(self, message):
+        """
+        Muscles and muscle groups named in a message
+
+        At each word the longest known phrase starting there wins, so
+        "pectoralis major" is not also read as a shorter phrase.
+
+        Returns:
+        - Tuple: (set of muscle ids, set of main muscle group names)
+        """
+        words = phrase_key(message)
+        muscle_ids, groups = set(), set()
+        start = 0
+        while start < len(words):
+            for length in range(min(self.max_phrase_words, len(words) - start), 0, -1):
+                match = self.phrases.get(words[start:start + length])
+                if match:
+                    muscle_ids.update(match[0])
+                    groups.update(match[1])
+                    start += length
+                    break
+            else:
+                start += 1
+        return muscle_ids, groups
+
+    def exercises_for(self, message, targets_only=False):
+        """
+        Exercises working any muscle or muscle group named in a message
+
+        Parameters:
+        - message: Query text, e.g. "exercises for glutes"
+        - targets_only: Only count exercises whose target muscles include
+          the muscle, not those it merely assists in
+
+        Returns:
+        - Sorted array of exercise ids, empty if no muscle is named
+        """
+        muscle_ids, groups = self.find(message)
+        found = [self.groups[group] for group in groups]
+        for muscle_id in muscle_ids:
+            ids, weights = self.postings[muscle_id]
+            found.append(ids[weights >= TARGET_WEIGHT] if targets_only else ids)
+        if not found:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def coverage(self, exercise_ids):
+        """
+        How much a set of exercises works each muscle
+
+        Returns:
+        - Array over self.muscles: the summed target and synergist weights
+        """
+        if len(exercise_ids) == 0:
+            return np.zeros(len(self.muscles), dtype=np.float32)
+        return np.asarray(self.incidence[np.asarray(exercise_ids)].sum(axis=0)).ravel()
+
+def get_muscle_index(exercise_data):
+    """
+    Get the muscle index of an exercise DataFrame, built once per dataset version
+    """
+    return get_dataset_artifact(exercise_data, 'muscle_index', MuscleIndex)
@@ -0,0 +1,128 @@
+import numpy as np
+from sklearn.neighbors import KDTree
+from utils.allergy_index import parse_allergies, get_exclusion_mask
+from utils.datasets import get_dataset_artifact
+from utils.meal_engine import get_food_pool
+
+# Nutrients compared when looking for a substitute, as FoodPool attributes
+SIMILARITY_NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+class FoodSimilarityIndex:
+    """
+    Nearest-neighbor index over the nutrient vectors of one diet's food pool
+
+    Each food is a point of calories, protein, carbs and fat per serving,
+    divided by the spread of that nutrient over the whole food table so
+    every nutrient counts alike. Close points are foods that can replace
+    each other in a meal without changing its totals much.
+    """
+    def __init__(self, pool, scale):
+        self.pool = pool
+        self.scale = scale
+        self.entries = np.flatnonzero(pool.valid)
+        self.tree = KDTree(self.vectors(pool, self.entries)) if len(self.entries) else None
+
+    def vectors(self, pool, entries):
+        """
+        Scaled nutrient vectors of pool entries
+        """
+        values = np.column_stack([getattr(pool, nutrient)[entries] for nutrient in SIMILARITY_NUTRIENTS])
+        return values / self.scale
+
+    def query(self, vector, k, excluded=None):
+        """
+        Pool entries of the k foods closest to a scaled nutrient vector
+
+        Parameters:
+        - vector: Scaled nutrient vector
+        - k: Number of foods
+        - excluded: Optional boolean mask over pool entries of foods to skip
+
+        Returns:
+        - Tuple: (distances, pool indices), closest first
+        """
+        if self.tree is None or k <= 0:
+            return np.empty(0), np.empty(0, dtype=int)
+
+        # Ask for more neighbors in rounds until k of them are not excluded,
+        # so a query only grows with the excluded foods near the vector
+        count = min(k if excluded is None else 2 * k, len(self.entries))
+        while True:
+            distances, positions = self.tree.query(vector.reshape(1, -1), k=count)
+            distances, entries = distances[0], self.entries[positions[0]]
+            if excluded is not None:
+                kept = ~excluded[entries]
+                distances, entries = distances[kept], entries[kept]
+            if len(entries) >= k or count == len(self.entries):
+                return distances[:k], entries[:k]
+            count = min(count * 2, len(self.entries))
+
+def nutrient_scale(pool):
+    """
+    Spread of each similarity nutrient over the valid foods of a pool, 1 where
+    there is none
+    """
+    values = np.column_stack([getattr(pool, nutrient)[pool.valid] for nutrient in SIMILARITY_NUTRIENTS])
+    if len(values) == 0:
+        return np.ones(len(SIMILARITY_NUTRIENTS))
+    scale = values.std(axis=0)
+    return np.where(scale > 0, scale, 1.0)
+
+def get_similarity_index(food_data, diet='both'):
+    """
+    Get the similarity index of a diet's foods, built once per food dataset version
+    """
+    diet = (diet or 'both').lower()
+
+    def build(data):
+        # Scale by the whole table, so distances mean the same for every diet
+        scale = nutrient_scale(get_food_pool(data, 'both'))
+        return FoodSimilarityIndex(get_food_pool(data, diet), scale)
+
+    return get_dataset_artifact(food_data, ('food_similarity', diet), build)
+
+def suggest_substitutes(food_name, food_data, k=5, diet='both', allergies=None):
+    """
+    Suggest foods with about the same calories and macros as a given food
+
+    Parameters:
+    - food_name: Name of the food to replace, as in the 'Food Name' column
+    - food_data: DataFrame with food nutrition data
+    - k: Number of substitutes
+    - diet: Diet preference the substitutes must match, as for
+      filter_foods_by_preference. The food itself may be from any diet
+    - allergies: Allergies field of a profile; substitutes it rules out are
+      not suggested
+
+    Returns:
+    - List of substitute dicts with name, calories, protein, carbs, fat and
+      a similarity between 0 and 1, most similar first. Empty if the food
+      is unknown or has no calorie information
+    """
+    if 'Calories' not in food_data.columns or k <= 0:
+        return []
+
+    source_pool = get_food_pool(food_data, 'both')
+    source = source_pool.index_of(food_name)
+    if source is None or not source_pool.valid[source]:
+        return []
+
+    index = get_similarity_index(food_data, diet)
+    vector = index.vectors(source_pool, [source])[0]
+
+    allergies = parse_allergies(allergies)
+    excluded = get_exclusion_mask(food_data, allergies)[index.pool.rows] if allergies else None
+
+    # One extra neighbor, the food itself is usually the closest
+    distances, entries = index.query(vector, k + 1, excluded)
+
+    substitutes = []
+    for distance, i in zip(distances.tolist(), entries.tolist()):
+        food = index.pool.food(i)
+        if food["name"] == food_name:
+            continue
+        del food["servings"]
+        food["similarity"] = 1 / (1 + distance)
+        substitutes.append(food)
+
+    return substitutes[:k]
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from utils.allergy_index import get_exclusion_mask
+from utils.data_processing import filter_foods_by_preference
+from utils.datasets import get_dataset_artifact
+
+# Candidates looked at per meal, like the first rows of a shuffled table
+MEAL_SEARCH_LIMIT = 50
+
+class FoodPool:
+    """
+    Candidate foods for meal planning as plain NumPy arrays
+
+    Entry i describes the food in row rows[i] of the food DataFrame the pool
+    was built from. Missing macro values are stored as 0. valid marks foods
+    with a known, positive calorie count; only those are ever selected.
+    """
+    def __init__(self, rows, names, calories, protein, carbs, fat):
+        self.rows = rows
+        self.names = names
+        self.calories = calories
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+        self.valid = ~np.isnan(calories) & (calories > 0)
+        # Plain float rows, cheaper than array indexing for the few foods of a meal
+        self._nutrient_rows = list(zip(calories.tolist(), protein.tolist(), carbs.tolist(), fat.tolist()))
+        self._name_index = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def index_of(self, name):
+        """
+        Pool index of the first food with this name, or None if it is not in the pool
+        """
+        if self._name_index is None:
+            name_index = {}
+            for i, food_name in enumerate(self.names):
+                name_index.setdefault(food_name, i)
+            self._name_index = name_index
+        return self._name_index.get(name)
+
+    def subset(self, keep):
+        """
+        Pool of the entries selected by a boolean mask over pool indices
+        """
+        names = [name for name, kept in zip(self.names, keep.tolist()) if kept]
+        return FoodPool(self.rows[keep], names, self.calories[keep], self.protein[keep],
+                        self.carbs[keep], self.fat[keep])
+
+    def food(self, i, servings=1):
+        """
+        Food entry in the meal plan format for pool index i
+        """
+        calories, protein, carbs, fat = self._nutrient_rows[i]
+        return {
+            "name": self.names[i],
+            "servings": servings,
+            "calories": calories * servings,
+            "protein": protein * servings,
+            "carbs": carbs * servings,
+            "fat": fat * servings
+        }
+
+def build_food_pool(food_data, diet='both'):
+    """
+    Build the candidate pool of foods matching a diet preference
+
+    Parameters:
+    - food_data: DataFrame with food nutrition data
+    - diet: Diet preference, as for filter_foods_by_preference
+
+    Returns:
+    - FoodPool
+    """
+    if not food_data.index.is_unique:
+        food_data = food_data.reset_index(drop=True)
+    filtered_foods = filter_foods_by_preference(food_data, diet)
+    rows = food_data.index.get_indexer(filtered_foods.index)
+
+    if 'Food Name' in filtered_foods.columns:
+        names = filtered_foods['Food Name'].fillna('').astype(str).tolist()
+    else:
+        names = [f"Food {row}" for row in rows]
+
+    def column(name, fill):
+        if name not in filtered_foods.columns:
+            return np.full(len(filtered_foods), fill)
+        values = pd.to_numeric(filtered_foods[name], errors='coerce').to_numpy(dtype=np.float64)
+        return np.where(np.isnan(values), fill, values)
+
+    return FoodPool(
+        rows,
+        names,
+        column('Calories', np.nan),
+        column('Protein', 0.0),
+        column('Carbs', 0.0),
+        column('Total Fat', 0.0)
+    )
+
+def get_food_pool(food_data, diet='both', allergies=()):
+    """
+    Get the candidate pool for a diet, built once per food dataset version
+
+    Only the pool of the diet is cached. A pool for a set of allergies is
+    cut down from it with the allergies' exclusion mask on every call, so
+    free-text allergies do not each keep a pool of their own.
+
+    Parameters:
+    - food_data: DataFrame with food nutrition data
+    - diet: Diet preference, as for filter_foods_by_preference
+    - allergies: Tuple of allergy names from parse_allergies; foods they
+      rule out are left out of the pool
+    """
+    diet = (diet or 'both').lower()
+    pool = get_dataset_artifact(food_data, ('food_pool', diet), lambda data: build_food_pool(data, diet))
+    if allergies:
+        pool = pool.subset(~get_exclusion_mask(food_data, allergies)[pool.rows])
+    return pool
+
+def select_meal_foods(pool, rng, target_calories, num_foods, search_limit=MEAL_SEARCH_LIMIT, allowed=None):
+    """
+    Pick foods for one meal
+
+    Looks at search_limit random candidates and greedily takes foods while
+    the meal stays within 110% of target_calories, stopping once num_foods
+    foods are chosen.
+
+    Parameters:
+    - pool: FoodPool to choose from
+    - rng: numpy.random.Generator
+    - target_calories: Calorie target for the meal
+    - num_foods: Number of foods to choose
+    - search_limit: Number of random candidates to look at
+    - allowed: Optional boolean mask of pool entries that may be used
+
+    Returns:
+    - List of (pool index, servings) pairs, one serving each
+    """
+    count = min(len(pool), search_limit)
+    if count == 0:
+        return []
+
+    # Drawing without replacement gives the same candidates as the head of a
+    # full shuffle without permuting the whole pool
+    candidates = rng.choice(len(pool), size=count, replace=False)
+    usable = pool.valid[candidates]
+    if allowed is not None:
+        usable &= allowed[candidates]
+    candidates = candidates[usable]
+
+    limit = target_calories * 1.1
+
+    selected = []
+    meal_calories = 0.0
+    for i, food_calories in zip(candidates.tolist(), pool.calories[candidates].tolist()):
+        if meal_calories + food_calories <= limit:
+            selected.append(i)
+            meal_calories += food_calories
+
+            # A full meal takes no more foods, whether or not it reached 80%
+            if len(selected) >= num_foods:
+                break
+
+    return [(i, 1) for i in selected]
+
+def meal_totals(pool, selection):
+    """
+    Calories, protein, carbs and fat of a list of (pool index, servings) pairs
+    """
+    calories = protein = carbs = fat = 0.0
+    for i, servings in selection:
+        food_calories, food_protein, food_carbs, food_fat = pool._nutrient_rows[i]
+        calories += food_calories * servings
+        protein += food_protein * servings
+        carbs += food_carbs * servings
+        fat += food_fat * servings
+    return calories, protein, carbs, fat
@@ -0,0 +1,199 @@
+import time
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+# Total solver time for one plan, in seconds
+MEAL_SOLVER_TIME_LIMIT = 10.0
+
+# Random candidate foods offered to the solver per day
+SOLVER_CANDIDATES = 40
+
+# Foods and servings per meal
+MIN_FOODS_PER_MEAL = 2
+MAX_FOODS_PER_MEAL = 4
+MAX_SERVINGS = 3
+
+# Largest share of a meal's calorie target one food may take, so the foods
+# can be spread evenly over the meals
+MAX_FOOD_MEAL_SHARE = 0.75
+
+# Deviations within this fraction of a target are not penalized. A day
+# inside every band scores 0, which lets the solver stop as soon as it finds one
+TARGET_TOLERANCE = 0.03
+
+def solve_day_meals(pool, rng, daily_calories, macros, meals_per_day, allowed=None,
+                    time_limit=MEAL_SOLVER_TIME_LIMIT, candidate_count=SOLVER_CANDIDATES,
+                    tolerance=TARGET_TOLERANCE):
+    """
+    Choose foods and servings for one day with a mixed-integer program
+
+    The program picks foods of 1 to MAX_SERVINGS servings, each within
+    MAX_FOOD_MEAL_SHARE of a meal's calories, so that the day's
+    calories, protein, carbs and fat deviate as little as possible from
+    their targets, relative to each target. Deviations inside tolerance
+    are free. The chosen foods are then spread over the
+    meals by split_into_meals, so every meal gets MIN_FOODS_PER_MEAL to
+    MAX_FOODS_PER_MEAL foods and a similar share of the calories.
+
+    Parameters:
+    - pool: FoodPool to choose from
+    - rng: numpy.random.Generator used to pick the day's candidate foods
+    - daily_calories: Calorie target for the day
+    - macros: Dict with protein, carbs and fat targets in grams
+    - meals_per_day: Number of meals
+    - allowed: Optional boolean mask of pool entries that may be used
+    - time_limit: Solver time limit in seconds
+    - candidate_count: Number of candidate foods offered to the solver
+    - tolerance: Free deviation as a fraction of the targets, either one
+      value or one per target (calories, protein, carbs, fat)
+
+    Returns:
+    - List with one list of (pool index, servings) pairs per meal, or None
+      if no solution was found in time
+    """
+    # Foods whose single serving would not fit in a meal are left out
+    food_cap = daily_calories / meals_per_day * MAX_FOOD_MEAL_SHARE
+    eligible = pool.valid & (pool.calories <= food_cap)
+    if allowed is not None:
+        eligible &= allowed
+    eligible = np.flatnonzero(eligible)
+    if len(eligible) < MIN_FOODS_PER_MEAL * meals_per_day or time_limit <= 0:
+        return None
+
+    candidates = rng.choice(eligible, size=min(candidate_count, len(eligible)), replace=False)
+    k = len(candidates)
+    max_servings = np.minimum(MAX_SERVINGS, np.floor(food_cap / pool.calories[candidates]))
+
+    # Nutrient rows: calories, protein, carbs, fat per serving of each candidate
+    nutrients = np.vstack([pool.calories[candidates], pool.protein[candidates],
+                           pool.carbs[candidates], pool.fat[candidates]])
+    targets = np.array([daily_calories, macros['protein'], macros['carbs'], macros['fat']], dtype=np.float64)
+    t = len(targets)
+
+    # Variables: servings s[food], used flags y[food], then for every target
+    # a positive and a negative deviation and a slack bounded by the tolerance
+    n_vars = 2 * k + 3 * t
+    s_cols = np.arange(k)
+    y_cols = k + np.arange(k)
+    pos_cols = 2 * k + np.arange(t)
+    neg_cols = pos_cols + t
+    slack_cols = neg_cols + t
+
+    a = np.zeros((2 * k + 1 + t, n_vars))
+    lower = np.zeros(len(a))
+    upper = np.zeros(len(a))
+
+    # A food has servings exactly when it is used: y <= s <= max_servings * y
+    a[np.arange(k), s_cols] = 1
+    a[np.arange(k), y_cols] = -1
+    lower[:k], upper[:k] = 0, np.inf
+    a[k + np.arange(k), s_cols] = 1
+    a[k + np.arange(k), y_cols] = -max_servings
+    lower[k:2 * k], upper[k:2 * k] = -np.inf, 0
+
+    # Enough foods to fill every meal, not more than the meals can hold
+    a[2 * k, y_cols] = 1
+    lower[2 * k] = MIN_FOODS_PER_MEAL * meals_per_day
+    upper[2 * k] = MAX_FOODS_PER_MEAL * meals_per_day
+
+    # Day totals minus deviations hit the targets exactly
+    target_rows = 2 * k + 1 + np.arange(t)
+    a[np.ix_(target_rows, s_cols)] = nutrients
+    a[target_rows, pos_cols] = -1
+    a[target_rows, neg_cols] = 1
+    a[target_rows, slack_cols] = 1
+    lower[target_rows] = targets
+    upper[target_rows] = targets
+
+    # Deviations are scaled by their target so every term is relative
+    objective = np.zeros(n_vars)
+    objective[pos_cols] = 1 / np.maximum(targets, 1)
+    objective[neg_cols] = 1 / np.maximum(targets, 1)
+
+    lower_bounds = np.zeros(n_vars)
+    lower_bounds[slack_cols] = -targets * tolerance
+    upper_bounds = np.full(n_vars, np.inf)
+    upper_bounds[s_cols] = max_servings
+    upper_bounds[y_cols] = 1
+    upper_bounds[slack_cols] = targets * tolerance
+    integrality = np.zeros(n_vars)
+    integrality[:2 * k] = 1
+
+    result = milp(
+        objective,
+        constraints=LinearConstraint(a, lower, upper),
+        bounds=Bounds(lower_bounds, upper_bounds),
+        integrality=integrality,
+        options={"time_limit": time_limit}
+    )
+
+    if result.x is None:
+        return None
+
+    servings = np.rint(result.x[s_cols]).astype(int)
+    chosen = [(int(candidates[i]), int(servings[i])) for i in np.flatnonzero(servings)]
+    return split_into_meals(pool, chosen, daily_calories, meals_per_day)
+
+def split_into_meals(pool, chosen, daily_calories, meals_per_day):
+    """
+    Spread a day's foods over its meals with similar calories per meal
+
+    Foods are handed out largest first, each to the meal furthest below an
+    even share of daily_calories, while keeping every meal between
+    MIN_FOODS_PER_MEAL and MAX_FOODS_PER_MEAL foods.
+
+    Parameters:
+    - pool: FoodPool the foods were chosen from
+    - chosen: List of (pool index, servings) pairs for the day
+    - daily_calories: Calorie target for the day
+    - meals_per_day: Number of meals
+
+    Returns:
+    - List with one list of (pool index, servings) pairs per meal
+    """
+    meal_target = daily_calories / meals_per_day
+    meals = [[] for _ in range(meals_per_day)]
+    loads = np.zeros(meals_per_day)
+    counts = np.zeros(meals_per_day, dtype=int)
+
+    item_calories = [float(pool.calories[i]) * servings for i, servings in chosen]
+    order = np.argsort(item_calories, kind='stable')[::-1]
+
+    for position, item in enumerate(order):
+        items_left = len(order) - position
+        short = np.maximum(MIN_FOODS_PER_MEAL - counts, 0)
+
+        # Save the remaining foods for meals that are still short of foods
+        if items_left <= short.sum():
+            open_meals = short > 0
+        else:
+            open_meals = counts < MAX_FOODS_PER_MEAL
+
+        room = np.where(open_meals, meal_target - loads, -np.inf)
+        meal = int(np.argmax(room))
+
+        meals[meal].append(chosen[item])
+        loads[meal] += item_calories[item]
+        counts[meal] += 1
+
+    return meals
+
+class SolverBudget:
+    """
+    Splits a plan's solver time limit across its days
+
+    Each day may use an equal share of the time that is left, so a slow
+    day leaves less for the rest instead of overrunning the plan's limit.
+    """
+    def __init__(self, time_limit, days):
+        self.deadline = time.monotonic() + time_limit
+        self.days_left = days
+
+    def next_day(self):
+        """
+        Time limit for the next day's solve, 0 once the budget is used up
+        """
+        remaining = self.deadline - time.monotonic()
+        days_left = max(self.days_left, 1)
+        self.days_left -= 1
+        return max(remaining, 0) / days_left
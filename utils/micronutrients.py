@@ -0,0 +1,220 @@
+import numpy as np
+from scipy import sparse
+from utils.allergy_index import parse_allergies
+from utils.datasets import get_dataset_artifact
+from utils.meal_engine import get_food_pool
+from utils.nutrient_matrix import NUTRIENT_COLUMNS, get_nutrient_matrix
+
+# Vitamin and mineral columns of the food dataset, Vitamin A through Zinc
+MICRONUTRIENT_COLUMNS = NUTRIENT_COLUMNS[NUTRIENT_COLUMNS.index('Vitamin A'):NUTRIENT_COLUMNS.index('Zinc') + 1]
+
+# Adult daily reference intakes (US Daily Values) in the units of the food
+# dataset's columns: µg for Vitamin B12 and Vitamin D, mg for the others
+REFERENCE_INTAKES = {
+    'Vitamin A': 0.9,
+    'Vitamin B1': 1.2,
+    'Vitamin B11': 0.4,
+    'Vitamin B12': 2.4,
+    'Vitamin B2': 1.3,
+    'Vitamin B3': 16.0,
+    'Vitamin B5': 5.0,
+    'Vitamin B6': 1.7,
+    'Vitamin C': 90.0,
+    'Vitamin D': 20.0,
+    'Vitamin E': 15.0,
+    'Vitamin K': 0.12,
+    'Calcium': 1300.0,
+    'Copper': 0.9,
+    'Iron': 18.0,
+    'Magnesium': 420.0,
+    'Manganese': 2.3,
+    'Phosphorus': 1250.0,
+    'Potassium': 4700.0,
+    'Selenium': 0.055,
+    'Zinc': 11.0
+}
+
+# Most reference intakes of a nutrient one serving of a food can plausibly
+# hold. Some foods of the dataset list their vitamins and minerals in another
+# unit, about 1000 times too high; a food over this for any nutrient is
+# flagged and its values are left out
+MAX_SERVING_SHARE = 5.0
+
+# Nutrients named per recommended food, those it covers most of the gap of
+TOP_GAP_NUTRIENTS = 3
+
+class MicronutrientTable:
+    """
+    Vitamins and minerals of every food as shares of the reference intakes
+
+    shares[i, j] is the share of nutrient columns[j]'s daily reference
+    intake in one serving of the food in row i of the food DataFrame.
+    Missing values count as 0, and so do all values of flagged foods, those
+    with a serving over MAX_SERVING_SHARE of any reference intake.
+    """
+    def __init__(self, matrix, reference_intakes=REFERENCE_INTAKES):
+        self.matrix = matrix
+        self.columns = [col for col in MICRONUTRIENT_COLUMNS
+                        if col in matrix.column_index and col in reference_intakes]
+        self.reference = np.array([reference_intakes[col] for col in self.columns], dtype=np.float64)
+
+        amounts = np.asarray(matrix.columns_for(self.columns), dtype=np.float64)
+        shares = np.nan_to_num(amounts, nan=0.0) / self.reference
+        self.flagged = (shares > MAX_SERVING_SHARE).any(axis=1)
+        shares[self.flagged] = 0.0
+        self.shares = shares
+
+        if 'Calories' in matrix.column_index:
+            self.calories = np.nan_to_num(np.asarray(matrix.column('Calories'), dtype=np.float64), nan=0.0)
+        else:
+            self.calories = np.zeros(len(matrix))
+
+    def __len__(self):
+        return len(self.matrix)
+
+def get_micronutrient_table(food_data):
+    """
+    Get the micronutrient table of a food DataFrame, built once per dataset version
+    """
+    return get_dataset_artifact(food_data, 'micronutrient_table',
+                                lambda data: MicronutrientTable(get_nutrient_matrix(data)))
+
+def servings_matrix(days, table):
+    """
+    Sparse (days x foods) matrix of the servings of each food eaten on each day
+
+    Foods of the plan that are not in the food table are left out.
+
+    Returns:
+    - Tuple: (scipy.sparse CSR matrix, number of food entries not found,
+      number of food entries of flagged foods)
+    """
+    day_indices = []
+    food_rows = []
+    servings = []
+    missing = 0
+    flagged = 0
+    for d, day in enumerate(days):
+        for meal in day['meals']:
+            for food in meal['foods']:
+                row = table.matrix.row_for(food['name'])
+                if row is None:
+                    missing += 1
+                    continue
+                flagged += int(table.flagged[row])
+                day_indices.append(d)
+                food_rows.append(row)
+                servings.append(food.get('servings', 1))
+
+    # Repeated (day, food) pairs are summed
+    servings = sparse.csr_matrix((np.array(servings, dtype=np.float64), (day_indices, food_rows)),
+                                 shape=(len(days), len(table)))
+    return servings, missing, flagged
+
+def plan_micronutrients(meal_plan, food_data, day=None):
+    """
+    Vitamin and mineral intake of a meal plan against the reference intakes
+
+    The intake of every day is one sparse matrix product of the plan's
+    servings with the foods' micronutrient table.
+
+    Parameters:
+    - meal_plan: Meal plan dict from generate_meal_plan
+    - food_data: DataFrame the plan was made from
+    - day: Day number to measure on its own, or None for every day
+
+    Returns:
+    - Dict with:
+      - columns: Nutrient names
+      - reference: Daily reference intakes per nutrient, in the units of
+        REFERENCE_INTAKES
+      - day_totals: (days x nutrients) intake of each measured day
+      - day_coverage: day_totals as shares of the reference intakes
+      - coverage: Average daily share of each reference intake
+      - missing_foods: Plan food entries not found in the food table
+      - flagged_foods: Plan food entries of flagged foods, left out of the totals
+    """
+    table = get_micronutrient_table(food_data)
+    days = meal_plan.get('days', [])
+    if day is not None:
+        days = [plan_day for plan_day in days if plan_day['day'] == day]
+
+    servings, missing, flagged = servings_matrix(days, table)
+    day_coverage = np.asarray(servings @ table.shares)
+
+    return {
+        "columns": table.columns,
+        "reference": table.reference,
+        "day_totals": day_coverage * table.reference,
+        "day_coverage": day_coverage,
+        "coverage": day_coverage.mean(axis=0) if len(days) else np.zeros(len(table.columns)),
+        "missing_foods": missing,
+        "flagged_foods": flagged
+    }
+
+def micronutrient_gaps(coverage):
+    """
+    Share of each reference intake still missing, between 0 and 1
+    """
+    return np.clip(1 - np.asarray(coverage), 0, 1)
+
+def recommend_gap_foods(meal_plan, food_data, user_data=None, day=None, k=5, max_calories=None):
+    """
+    Recommend foods that fill a meal plan's vitamin and mineral gaps
+
+    A serving of a food scores by how much of the missing reference intakes
+    it covers, counting each nutrient only up to its gap, as a share of the
+    total gap. Scores of all candidate foods are one capped matrix product.
+
+    Parameters:
+    - meal_plan: Meal plan dict from generate_meal_plan
+    - food_data: DataFrame the plan was made from
+    - user_data: Optional dict with the user's 'diet' and 'allergies';
+      only foods matching them are recommended
+    - day: Day number whose gaps to fill, or None for the plan's daily average
+    - k: Number of foods to recommend
+    - max_calories: Optional most calories per serving of a recommended food
+
+    Returns:
+    - List of food dicts with name, calories, gap_filled (share of the total
+      gap one serving covers) and nutrients (the nutrients it covers most of),
+      best first. Flagged foods are never recommended. Empty when nothing is
+      missing
+    """
+    report = plan_micronutrients(meal_plan, food_data, day)
+    gaps = micronutrient_gaps(report["coverage"])
+    total_gap = gaps.sum()
+    if total_gap <= 0 or k <= 0:
+        return []
+
+    user_data = user_data or {}
+    pool = get_food_pool(food_data, user_data.get('diet', 'both'), parse_allergies(user_data.get('allergies')))
+    table = get_micronutrient_table(food_data)
+    rows = pool.rows[pool.valid]
+    rows = rows[~table.flagged[rows]]
+    if max_calories is not None:
+        rows = rows[table.calories[rows] <= max_calories]
+    if len(rows) == 0:
+        return []
+
+    filled = np.minimum(table.shares[rows], gaps)
+    scores = filled.sum(axis=1) / total_gap
+
+    k = min(k, len(rows))
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+    top = top[np.lexsort((rows[top], -scores[top]))]
+    top = top[scores[top] > 0]
+
+    # The nutrients each recommended food covers most of the gap of
+    strongest = np.argsort(-filled[top], axis=1)[:, :TOP_GAP_NUTRIENTS]
+
+    return [
+        {
+            "name": str(table.matrix.food_names[row]),
+            "calories": float(table.calories[row]),
+            "gap_filled": float(score),
+            "nutrients": [table.columns[j] for j, amount in zip(nutrients, food_filled[nutrients]) if amount > 0]
+        }
+        for row, score, nutrients, food_filled in zip(rows[top].tolist(), scores[top].tolist(),
+                                                      strongest.tolist(), filled[top])
+    ]
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils.datasets import get_dataset_artifact
+
+NUTRIENT_MATRIX_DIR = 'attached_assets/.cache'
+
+# All nutrient columns of the food dataset, in matrix column order
+NUTRIENT_COLUMNS = ['Calories', 'Total Fat', 'Saturated Fat', 'Monounsaturated Fat',
+                    'Polyunsaturated Fat', 'Carbs', 'Sugar', 'Protein', 'Dietary Fiber',
+                    'Cholesterol', 'Sodium', 'Water', 'Vitamin A', 'Vitamin B1',
+                    'Vitamin B11', 'Vitamin B12', 'Vitamin B2', 'Vitamin B3', 'Vitamin B5',
+                    'Vitamin B6', 'Vitamin C', 'Vitamin D', 'Vitamin E', 'Vitamin K',
+                    'Calcium', 'Copper', 'Iron', 'Magnesium', 'Manganese', 'Phosphorus',
+                    'Potassium', 'Selenium', 'Zinc', 'Nutrition Density']
+
+class NutrientMatrix:
+    """
+    Foods x nutrients matrix of float32 values backed by a memory-mapped file
+
+    Row i holds the nutrients of food_names[i], which is also row i of the
+    DataFrame the matrix was built from. Because the values live in a
+    memory-mapped .npy file, worker processes that open the same file share
+    the pages instead of copying them. Missing values are stored as NaN.
+    """
+    def __init__(self, values, columns, food_names, path=None):
+        self.values = values
+        self.columns = list(columns)
+        self.food_names = food_names
+        self.path = path
+        self.column_index = {col: i for i, col in enumerate(self.columns)}
+        self._name_index = None
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def name_index(self):
+        """
+        Lookup table from lowercase food name to the first matching row
+        """
+        if self._name_index is None:
+            name_index = {}
+            for i, name in enumerate(self.food_names.tolist()):
+                name_index.setdefault(name.lower(), i)
+            self._name_index = name_index
+        return self._name_index
+
+    def column(self, name):
+        """
+        Get one nutrient column as a view into the matrix
+        """
+        return self.values[:, self.column_index[name]]
+
+    def columns_for(self, names):
+        """
+        Get several nutrient columns as an (foods x len(names)) array
+        """
+        return self.values[:, [self.column_index[name] for name in names]]
+
+    def row_for(self, food_name):
+        """
+        Get the row index of a food by name, or None if it is not present
+        """
+        return self.name_index.get(str(food_name).lower())
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a persisted matrix read-only without loading it into memory
+
+        Parameters:
+        - path: Path of the .npy file written by build_nutrient_matrix
+
+        Returns:
+        - NutrientMatrix whose values are a read-only memory map
+        """
+        values = np.load(path, mmap_mode='r')
+        with open(_names_path(path), 'r') as f:
+            table = json.load(f)
+        food_names = np.array(table['food_names'], dtype=str)
+        return cls(values, table['columns'], food_names, path=path)
+
+def build_nutrient_matrix(food_data, path=None):
+    """
+    Build a nutrient matrix from the food DataFrame
+
+    Parameters:
+    - food_data: DataFrame with food nutrition data
+    - path: Where to persist the matrix. Defaults to a file in
+      NUTRIENT_MATRIX_DIR named after a hash of the data, so an existing file
+      for the same data is reused instead of rebuilt
+
+    Returns:
+    - NutrientMatrix memory-mapped from the persisted file, or held in memory
+      if the file cannot be written
+    """
+    columns = [col for col in NUTRIENT_COLUMNS if col in food_data.columns]
+    if 'Food Name' in food_data.columns:
+        food_names = food_data['Food Name'].fillna('').astype(str).to_numpy(dtype=str)
+    else:
+        food_names = np.array([f"Food {i}" for i in range(len(food_data))], dtype=str)
+
+    if path is None:
+        path = os.path.join(NUTRIENT_MATRIX_DIR, f"nutrients_{_data_digest(food_data, columns)}.npy")
+
+    if os.path.exists(path) and os.path.exists(_names_path(path)):
+        try:
+            return NutrientMatrix.open(path)
+        except Exception as e:
+            print(f"Rebuilding unreadable nutrient matrix: {e}")
+
+    values = np.empty((len(food_data), len(columns)), dtype=np.float32)
+    for j, col in enumerate(columns):
+        values[:, j] = pd.to_numeric(food_data[col], errors='coerce').to_numpy(dtype=np.float64)
+
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # Write both files under temporary names and move them into place
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, values)
+        tmp_names_path = f"{_names_path(path)}.{os.getpid()}.tmp"
+        with open(tmp_names_path, 'w') as f:
+            json.dump({"columns": columns, "food_names": food_names.tolist()}, f)
+
+        os.replace(tmp_names_path, _names_path(path))
+        os.replace(tmp_path, path)
+        return NutrientMatrix.open(path)
+    except Exception as e:
+        print(f"Error writing nutrient matrix: {e}")
+        return NutrientMatrix(values, columns, food_names)
+
+def get_nutrient_matrix(food_data):
+    """
+    Get the nutrient matrix for a food DataFrame, built once per dataset version
+    """
+    return get_dataset_artifact(food_data, 'nutrient_matrix', build_nutrient_matrix)
+
+def _data_digest(food_data, columns):
+    """
+    Short content hash of the names and nutrient columns of a food DataFrame
+    """
+    hashed = pd.util.hash_pandas_object(
+        food_data[[col for col in ['Food Name'] + columns if col in food_data.columns]],
+        index=False
+    )
+    digest = hashlib.sha256(hashed.to_numpy().tobytes())
+    digest.update(json.dumps(columns).encode())
+    return digest.hexdigest()[:16]
+
+def _names_path(path):
+    """
+    Path of the column and food name table stored next to a matrix file
+    """
+    return os.path.splitext(path)[0] + '.names.json'
@@ -0,0 +1,343 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from utils.allergy_index import ExclusionCache, FoodTokenIndex, parse_allergies
+from utils.data_processing import calculate_calorie_needs, calculate_macros
+from utils.meal_engine import FoodPool, get_food_pool
+from utils.meal_solver import MEAL_SOLVER_TIME_LIMIT
+from utils.plan_cache import plan_cache_key, get_cached_plan, cache_plan
+from utils.recommendations import (batch_planning_jobs, build_meal_plan, generate_meal_plans_batch,
+                                   planning_profile, new_plan_seed, BATCH_CHUNK_SIZE)
+from utils.variety import MAX_WEEKLY_REPEATS, MIN_REPEAT_GAP_DAYS
+
+# Diets with a food pool of their own. Any other preference plans from all
+# foods, as filter_foods_by_preference does
+SHARED_DIETS = ("both", "vegetarian", "vegan")
+
+# Users sent to a worker per task, and tasks in flight per worker
+PARALLEL_TASK_SIZE = 200
+TASKS_PER_WORKER = 2
+
+# Nutrient arrays of a FoodPool, in the order they are stored in shared memory
+POOL_NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+class SharedFoodPools:
+    """
+    The food pools of every diet packed into two shared memory blocks
+
+    One block holds the nutrient arrays of all pools side by side, the
+    other their row numbers. The creating process owns the blocks and
+    removes them in close(); worker processes only attach to them.
+    """
+    def __init__(self, food_data):
+        pools = {diet: get_food_pool(food_data, diet) for diet in SHARED_DIETS}
+        self.total = sum(len(pool) for pool in pools.values())
+
+        # Shared memory blocks cannot be empty
+        self.values_block = shared_memory.SharedMemory(create=True, size=max(self.total * len(POOL_NUTRIENTS) * 8, 1))
+        self.rows_block = shared_memory.SharedMemory(create=True, size=max(self.total * 8, 1))
+        values, rows = attach_pool_arrays(self.values_block, self.rows_block, self.total)
+
+        # Diet -> (offset, length, food names)
+        self.layout = {}
+        offset = 0
+        for diet, pool in pools.items():
+            end = offset + len(pool)
+            for n, nutrient in enumerate(POOL_NUTRIENTS):
+                values[n, offset:end] = getattr(pool, nutrient)
+            rows[offset:end] = pool.rows
+            self.layout[diet] = (offset, len(pool), pool.names)
+            offset = end
+
+    def spec(self):
+        """
+        What a worker needs to attach to the pools, small enough to send to every worker
+        """
+        return self.values_block.name, self.rows_block.name, self.total, self.layout
+
+    def close(self):
+        """
+        Release and remove the shared memory blocks
+        """
+        for block in (self.values_block, self.rows_block):
+            block.close()
+            block.unlink()
+
+def attach_pool_arrays(values_block, rows_block, total):
+    """
+    NumPy views of the nutrient and row arrays in the shared memory blocks
+    """
+    values = np.ndarray((len(POOL_NUTRIENTS), total), dtype=np.float64, buffer=values_block.buf)
+    rows = np.ndarray(total, dtype=np.int64, buffer=rows_block.buf)
+    return values, rows
+
+# State of a worker process, set up once by _init_worker
+_worker_blocks = None
+_worker_pools = None
+# Exclusion bitmaps of each diet's pool, kept for the allergy sets the
+# worker's users need most recently
+_worker_exclusions = {}
+
+def _init_worker(spec):
+    """
+    Attach a worker process to the shared food pools
+    """
+    global _worker_blocks, _worker_pools
+    values_name, rows_name, total, layout = spec
+
+    values_block = shared_memory.SharedMemory(name=values_name)
+    rows_block = shared_memory.SharedMemory(name=rows_name)
+    values, rows = attach_pool_arrays(values_block, rows_block, total)
+    values.flags.writeable = False
+    rows.flags.writeable = False
+
+    pools = {}
+    for diet, (offset, length, names) in layout.items():
+        end = offset + length
+        pools[diet] = FoodPool(rows[offset:end], names, *values[:, offset:end])
+
+    # The blocks must stay open while the views are in use
+    _worker_blocks = (values_block, rows_block)
+    _worker_pools = pools
+
+def _worker_pool(diet, allergies):
+    """
+    Food pool of a diet in a worker, without the foods the allergies rule out
+
+    The pool is cut down from the shared pool with a token index over its
+    names, which picks the same foods as get_food_pool in the main process.
+    """
+    if diet not in _worker_pools:
+        diet = "both"
+    pool = _worker_pools[diet]
+    if not allergies:
+        return pool
+
+    if diet not in _worker_exclusions:
+        _worker_exclusions[diet] = ExclusionCache(FoodTokenIndex(pool.names))
+    return pool.subset(~_worker_exclusions[diet].mask(allergies))
+
+def _plan_users(jobs, options):
+    """
+    Worker task: plan a list of users from the shared food pools
+
+    Returns:
+    - List of (user_id, meal plan dict) pairs in job order
+    """
+    days, meals_per_day, method, time_limit, variety = options
+    results = []
+
+    for user_id, user_data, diet, seed, daily_calories, macros in jobs:
+        pool = _worker_pool(diet, parse_allergies(user_data.get('allergies')))
+
+        if len(pool) == 0:
+            results.append((user_id, {"error": "No foods available that match your dietary preferences"}))
+            continue
+
+        results.append((user_id, build_meal_plan(pool, seed, user_data, daily_calories, macros,
+                                                 days, meals_per_day, method, time_limit, variety)))
+
+    return results
+
+class PlanningPool:
+    """
+    Plans meals in worker processes that share the food pools read-only
+
+    The food pools of every diet are copied into shared memory once, so
+    workers start without a copy of the food table. Plans are built from
+    the same seeds as in a single process, so results do not depend on the
+    number of workers, except for solved days that run out of time.
+
+    Use as a context manager, or call close() when done.
+    """
+    def __init__(self, food_data, workers=None):
+        if 'Calories' not in food_data.columns:
+            raise ValueError("Food data is missing calorie information")
+
+        self.food_data = food_data
+        self.workers = workers or os.cpu_count() or 1
+        self.shared = SharedFoodPools(food_data)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.shared.spec(),)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop the workers and remove the shared memory
+        """
+        self.executor.shutdown()
+        self.shared.close()
+
+    def submit_meal_plan(self, user_data, days=7, meals_per_day=3, method='greedy',
+                         time_limit=MEAL_SOLVER_TIME_LIMIT, seed=None,
+                         max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS):
+        """
+        Start planning one user in a worker process
+
+        Takes the same options as generate_meal_plan and gives the same plan
+        for the same seed, using the plan cache the same way.
+
+        Returns:
+        - concurrent.futures.Future with the meal plan dict
+        """
+        profile = planning_profile(user_data)
+        diet = (user_data.get('diet') or 'both').lower()
+        allergies = parse_allergies(user_data.get('allergies'))
+        variety = (max_weekly_repeats, min_repeat_gap)
+
+        if seed is None:
+            seed = new_plan_seed()
+            cache_key = None
+        else:
+            cache_key = plan_cache_key(profile, diet, self.food_data, days, meals_per_day, method,
+                                       time_limit, seed, variety, allergies)
+
+        if cache_key is not None:
+            meal_plan = get_cached_plan(cache_key)
+            if meal_plan is not None:
+                meal_plan["user"] = user_data.get('name', 'User')
+                done = Future()
+                done.set_result(meal_plan)
+                return done
+
+        weight, height, age, gender, activity_level, goal = profile
+        daily_calories = calculate_calorie_needs(weight, height, age, gender, activity_level, goal)
+        macros = calculate_macros(daily_calories, goal)
+
+        job = (None, user_data, diet, seed, daily_calories, macros)
+        task = self.executor.submit(_plan_users, [job], (days, meals_per_day, method, time_limit, variety))
+
+        result = Future()
+
+        def finish(task):
+            try:
+                meal_plan = task.result()[0][1]
+            except Exception as e:
+                result.set_exception(e)
+                return
+            if cache_key is not None and "error" not in meal_plan:
+                cache_plan(cache_key, meal_plan)
+            result.set_result(meal_plan)
+
+        task.add_done_callback(finish)
+        return result
+
+    def generate_meal_plan(self, user_data, **options):
+        """
+        Plan one user in a worker process and wait for the plan
+        """
+        return self.submit_meal_plan(user_data, **options).result()
+
+    def generate_meal_plans(self, users, days=7, meals_per_day=3, method='greedy',
+                            time_limit=MEAL_SOLVER_TIME_LIMIT, chunk_size=BATCH_CHUNK_SIZE, seed=None,
+                            max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS,
+                            task_size=PARALLEL_TASK_SIZE):
+        """
+        Plan many users across the workers
+
+        Takes the same arguments as generate_meal_plans_batch and yields the
+        same plans in the same order. Targets and seeds are worked out in
+        this process, users are sent to the workers task_size at a time,
+        with at most TASKS_PER_WORKER tasks per worker waiting.
+
+        Yields:
+        - (user_id, meal plan dict) pairs in input order
+        """
+        options = (days, meals_per_day, method, time_limit, (max_weekly_repeats, min_repeat_gap))
+        jobs = batch_planning_jobs(users, chunk_size, seed)
+        pending = deque()
+
+        while True:
+            task = []
+            for job in jobs:
+                task.append(job)
+                if len(task) >= task_size:
+                    break
+
+            if task:
+                pending.append(self.executor.submit(_plan_users, task, options))
+
+            # Wait for the oldest task once enough are queued, or at the end
+            while pending and (not task or len(pending) >= self.workers * TASKS_PER_WORKER):
+                yield from pending.popleft().result()
+
+            if not task:
+                break
+
+def make_benchmark_users(count, seed=0):
+    """
+    Random but reproducible user profiles for benchmarks
+    """
+    rng = np.random.default_rng(seed)
+    goals = ["Weight Loss", "Weight Gain", "Maintain Weight", "Muscle Gain"]
+    diets = ["both", "vegetarian", "vegan", "non-vegetarian"]
+    activity_levels = ["sedentary", "lightly_active", "moderately_active", "very_active", "extra_active"]
+    allergies = ["None", "None", "peanuts", "dairy", "shellfish, gluten"]
+
+    return {
+        f"bench_{i}": {
+            "name": f"bench user {i}",
+            "gender": "male" if rng.random() < 0.5 else "female",
+            "age": int(rng.integers(18, 70)),
+            "height": float(rng.integers(150, 200)),
+            "weight": float(rng.integers(50, 120)),
+            "goal": goals[rng.integers(len(goals))],
+            "diet": diets[rng.integers(len(diets))],
+            "activity_level": activity_levels[rng.integers(len(activity_levels))],
+            "allergies": allergies[rng.integers(len(allergies))]
+        }
+        for i in range(count)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark meal planning across worker processes")
+    parser.add_argument("--users", type=int, default=2000, help="Number of generated users")
+    parser.add_argument("--days", type=int, default=7, help="Days per plan")
+    parser.add_argument("--method", choices=["greedy", "solver"], default="greedy", help="Planning method")
+    parser.add_argument("--workers", type=int, nargs="+", help="Worker counts to run, defaults to 1, 2, 4 ... up to the CPU count")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the users and plans")
+    args = parser.parse_args()
+
+    from utils.datasets import get_dataset
+    food_data = get_dataset("food_data")
+    users = make_benchmark_users(args.users, args.seed)
+
+    worker_counts = args.workers
+    if not worker_counts:
+        cpus = os.cpu_count() or 1
+        worker_counts = sorted({min(2 ** n, cpus) for n in range(cpus.bit_length() + 1)})
+
+    options = {"days": args.days, "method": args.method, "seed": args.seed}
+
+    start = time.perf_counter()
+    expected = list(generate_meal_plans_batch(users, food_data, **options))
+    serial = time.perf_counter() - start
+    print(f"{args.users} users, {args.days}-day {args.method} plans, {os.cpu_count()} CPUs")
+    print(f"single process: {serial:.2f}s ({args.users / serial:.0f} users/s)")
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        with PlanningPool(food_data, workers) as planning_pool:
+            # Starting the workers is part of the cost
+            plans = list(planning_pool.generate_meal_plans(users, **options))
+        elapsed = time.perf_counter() - start
+
+        # Solved days depend on the time limit, only greedy plans must match exactly
+        same = "same plans" if plans == expected else "plans differ"
+        print(f"{workers} workers: {elapsed:.2f}s ({args.users / elapsed:.0f} users/s, "
+              f"{serial / elapsed:.2f}x), {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import copy
+import threading
+from collections import OrderedDict
+
+# Number of meal plans kept in memory, least recently used plans are dropped first
+PLAN_CACHE_SIZE = 256
+
+_plans = OrderedDict()
+_plan_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_plan_lock = threading.Lock()
+
+def plan_cache_key(profile, diet, food_data, days, meals_per_day, method, time_limit, seed, variety, allergies=()):
+    """
+    Build the cache key of a seeded meal plan
+
+    Parameters:
+    - profile: Tuple (weight, height, age, gender, activity_level, goal)
+      as returned by planning_profile
+    - diet: Diet preference
+    - food_data: DataFrame with food nutrition data
+    - days, meals_per_day, method, time_limit, seed: Plan options
+    - variety: Tuple (max_weekly_repeats, min_repeat_gap)
+    - allergies: Tuple of allergy names from parse_allergies
+
+    Returns:
+    - Hashable key, or None if the plan cannot be cached because the food
+      data carries no dataset version or the profile is unreadable
+    """
+    version = food_data.attrs.get('dataset_version')
+    if version is None or seed is None:
+        return None
+
+    weight, height, age, gender, activity_level, goal = profile
+    try:
+        fingerprint = (
+            float(weight),
+            float(height),
+            float(age),
+            str(gender).lower(),
+            str(activity_level).lower(),
+            str(goal).lower(),
+            str(diet or 'both').lower(),
+            tuple(allergies)
+        )
+    except (TypeError, ValueError):
+        return None
+
+    # The time limit only changes solved plans
+    if method != 'solver':
+        time_limit = None
+
+    return (fingerprint, food_data.attrs.get('dataset_name'), version,
+            int(days), int(meals_per_day), method, time_limit, int(seed), tuple(variety))
+
+def get_cached_plan(key):
+    """
+    Get a copy of a cached meal plan
+
+    Returns:
+    - Meal plan dict, or None if the plan is not cached
+    """
+    with _plan_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            _plan_stats["misses"] += 1
+            return None
+        _plans.move_to_end(key)
+        _plan_stats["hits"] += 1
+
+    return copy.deepcopy(plan)
+
+def cache_plan(key, plan):
+    """
+    Store a copy of a meal plan, dropping the least recently used plans
+    beyond PLAN_CACHE_SIZE
+    """
+    plan = copy.deepcopy(plan)
+    with _plan_lock:
+        _plans[key] = plan
+        _plans.move_to_end(key)
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+            _plan_stats["evictions"] += 1
+
+def clear_plan_cache():
+    """
+    Drop every cached meal plan
+    """
+    with _plan_lock:
+        _plans.clear()
+
+def get_plan_cache_stats():
+    """
+    Get hit, miss and eviction counts of the plan cache
+
+    Returns:
+    - Dict with hits, misses, evictions and the current size
+    """
+    with _plan_lock:
+        return dict(_plan_stats, size=len(_plans))
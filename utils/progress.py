@@ -0,0 +1,198 @@
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Legacy entries record a weight change as old/new pairs instead of the
+# weight and BMI after the update
+LEGACY_PROGRESS_KEYS = {
+    "new_weight": "weight",
+    "new_bmi": "bmi"
+}
+DROPPED_PROGRESS_KEYS = ("old_weight", "old_bmi")
+
+class ProgressSeries:
+    """
+    A user's progress history as sorted, typed arrays
+
+    timestamps holds naive local times as int64 seconds since the epoch,
+    weights and bmis hold float32 values with NaN for missing measurements.
+    All three arrays are sorted by time and have the same length.
+    """
+    def __init__(self, timestamps, weights, bmis):
+        self.timestamps = timestamps
+        self.weights = weights
+        self.bmis = bmis
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def dates(self):
+        """
+        Timestamps as a datetime64[s] view, ready for plotting
+        """
+        return self.timestamps.view('datetime64[s]')
+
+    def last_date(self):
+        """
+        Time of the latest entry as a datetime, or None if there are no entries
+        """
+        if len(self) == 0:
+            return None
+        return self.dates[-1].astype(datetime)
+
+    def moving_average(self, window=7):
+        """
+        Trailing moving average of the weights over up to window entries
+
+        Missing weights are left out of the average, not counted as 0. A
+        window without any weight averages to NaN.
+        """
+        window = max(1, min(window, len(self)))
+        weights = self.weights.astype(np.float64)
+        valid = ~np.isnan(weights)
+        sums = np.cumsum(np.where(valid, weights, 0.0))
+        counts = np.cumsum(valid)
+        sums[window:] = sums[window:] - sums[:-window]
+        counts[window:] = counts[window:] - counts[:-window]
+        return np.divide(sums, counts, out=np.full(len(sums), np.nan), where=counts > 0)
+
+    def weekly_change(self):
+        """
+        Average weight change per week between the first and last entry
+
+        Returns:
+        - kg per week, or None if the entries span less than a day
+        """
+        if len(self) < 2:
+            return None
+
+        days = (int(self.timestamps[-1]) - int(self.timestamps[0])) // (24 * 3600)
+        if days < 1:
+            return None
+
+        return float(self.weights[-1] - self.weights[0]) * 7 / days
+
+    def to_dataframe(self):
+        """
+        Build a DataFrame with timestamp, weight and bmi columns
+        """
+        # Measurements are recorded with two decimals, drop float32 noise
+        return pd.DataFrame({
+            'timestamp': self.dates,
+            'weight': self.weights.astype(np.float64).round(2),
+            'bmi': self.bmis.astype(np.float64).round(2)
+        })
+
+def normalize_progress_entry(entry):
+    """
+    Convert a progress entry to the current {timestamp, weight, bmi} shape
+
+    Legacy entries with old_/new_ weight and BMI pairs keep the new values.
+    Any other keys are left untouched.
+
+    Returns:
+    - A new dict, the entry itself is not modified
+    """
+    normalized = {}
+    for key, value in entry.items():
+        if key in DROPPED_PROGRESS_KEYS:
+            continue
+        if key in LEGACY_PROGRESS_KEYS:
+            normalized.setdefault(LEGACY_PROGRESS_KEYS[key], value)
+            continue
+        # A current key wins over its legacy counterpart
+        normalized[key] = value
+
+    return normalized
+
+def normalize_progress_history(progress_history):
+    """
+    Normalize every entry of a progress history
+
+    Returns:
+    - Tuple: (normalized entries, number of entries that changed)
+    """
+    normalized = [normalize_progress_entry(entry) for entry in progress_history]
+    changed = sum(1 for old, new in zip(progress_history, normalized) if old != new)
+    return normalized, changed
+
+def build_progress_series(progress_history):
+    """
+    Build a ProgressSeries from a list of progress entries
+
+    Timestamps are parsed once here. Entries without a readable timestamp
+    are left out.
+
+    Parameters:
+    - progress_history: List of progress entry dicts, in any entry shape
+
+    Returns:
+    - ProgressSeries sorted by time
+    """
+    count = len(progress_history)
+    timestamps = np.full(count, np.datetime64('NaT'), dtype='datetime64[s]')
+    weights = np.full(count, np.nan, dtype=np.float32)
+    bmis = np.full(count, np.nan, dtype=np.float32)
+
+    for i, entry in enumerate(progress_history):
+        entry = normalize_progress_entry(entry)
+        try:
+            timestamps[i] = np.datetime64(str(entry['timestamp']).replace(' ', 'T'), 's')
+        except (KeyError, ValueError):
+            continue
+        weights[i] = _to_float(entry.get('weight'))
+        bmis[i] = _to_float(entry.get('bmi'))
+
+    valid = ~np.isnat(timestamps)
+    # A stable sort keeps entries with the same timestamp in recorded order
+    order = np.argsort(timestamps[valid], kind='stable')
+    return ProgressSeries(
+        timestamps[valid][order].view(np.int64),
+        weights[valid][order],
+        bmis[valid][order]
+    )
+
+_series_cache = {}
+_series_lock = threading.Lock()
+
+def get_progress_series(user_data, user_id=None):
+    """
+    Get the ProgressSeries of a user, reusing the last build while the
+    history is unchanged
+
+    Progress histories only grow by appending, so the cached series is
+    reused as long as the entry count and the first and last entries match.
+
+    Parameters:
+    - user_data: User record dict with a progress_history list
+    - user_id: ID of the user, used as cache key. Without it the series is
+      built every call
+
+    Returns:
+    - ProgressSeries
+    """
+    progress_history = user_data.get('progress_history') or []
+    if user_id is None:
+        return build_progress_series(progress_history)
+
+    token = (len(progress_history), repr(progress_history[:1]), repr(progress_history[-1:]))
+    with _series_lock:
+        cached = _series_cache.get(user_id)
+        if cached is not None and cached[0] == token:
+            return cached[1]
+
+    series = build_progress_series(progress_history)
+    with _series_lock:
+        _series_cache[user_id] = (token, series)
+    return series
+
+def _to_float(value):
+    """
+    Convert a stored measurement to float, NaN if missing or unreadable
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -1,32 +1,242 @@
-import pandas as pd
+import itertools
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from utils.data_processing import calculate_calorie_needs, calculate_macros, filter_foods_by_preference
+from utils.allergy_index import parse_allergies
+from utils.data_processing import (calculate_calorie_needs, calculate_macros,
+                                   calculate_calorie_needs_batch, calculate_macros_batch)
+from utils.exercise_classifier import EXERCISE_CATEGORIES
+from utils.exercise_index import get_exercise_index, exercise_records
+from utils.meal_engine import get_food_pool, select_meal_foods, meal_totals
+from utils.meal_solver import solve_day_meals, SolverBudget, MEAL_SOLVER_TIME_LIMIT, TARGET_TOLERANCE
+from utils.scoring import get_goal_scorer, get_food_ranking
+from utils.plan_cache import plan_cache_key, get_cached_plan, cache_plan
+from utils.variety import (VarietyTracker, variety_mask, plan_variety, MAX_WEEKLY_REPEATS,
+                           MIN_REPEAT_GAP_DAYS)
 
-def generate_meal_plan(user_data, food_data, days=7, meals_per_day=3):
+# Users per vectorized pass in generate_meal_plans_batch
+BATCH_CHUNK_SIZE = 1000
+
+# Smallest calorie target of a re-planned meal, as a share of an even meal
+MIN_REPLAN_MEAL_SHARE = 0.2
+
+def generate_meal_plan(user_data, food_data, days=7, meals_per_day=3, method='greedy',
+                       time_limit=MEAL_SOLVER_TIME_LIMIT, seed=None,
+                       max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS):
     """
     Generate a meal plan based on user preferences and nutritional needs
     
+    The same seed, profile, options and food dataset version always give the
+    same plan, so seeded plans are served from the plan cache when food_data
+    comes from the dataset registry. Solved days are only reproducible while
+    they finish within their share of time_limit.
+    
     Parameters:
-    - user_data: Dict containing user information
+    - user_data: Dict containing user information. Foods ruled out by its
+      'allergies' entry are never planned
     - food_data: DataFrame with food nutrition data
     - days: Number of days for the plan
     - meals_per_day: Number of meals per day
+    - method: 'greedy' picks random foods up to each meal's calorie target,
+      'solver' picks foods and servings that best match the day's calorie
+      and macro targets
+    - time_limit: Total solver time for the plan in seconds. Days that
+      cannot be solved in time fall back to the greedy method
+    - seed: Non-negative integer seed. A new seed is drawn if not given;
+      the seed used is returned in the plan's "seed" entry
+    - max_weekly_repeats: Most times a food may appear within any 7 days
+    - min_repeat_gap: Fewest days before a food may appear again, 1 allows
+      the next day and 0 the same day
     
     Returns:
-    - Dict containing meal plan information
+    - Dict containing meal plan information, with a "variety" entry
+      measuring how varied its foods are (see plan_variety)
     """
-    # Filter foods based on dietary preference
-    filtered_foods = filter_foods_by_preference(food_data, user_data.get('diet', 'both'))
+    meal_plan, plan_days = stream_meal_plan(user_data, food_data, days, meals_per_day, method, time_limit, seed,
+                                            max_weekly_repeats, min_repeat_gap)
     
-    if filtered_foods.empty:
-        return {"error": "No foods available that match your dietary preferences"}
+    for _ in plan_days:
+        pass
     
-    # Ensure 'Calories' column exists and is numeric
-    if 'Calories' not in filtered_foods.columns:
-        return {"error": "Food data is missing calorie information"}
+    return meal_plan
+
+def stream_meal_plan(user_data, food_data, days=7, meals_per_day=3, method='greedy',
+                     time_limit=MEAL_SOLVER_TIME_LIMIT, seed=None,
+                     max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS):
+    """
+    Generate a meal plan one day at a time
+    
+    Takes the same arguments as generate_meal_plan. The plan's targets are
+    known at once, its days are planned only as the returned iterator is
+    advanced, so a caller can show day 1 before the later days exist.
+    
+    Returns:
+    - Tuple: (meal plan dict, iterator of day plans). Each day is appended
+      to the plan's "days" list as it is yielded; once the iterator is
+      exhausted the plan is the one generate_meal_plan returns. On errors
+      the dict holds an error message and the iterator is empty
+    """
+    # Ensure 'Calories' column exists
+    if 'Calories' not in food_data.columns:
+        return {"error": "Food data is missing calorie information"}, iter(())
+    
+    profile = planning_profile(user_data)
+    diet = user_data.get('diet', 'both')
+    allergies = parse_allergies(user_data.get('allergies'))
+    variety = (max_weekly_repeats, min_repeat_gap)
+    
+    if seed is None:
+        seed = new_plan_seed()
+        cache_key = None
+    else:
+        cache_key = plan_cache_key(profile, diet, food_data, days, meals_per_day, method, time_limit, seed, variety,
+                                   allergies)
+    
+    if cache_key is not None:
+        meal_plan = get_cached_plan(cache_key)
+        if meal_plan is not None:
+            # The name is not part of the key, a shared plan shows the viewer's name
+            meal_plan["user"] = user_data.get('name', 'User')
+            cached_days = meal_plan["days"]
+            meal_plan["days"] = []
+            return meal_plan, collect_days(meal_plan, iter(cached_days))
+    
+    # Candidate foods for the dietary preference and allergies, as arrays shared between plans
+    pool = get_food_pool(food_data, diet, allergies)
+    
+    if len(pool) == 0:
+        return {"error": "No foods available that match your dietary preferences"}, iter(())
     
     # Calculate daily calorie needs based on user profile
+    weight, height, age, gender, activity_level, goal = profile
+    
+    daily_calories = calculate_calorie_needs(weight, height, age, gender, activity_level, goal)
+    macros = calculate_macros(daily_calories, goal)
+    
+    meal_plan = new_meal_plan(user_data, daily_calories, macros, method, seed, variety)
+    plan_days = iter_plan_days(pool, seed, daily_calories, macros, days, meals_per_day, method, time_limit, variety)
+    
+    return meal_plan, collect_days(meal_plan, plan_days, cache_key)
+
+def collect_days(meal_plan, plan_days, cache_key=None):
+    """
+    Append each day to the plan as it is yielded, measuring the plan's
+    variety and caching it once every day is done
+    """
+    for day_plan in plan_days:
+        meal_plan["days"].append(day_plan)
+        yield day_plan
+    
+    meal_plan["variety"] = plan_variety(meal_plan)
+    
+    if cache_key is not None:
+        cache_plan(cache_key, meal_plan)
+
+def generate_meal_plans_batch(users, food_data, days=7, meals_per_day=3, method='greedy',
+                              time_limit=MEAL_SOLVER_TIME_LIMIT, chunk_size=BATCH_CHUNK_SIZE, seed=None,
+                              max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS):
+    """
+    Generate meal plans for many users
+    
+    Users are read chunk_size at a time. Calorie needs and macros are
+    computed for a whole chunk in one vectorized pass, and users with the
+    same diet preference and allergies share one candidate food pool for
+    the whole run.
+    Each user's plan gets its own seed, drawn from seed, and is the same
+    plan generate_meal_plan makes for that user with the plan's "seed".
+    Batch plans are not stored in the plan cache.
+    
+    Parameters:
+    - users: Dict of user ID -> user data, or an iterable of
+      (user_id, user_data) pairs such as a user store's iter_users()
+    - food_data: DataFrame with food nutrition data
+    - days, meals_per_day, method, time_limit, max_weekly_repeats,
+      min_repeat_gap: As for generate_meal_plan, time_limit applies to each
+      user's plan
+    - chunk_size: Number of users read per vectorized pass
+    - seed: Optional seed making the whole batch reproducible
+    
+    Yields:
+    - (user_id, meal plan dict) pairs in input order; the plan is an error
+      dict if no foods match the user's diet
+    """
+    if 'Calories' not in food_data.columns:
+        raise ValueError("Food data is missing calorie information")
+    
+    variety = (max_weekly_repeats, min_repeat_gap)
+    pools = {}
+    
+    for user_id, user_data, diet, user_seed, daily_calories, macros in batch_planning_jobs(users, chunk_size, seed):
+        pool_key = (diet, parse_allergies(user_data.get('allergies')))
+        if pool_key not in pools:
+            pools[pool_key] = get_food_pool(food_data, *pool_key)
+        pool = pools[pool_key]
+        
+        if len(pool) == 0:
+            yield user_id, {"error": "No foods available that match your dietary preferences"}
+            continue
+        
+        yield user_id, build_meal_plan(pool, user_seed, user_data, daily_calories, macros,
+                                       days, meals_per_day, method, time_limit, variety)
+
+def batch_planning_jobs(users, chunk_size=BATCH_CHUNK_SIZE, seed=None):
+    """
+    Work out what is needed to plan each user of a batch
+    
+    Calorie needs and macros are computed chunk_size users at a time in
+    one vectorized pass, and each user gets a plan seed drawn from seed.
+    
+    Parameters:
+    - users, chunk_size, seed: As for generate_meal_plans_batch
+    
+    Yields:
+    - Tuples (user_id, user_data, diet, plan seed, daily calories, macros)
+      in input order
+    """
+    if isinstance(users, dict):
+        users = users.items()
+    
+    seeds = np.random.default_rng(seed)
+    users = iter(users)
+    
+    while True:
+        chunk = list(itertools.islice(users, chunk_size))
+        if not chunk:
+            break
+        
+        profiles = [planning_profile(user_data) for _, user_data in chunk]
+        weights, heights, ages, genders, activity_levels, goals = zip(*profiles)
+        
+        calories = calculate_calorie_needs_batch(weights, heights, ages, genders, activity_levels, goals)
+        macros = calculate_macros_batch(calories, goals)
+        user_seeds = seeds.integers(0, 2 ** 32, size=len(chunk))
+        
+        for i, (user_id, user_data) in enumerate(chunk):
+            diet = (user_data.get('diet') or 'both').lower()
+            user_macros = {name: int(values[i]) for name, values in macros.items()}
+            yield user_id, user_data, diet, int(user_seeds[i]), int(calories[i]), user_macros
+
+def new_plan_seed():
+    """
+    Draw a fresh seed for a meal plan, small enough to share as a plan code
+    """
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+def plan_day_rng(seed, day):
+    """
+    Random generator for one day of a plan
+
+    Every day has its own stream, so a day can be rebuilt without drawing
+    the days before it.
+    """
+    return np.random.default_rng((seed, day))
+
+def planning_profile(user_data):
+    """
+    Profile values used for calorie needs, with the defaults used when a
+    value is missing
+    
+    Returns:
+    - Tuple: (weight, height, age, gender, activity_level, goal)
+    """
     weight = user_data.get('weight', 70)
     height = user_data.get('height', 170)
     gender = user_data.get('gender', 'male')
@@ -36,121 +246,435 @@ def generate_meal_plan(user_data, food_data, days=7, meals_per_day=3):
     age = user_data.get('age', 30)
     activity_level = user_data.get('activity_level', 'moderately_active')
     
-    daily_calories = calculate_calorie_needs(weight, height, age, gender, activity_level, goal)
-    macros = calculate_macros(daily_calories, goal)
+    return weight, height, age, gender, activity_level, goal
+
+def build_meal_plan(pool, seed, user_data, daily_calories, macros, days, meals_per_day, method, time_limit,
+                    variety=(MAX_WEEKLY_REPEATS, MIN_REPEAT_GAP_DAYS)):
+    """
+    Build a meal plan for known calorie and macro targets
     
-    # Calculate calories per meal (with some variation)
-    calories_per_meal = daily_calories / meals_per_day
+    Parameters:
+    - pool: FoodPool matching the user's diet
+    - seed: Non-negative integer seed of the plan
+    - user_data: Dict containing user information
+    - daily_calories: Daily calorie target
+    - macros: Dict with protein, carbs and fat targets in grams
+    - days, meals_per_day, method, time_limit: As for generate_meal_plan
+    - variety: Tuple (max_weekly_repeats, min_repeat_gap)
     
-    # Generate meal plan
-    meal_plan = {
+    Returns:
+    - Dict containing meal plan information
+    """
+    meal_plan = new_meal_plan(user_data, daily_calories, macros, method, seed, variety)
+    meal_plan["days"].extend(
+        iter_plan_days(pool, seed, daily_calories, macros, days, meals_per_day, method, time_limit, variety)
+    )
+    meal_plan["variety"] = plan_variety(meal_plan)
+    return meal_plan
+
+def new_meal_plan(user_data, daily_calories, macros, method, seed, variety):
+    """
+    Meal plan dict with the plan's targets and rules and no days yet
+    """
+    max_weekly_repeats, min_repeat_gap = variety
+    return {
         "user": user_data.get('name', 'User'),
         "daily_calories": daily_calories,
         "macros": macros,
+        "method": method,
+        "seed": seed,
+        "variety_rules": {
+            "max_weekly_repeats": max_weekly_repeats,
+            "min_repeat_gap": min_repeat_gap
+        },
         "days": []
     }
+
+def plan_variety_rules(meal_plan):
+    """
+    Variety rules of a plan as a (max_weekly_repeats, min_repeat_gap) tuple
+    """
+    rules = meal_plan.get("variety_rules", {})
+    return (rules.get("max_weekly_repeats", MAX_WEEKLY_REPEATS),
+            rules.get("min_repeat_gap", MIN_REPEAT_GAP_DAYS))
+
+def iter_plan_days(pool, seed, daily_calories, macros, days, meals_per_day, method, time_limit, variety):
+    """
+    Plan the days of a meal plan in order
+    
+    Parameters:
+    - As for build_meal_plan
+    
+    Yields:
+    - Day plan dicts, each as soon as it is planned
+    """
+    # Calculate calories per meal (with some variation)
+    calories_per_meal = daily_calories / meals_per_day
+    
+    # Foods that may still be used under the variety rules
+    tracker = VarietyTracker(len(pool), *variety)
+    budget = SolverBudget(time_limit, days) if method == 'solver' else None
     
     for day in range(1, days + 1):
-        day_plan = {
-            "day": day,
-            "meals": [],
-            "total_calories": 0,
-            "total_protein": 0,
-            "total_carbs": 0,
-            "total_fat": 0
-        }
+        rng = plan_day_rng(seed, day)
+        tracker.start_day(day)
+        day_meals = None
+        day_method = 'greedy'
         
-        # Determine daily exercise based on day of the week
-        day_of_week = day % 7  # Convert to 0-6 for days of the week
+        if budget is not None:
+            day_meals = solve_day_meals(
+                pool, rng, daily_calories, macros, meals_per_day,
+                allowed=tracker.allowed,
+                time_limit=budget.next_day()
+            )
+            if day_meals is not None:
+                day_method = 'solver'
+                for selection in day_meals:
+                    tracker.use(i for i, _ in selection)
         
-        if day_of_week in [1, 3, 5]:  # Monday, Wednesday, Friday
-            day_plan["exercise_focus"] = "Strength Training"
-        elif day_of_week in [2, 6]:  # Tuesday, Saturday
-            day_plan["exercise_focus"] = "Cardio"
-        elif day_of_week == 4:  # Thursday
-            day_plan["exercise_focus"] = "Flexibility & Mobility"
-        else:  # Sunday
-            day_plan["exercise_focus"] = "Rest & Recovery"
+        if day_meals is None:
+            day_meals = greedy_day_meals(pool, rng, calories_per_meal, daily_calories, meals_per_day, tracker)
         
-        # Generate meals for the day
-        remaining_calories = daily_calories
+        day_plan = build_day_plan(pool, day, day_meals, meals_per_day)
+        day_plan["method"] = day_method
+        yield day_plan
+
+def replan_meal_plan(meal_plan, user_data, food_data, day, meal_number=None, method=None,
+                     time_limit=MEAL_SOLVER_TIME_LIMIT, seed=None):
+    """
+    Re-plan one day or one meal of an existing meal plan
+    
+    Only the selected day or meal is planned again, from the same cached
+    candidate pool generate_meal_plan uses, so the cost does not grow with
+    the plan length. A new day is planned against the plan's daily targets.
+    A new meal is planned against what the rest of its day leaves of those
+    targets, so the day's totals stay close to them. All other days are
+    kept as they are.
+    
+    Parameters:
+    - meal_plan: Meal plan dict from generate_meal_plan
+    - user_data: Dict containing user information
+    - food_data: DataFrame with food nutrition data
+    - day: Day number to change, starting at 1
+    - meal_number: Meal number to change within the day, or None to change
+      the whole day
+    - method: 'greedy' or 'solver', defaults to the plan's method
+    - time_limit: Solver time limit for this change in seconds
+    - seed: Optional seed of the change, a new one is drawn if not given
+    
+    Returns:
+    - New meal plan dict sharing the unchanged days with meal_plan, with the
+      change appended to its "edits" list, or a dict with an error message
+    """
+    plan_days = meal_plan.get("days", [])
+    if not 1 <= day <= len(plan_days):
+        return {"error": f"Day {day} is not part of this meal plan"}
+    
+    meals_per_day = len(plan_days[day - 1]["meals"])
+    if meal_number is not None and not 1 <= meal_number <= meals_per_day:
+        return {"error": f"Meal {meal_number} is not part of day {day}"}
+    
+    if 'Calories' not in food_data.columns:
+        return {"error": "Food data is missing calorie information"}
+    
+    pool = get_food_pool(food_data, user_data.get('diet', 'both'), parse_allergies(user_data.get('allergies')))
+    
+    if len(pool) == 0:
+        return {"error": "No foods available that match your dietary preferences"}
+    
+    method = method or meal_plan.get("method", 'greedy')
+    if seed is None:
+        seed = new_plan_seed()
+    rng = np.random.default_rng((seed, day, meal_number or 0))
+    
+    if meal_number is None:
+        new_day = replan_day(pool, rng, meal_plan, day, method, time_limit)
+    else:
+        new_day = replan_meal(pool, rng, meal_plan, day, meal_number, method, time_limit)
+    
+    new_plan = dict(meal_plan)
+    new_plan["days"] = list(plan_days)
+    new_plan["days"][day - 1] = new_day
+    new_plan["edits"] = list(meal_plan.get("edits", [])) + [
+        {"day": day, "meal_number": meal_number, "method": method, "seed": seed}
+    ]
+    new_plan["variety"] = plan_variety(new_plan)
+    
+    return new_plan
+
+def substitute_plan_food(meal_plan, day, meal_number, position, substitute):
+    """
+    Replace one food of a plan meal with a substitute, keeping its servings
+    
+    Parameters:
+    - meal_plan: Meal plan dict from generate_meal_plan
+    - day: Day number, starting at 1
+    - meal_number: Meal number within the day
+    - position: Position of the food within the meal, starting at 0
+    - substitute: Food dict with name, calories, protein, carbs and fat per
+      serving, e.g. from suggest_substitutes
+    
+    Returns:
+    - New meal plan dict sharing the unchanged days with meal_plan, with the
+      change appended to its "edits" list, or a dict with an error message
+    """
+    plan_days = meal_plan.get("days", [])
+    if not 1 <= day <= len(plan_days):
+        return {"error": f"Day {day} is not part of this meal plan"}
+    
+    old_day = plan_days[day - 1]
+    meals = [meal for meal in old_day["meals"] if meal["meal_number"] == meal_number]
+    if not meals or not 0 <= position < len(meals[0]["foods"]):
+        return {"error": f"Meal {meal_number} of day {day} has no food at position {position}"}
+    
+    old_meal = meals[0]
+    servings = old_meal["foods"][position].get("servings", 1)
+    new_food = {
+        "name": substitute["name"],
+        "servings": servings,
+        "calories": substitute["calories"] * servings,
+        "protein": substitute["protein"] * servings,
+        "carbs": substitute["carbs"] * servings,
+        "fat": substitute["fat"] * servings
+    }
+    
+    new_meal = dict(old_meal)
+    new_meal["foods"] = list(old_meal["foods"])
+    new_meal["foods"][position] = new_food
+    for nutrient in ("calories", "protein", "carbs", "fat"):
+        new_meal[nutrient] = sum(food[nutrient] for food in new_meal["foods"])
+    
+    new_day = dict(old_day)
+    new_day["meals"] = [new_meal if meal is old_meal else meal for meal in old_day["meals"]]
+    add_day_totals(new_day)
+    
+    new_plan = dict(meal_plan)
+    new_plan["days"] = list(plan_days)
+    new_plan["days"][day - 1] = new_day
+    new_plan["edits"] = list(meal_plan.get("edits", [])) + [
+        {"day": day, "meal_number": meal_number, "substitute": substitute["name"],
+         "replaced": old_meal["foods"][position]["name"]}
+    ]
+    new_plan["variety"] = plan_variety(new_plan)
+    
+    return new_plan
+
+def replan_day(pool, rng, meal_plan, day, method, time_limit):
+    """
+    Plan one day of an existing plan again
+    
+    Returns:
+    - New day plan dict
+    """
+    daily_calories = meal_plan["daily_calories"]
+    meals_per_day = len(meal_plan["days"][day - 1]["meals"])
+    day_meals = None
+    day_method = 'greedy'
+    
+    # Keep the plan's variety rules against the foods of the other days
+    rules = plan_variety_rules(meal_plan)
+    uses = [
+        (other_day["day"], i)
+        for other_day in meal_plan["days"] if other_day["day"] != day
+        for i in plan_food_indices(pool, other_day["meals"])
+    ]
+    tracker = VarietyTracker(len(pool), *rules, base_allowed=variety_mask(len(pool), uses, day, *rules))
+    tracker.start_day(day)
+    
+    if method == 'solver':
+        day_meals = solve_day_meals(
+            pool, rng, daily_calories, meal_plan["macros"], meals_per_day,
+            allowed=tracker.allowed,
+            time_limit=time_limit
+        )
+        if day_meals is not None:
+            day_method = 'solver'
+    
+    if day_meals is None:
+        day_meals = greedy_day_meals(pool, rng, daily_calories / meals_per_day, daily_calories, meals_per_day, tracker)
+    
+    day_plan = build_day_plan(pool, day, day_meals, meals_per_day)
+    day_plan["method"] = day_method
+    return day_plan
+
+def replan_meal(pool, rng, meal_plan, day, meal_number, method, time_limit):
+    """
+    Plan one meal of an existing plan again, against what the rest of the
+    day leaves of the daily targets
+    
+    Returns:
+    - New day plan dict with the meal replaced and the totals updated
+    """
+    old_day = meal_plan["days"][day - 1]
+    meals_per_day = len(old_day["meals"])
+    other_meals = [meal for meal in old_day["meals"] if meal["meal_number"] != meal_number]
+    
+    daily_calories = meal_plan["daily_calories"]
+    meal_calories = max(
+        daily_calories - sum(meal["calories"] for meal in other_meals),
+        daily_calories / meals_per_day * MIN_REPLAN_MEAL_SHARE
+    )
+    selection = None
+    
+    # Keep the plan's variety rules against every food that stays, and
+    # leave out the foods of the replaced meal
+    rules = plan_variety_rules(meal_plan)
+    uses = [
+        (other_day["day"], i)
+        for other_day in meal_plan["days"]
+        for i in plan_food_indices(pool, other_meals if other_day["day"] == day else other_day["meals"])
+    ]
+    allowed = variety_mask(len(pool), uses, day, *rules)
+    allowed[plan_food_indices(pool, [meal for meal in old_day["meals"] if meal["meal_number"] == meal_number])] = False
+    
+    if method == 'solver':
+        macros = meal_plan["macros"]
+        meal_macros = {
+            name: max(target - sum(meal[name] for meal in other_meals), 0)
+            for name, target in macros.items()
+        }
         
-        for meal_num in range(1, meals_per_day + 1):
-            # Calculate target calories for this meal
-            if meal_num == meals_per_day:
-                # Last meal gets remaining calories
-                target_calories = remaining_calories
-            else:
-                # Add some variation to meal calories
-                variation = np.random.uniform(0.8, 1.2)
-                target_calories = (calories_per_meal * variation)
-                # Ensure we don't exceed remaining calories
-                target_calories = min(target_calories, remaining_calories)
-            
-            # Find foods that fit within the target calories
-            # We'll use a simple approach: select foods randomly that add up to target calories
-            meal_foods = []
-            meal_calories = 0
-            meal_protein = 0
-            meal_carbs = 0
-            meal_fat = 0
-            
-            # Shuffle the food list to get variety
-            foods_shuffled = filtered_foods.sample(frac=1)
-            
-            # Select 2-4 foods for the meal
-            num_foods = np.random.randint(2, 5)
-            
-            # Try to find foods that add up to target calories
-            for i in range(min(len(foods_shuffled), 50)):  # Limit search to 50 foods
-                food = foods_shuffled.iloc[i]
-                food_calories = food.get('Calories', 0)
-                
-                # Skip foods with missing calorie data
-                if pd.isna(food_calories) or food_calories <= 0:
-                    continue
-                
-                # If adding this food keeps us within or close to target calories, add it
-                if len(meal_foods) < num_foods and meal_calories + food_calories <= target_calories * 1.1:
-                    meal_foods.append({
-                        "name": food.get('Food Name', f"Food {i}"),
-                        "calories": food_calories,
-                        "protein": food.get('Protein', 0),
-                        "carbs": food.get('Carbs', 0),
-                        "fat": food.get('Total Fat', 0)
-                    })
-                    
-                    meal_calories += food_calories
-                    meal_protein += food.get('Protein', 0)
-                    meal_carbs += food.get('Carbs', 0)
-                    meal_fat += food.get('Total Fat', 0)
-                
-                # If we have enough foods or are close enough to target calories, stop
-                if len(meal_foods) >= num_foods and meal_calories >= target_calories * 0.8:
-                    break
-            
-            # Create meal object
-            meal = {
-                "meal_number": meal_num,
-                "meal_name": get_meal_name(meal_num, meals_per_day),
-                "foods": meal_foods,
-                "calories": meal_calories,
-                "protein": meal_protein,
-                "carbs": meal_carbs,
-                "fat": meal_fat
-            }
-            
-            day_plan["meals"].append(meal)
-            day_plan["total_calories"] += meal_calories
-            day_plan["total_protein"] += meal_protein
-            day_plan["total_carbs"] += meal_carbs
-            day_plan["total_fat"] += meal_fat
-            
-            remaining_calories -= meal_calories
+        # The free deviation is the day's, not a share of the smaller meal targets
+        day_targets = np.array([daily_calories, macros['protein'], macros['carbs'], macros['fat']], dtype=np.float64)
+        meal_targets = np.array([meal_calories, meal_macros['protein'], meal_macros['carbs'], meal_macros['fat']])
+        tolerance = TARGET_TOLERANCE * day_targets / np.maximum(meal_targets, 1)
         
-        meal_plan["days"].append(day_plan)
+        solved = solve_day_meals(pool, rng, meal_calories, meal_macros, 1,
+                                 allowed=allowed, time_limit=time_limit, tolerance=tolerance)
+        if solved is not None:
+            selection = solved[0]
     
-    return meal_plan
+    if selection is None:
+        num_foods = rng.integers(2, 5)
+        selection = select_meal_foods(pool, rng, meal_calories, num_foods, allowed=allowed)
+        if not selection:
+            selection = select_meal_foods(pool, rng, meal_calories, num_foods)
+    
+    day_plan = dict(old_day)
+    day_plan["meals"] = [
+        build_meal(pool, meal_number, meals_per_day, selection) if meal["meal_number"] == meal_number else meal
+        for meal in old_day["meals"]
+    ]
+    add_day_totals(day_plan)
+    return day_plan
+
+def plan_food_indices(pool, meals):
+    """
+    Pool indices of the foods in a list of plan meals, foods not in the pool are skipped
+    """
+    indices = []
+    for meal in meals:
+        for food in meal["foods"]:
+            i = pool.index_of(food["name"])
+            if i is not None:
+                indices.append(i)
+    return indices
+
+def greedy_day_meals(pool, rng, calories_per_meal, daily_calories, meals_per_day, tracker=None):
+    """
+    Pick random foods for each meal of a day up to the meal's calorie target
+    
+    With a VarietyTracker, only foods it allows are picked and every meal's
+    foods are recorded in it. A meal that finds no allowed food falls back
+    to any food, so a small pool still gives full days.
+    
+    Returns:
+    - List with one list of (pool index, servings) pairs per meal
+    """
+    day_meals = []
+    remaining_calories = daily_calories
+    
+    for meal_num in range(1, meals_per_day + 1):
+        # Calculate target calories for this meal
+        if meal_num == meals_per_day:
+            # Last meal gets remaining calories
+            target_calories = remaining_calories
+        else:
+            # Add some variation to meal calories
+            variation = rng.uniform(0.8, 1.2)
+            target_calories = (calories_per_meal * variation)
+            # Ensure we don't exceed remaining calories
+            target_calories = min(target_calories, remaining_calories)
+        
+        # Select 2-4 foods that add up to about the target calories
+        num_foods = rng.integers(2, 5)
+        if tracker is None:
+            selection = select_meal_foods(pool, rng, target_calories, num_foods)
+        else:
+            selection = select_meal_foods(pool, rng, target_calories, num_foods, allowed=tracker.allowed)
+            if not selection:
+                selection = select_meal_foods(pool, rng, target_calories, num_foods)
+            tracker.use(i for i, _ in selection)
+        day_meals.append(selection)
+        
+        remaining_calories -= meal_totals(pool, selection)[0]
+    
+    return day_meals
+
+def build_day_plan(pool, day, day_meals, meals_per_day):
+    """
+    Build a day of the meal plan from the foods chosen for each meal
+    
+    Parameters:
+    - pool: FoodPool the foods were chosen from
+    - day: Day number, starting at 1
+    - day_meals: List with one list of (pool index, servings) pairs per meal
+    - meals_per_day: Number of meals per day
+    
+    Returns:
+    - Dict with the day's meals and totals
+    """
+    day_plan = {
+        "day": day,
+        "meals": [
+            build_meal(pool, meal_num, meals_per_day, selection)
+            for meal_num, selection in enumerate(day_meals, start=1)
+        ],
+        "exercise_focus": get_exercise_focus(day)
+    }
+    add_day_totals(day_plan)
+    
+    return day_plan
+
+def build_meal(pool, meal_num, meals_per_day, selection):
+    """
+    Build a meal of the meal plan from a list of (pool index, servings) pairs
+    """
+    meal_calories, meal_protein, meal_carbs, meal_fat = meal_totals(pool, selection)
+    
+    return {
+        "meal_number": meal_num,
+        "meal_name": get_meal_name(meal_num, meals_per_day),
+        "foods": [pool.food(i, servings) for i, servings in selection],
+        "calories": meal_calories,
+        "protein": meal_protein,
+        "carbs": meal_carbs,
+        "fat": meal_fat
+    }
+
+def add_day_totals(day_plan):
+    """
+    Set a day plan's totals from its meals
+    """
+    day_plan["total_calories"] = sum(meal["calories"] for meal in day_plan["meals"])
+    day_plan["total_protein"] = sum(meal["protein"] for meal in day_plan["meals"])
+    day_plan["total_carbs"] = sum(meal["carbs"] for meal in day_plan["meals"])
+    day_plan["total_fat"] = sum(meal["fat"] for meal in day_plan["meals"])
+
+def get_exercise_focus(day):
+    """
+    Get the exercise focus for a plan day based on the day of the week
+    """
+    day_of_week = day % 7  # Convert to 0-6 for days of the week
+    
+    if day_of_week in [1, 3, 5]:  # Monday, Wednesday, Friday
+        return "Strength Training"
+    elif day_of_week in [2, 6]:  # Tuesday, Saturday
+        return "Cardio"
+    elif day_of_week == 4:  # Thursday
+        return "Flexibility & Mobility"
+    else:  # Sunday
+        return "Rest & Recovery"
 
 def get_meal_name(meal_number, total_meals):
     """
@@ -178,6 +702,12 @@ def recommend_foods_by_goal(user_data, food_data, num_recommendations=10):
     """
     Recommend foods based on user's fitness goal
     
+    Foods are scored by the goal's formula in the scoring config, leaving
+    out foods the user's allergies rule out. Scores are worked out once per
+    formula, diet, allergies and food dataset version when
+    food_data comes from the dataset registry, so repeated calls only read
+    the cached ranking.
+    
     Parameters:
     - user_data: Dict containing user information
     - food_data: DataFrame with food nutrition data
@@ -186,88 +716,50 @@ def recommend_foods_by_goal(user_data, food_data, num_recommendations=10):
     Returns:
     - List of recommended foods
     """
-    # Filter foods based on dietary preference
-    filtered_foods = filter_foods_by_preference(food_data, user_data.get('diet', 'both'))
-    
-    if filtered_foods.empty:
-        return []
-    
-    goal = user_data.get('goal', '').lower()
-    
-    # Assign scores to each food based on goal
-    scores = []
-    
-    for _, food in filtered_foods.iterrows():
-        score = 0
-        
-        # Skip foods with missing data
-        if pd.isna(food.get('Calories', 0)) or food.get('Calories', 0) <= 0:
-            scores.append(-1)  # Low score for foods with missing data
-            continue
-        
-        # Weight Loss: Favor foods with high protein, low calories, high fiber
-        if 'weight loss' in goal:
-            protein_per_calorie = food.get('Protein', 0) / max(food.get('Calories', 1), 1)
-            fiber_per_calorie = food.get('Dietary Fiber', 0) / max(food.get('Calories', 1), 1)
-            
-            score = (protein_per_calorie * 5) + (fiber_per_calorie * 3) - (food.get('Sugar', 0) * 0.1)
-        
-        # Weight Gain: Favor foods with high calories, balanced macros
-        elif 'weight gain' in goal:
-            calorie_density = food.get('Calories', 0) / 100  # per 100g
-            protein_ratio = food.get('Protein', 0) / max(food.get('Calories', 1), 1)
-            
-            score = (calorie_density * 3) + (protein_ratio * 2)
-        
-        # Muscle Gain: Favor foods high in protein and moderate calories
-        elif 'muscle gain' in goal:
-            protein_content = food.get('Protein', 0)
-            protein_ratio = protein_content / max(food.get('Calories', 1), 1)
-            
-            score = (protein_content * 2) + (protein_ratio * 5)
-        
-        # Maintain Weight: Favor balanced, nutrient-dense foods
-        else:
-            nutrition_density = (
-                food.get('Protein', 0) +
-                food.get('Dietary Fiber', 0) * 2 +
-                (food.get('Nutrition Density', 0) / 100)
-            ) / max(food.get('Calories', 1), 1)
-            
-            score = nutrition_density * 5
-        
-        scores.append(score)
-    
-    # Add scores to the dataframe
-    filtered_foods_with_scores = filtered_foods.copy()
-    filtered_foods_with_scores['score'] = scores
+    scorer = get_goal_scorer(user_data.get('goal', ''))
+    ranking = get_food_ranking(food_data, scorer, user_data.get('diet', 'both'),
+                               parse_allergies(user_data.get('allergies')))
+    top_foods, scores = ranking.top_foods(food_data, num_recommendations)
     
-    # Sort by score and get top recommendations
-    top_recommendations = filtered_foods_with_scores.sort_values('score', ascending=False).head(num_recommendations)
+    def column(name, default):
+        if name not in top_foods.columns:
+            return [default] * len(top_foods)
+        return top_foods[name].tolist()
     
     # Convert to list of dictionaries
-    recommendations = []
-    for _, food in top_recommendations.iterrows():
-        if food.get('score', 0) > 0:  # Only include foods with positive scores
-            recommendations.append({
-                "name": food.get('Food Name', 'Unknown Food'),
-                "calories": food.get('Calories', 0),
-                "protein": food.get('Protein', 0),
-                "carbs": food.get('Carbs', 0),
-                "fat": food.get('Total Fat', 0),
-                "score": food.get('score', 0)
-            })
-    
-    return recommendations
+    return [
+        {
+            "name": name,
+            "calories": calories,
+            "protein": protein,
+            "carbs": carbs,
+            "fat": fat,
+            "score": score
+        }
+        for name, calories, protein, carbs, fat, score in zip(
+            column('Food Name', 'Unknown Food'),
+            column('Calories', 0),
+            column('Protein', 0),
+            column('Carbs', 0),
+            column('Total Fat', 0),
+            scores.tolist()
+        )
+        if score > 0  # Only include foods with positive scores
+    ]
 
-def recommend_exercises(user_data, exercise_data, num_recommendations=5):
+def recommend_exercises(user_data, exercise_data, num_recommendations=5, seed=None):
     """
     Recommend exercises based on user's fitness goal and health status
     
+    Exercises are drawn at random from each category of the exercise index,
+    with every main muscle of a category equally likely. The same seed and
+    profile always give the same recommendations.
+    
     Parameters:
     - user_data: Dict containing user information
     - exercise_data: DataFrame with exercise data
     - num_recommendations: Number of exercises to recommend
+    - seed: Optional seed for the random draws
     
     Returns:
     - Dict containing recommended exercises by category
@@ -276,15 +768,8 @@ def recommend_exercises(user_data, exercise_data, num_recommendations=5):
         return {"error": "No exercise data available"}
     
     goal = user_data.get('goal', '').lower()
-    health_status = user_data.get('health_status', '').lower()
-    health_conditions = user_data.get('health_conditions', '').lower()
-    
-    # Determine appropriate exercise intensity based on health status
-    low_intensity = ('underweight' in health_status or 
-                    'obese' in health_status or 
-                    any(condition in health_conditions for condition in ['heart', 'diabetes', 'respiratory', 'joint']))
     
-    # Select exercises based on goal and intensity
+    # Select exercises based on goal
     if 'weight loss' in goal:
         # Weight loss: mix of cardio, flexibility, and some strength
         weights = {'Cardio': 0.5, 'Flexibility': 0.3, 'Strength': 0.2}
@@ -295,71 +780,18 @@ def recommend_exercises(user_data, exercise_data, num_recommendations=5):
         # Balanced approach for maintenance or other goals
         weights = {'Cardio': 0.3, 'Strength': 0.4, 'Flexibility': 0.3}
     
-    # Initialize recommendations
-    recommendations = {
-        "Cardio": [],
-        "Strength": [],
-        "Flexibility": []
-    }
-    
-    # Map exercise types to categories
-    exercise_categories = {
-        'Cardio': ['Cardio', 'HIIT', 'Aerobic'],
-        'Strength': ['Strength', 'Resistance', 'Weight', 'Bodyweight'],
-        'Flexibility': ['Stretch', 'Yoga', 'Mobility', 'Flexibility']
-    }
+    index = get_exercise_index(exercise_data)
+    rng = np.random.default_rng(seed)
     
-    # Categorize exercises
-    for _, exercise in exercise_data.iterrows():
-        exercise_type = exercise.get('Equipment Type', '').strip()
-        exercise_name = exercise.get('Exercise', '').strip()
-        main_muscle = exercise.get('Main Muscle', '').strip()
-        
-        # Skip exercises with empty names
-        if not exercise_name:
-            continue
-        
-        # Categorize the exercise
-        category = None
-        for cat, keywords in exercise_categories.items():
-            if any(keyword.lower() in exercise_type.lower() for keyword in keywords):
-                category = cat
-                break
+    recommendations = {}
+    for category in EXERCISE_CATEGORIES:
+        count = int(num_recommendations * weights[category])
+        rows = index.sample(count, rng, category)
         
-        # Default to Strength if not categorized
-        if not category:
-            category = 'Strength'
+        # If a category is empty, fill with random exercises of any type
+        if len(rows) == 0:
+            rows = index.sample(min(count, 5), rng)
         
-        # Add exercise to appropriate category
-        if len(recommendations[category]) < int(num_recommendations * weights[category]):
-            recommendations[category].append({
-                "name": exercise_name,
-                "type": exercise_type,
-                "main_muscle": main_muscle,
-                "preparation": exercise.get('Preparation', ''),
-                "execution": exercise.get('Execution', ''),
-                "target_muscles": exercise.get('Target Muscles', ''),
-                "synergist_muscles": exercise.get('Synergist Muscles', '')
-            })
-    
-    # If any category is empty, fill with random exercises of that type
-    for category, exercises in recommendations.items():
-        if not exercises:
-            # Get random exercises for this category
-            category_exercises = [
-                {
-                    "name": exercise.get('Exercise', 'Unknown Exercise'),
-                    "type": exercise.get('Equipment Type', ''),
-                    "main_muscle": exercise.get('Main Muscle', ''),
-                    "preparation": exercise.get('Preparation', ''),
-                    "execution": exercise.get('Execution', ''),
-                    "target_muscles": exercise.get('Target Muscles', ''),
-                    "synergist_muscles": exercise.get('Synergist Muscles', '')
-                }
-                for _, exercise in exercise_data.sample(min(5, len(exercise_data))).iterrows()
-                if exercise.get('Exercise', '')
-            ]
-            
-            recommendations[category] = category_exercises[:int(num_recommendations * weights[category])]
+        recommendations[category] = exercise_records(exercise_data, rows)
     
     return recommendations
@@ -0,0 +1,372 @@
+import ast
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from utils.allergy_index import get_exclusion_mask
+from utils.data_processing import filter_foods_by_preference
+from utils.datasets import get_dataset_artifact
+
+SCORING_CONFIG_PATH = 'attached_assets/scoring_formulas.json'
+
+# Used when the config file is missing or unreadable, same as the shipped file
+DEFAULT_SCORING_CONFIG = {
+    "goals": ["weight loss", "weight gain", "muscle gain"],
+    "default_goal": "maintain weight",
+    "scorers": {
+        "weight loss": {
+            "score": "Protein / max(Calories, 1) * 5 + Dietary_Fiber / max(Calories, 1) * 3 - Sugar * 0.1",
+            "where": "Calories > 0"
+        },
+        "weight gain": {
+            "score": "Calories / 100 * 3 + Protein / max(Calories, 1) * 2",
+            "where": "Calories > 0"
+        },
+        "muscle gain": {
+            "score": "Protein * 2 + Protein / max(Calories, 1) * 5",
+            "where": "Calories > 0"
+        },
+        "maintain weight": {
+            "score": "(Protein + Dietary_Fiber * 2 + Nutrition_Density / 100) / max(Calories, 1) * 5",
+            "where": "Calories > 0"
+        },
+        "low calorie": {
+            "score": "-Calories",
+            "where": "Calories > 0 and Calories < 100"
+        },
+        "high protein": {
+            "score": "Protein",
+            "where": "Protein > 10 and Calories > 0"
+        }
+    }
+}
+
+# Functions formulas may call, all applied element-wise
+FORMULA_FUNCTIONS = {
+    "max": np.maximum,
+    "min": np.minimum,
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "log": np.log
+}
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod)
+_COMPARE_OPERATORS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+class FormulaError(ValueError):
+    """
+    A scoring formula that cannot be parsed or uses something not allowed
+    """
+
+class _FormulaCompiler(ast.NodeTransformer):
+    """
+    Checks a parsed formula and rewrites it into NumPy array operations
+
+    and, or and not become &, | and ~, and chained comparisons are split
+    into pairs joined by &, so they work element-wise. Any name that is not
+    a function is a column.
+    """
+    def __init__(self):
+        self.columns = set()
+
+    def generic_visit(self, node):
+        raise FormulaError(f"{type(node).__name__} is not allowed in a formula")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise FormulaError(f"Only numbers are allowed as constants, not {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id in FORMULA_FUNCTIONS:
+            raise FormulaError(f"{node.id} must be called")
+        self.columns.add(node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BINARY_OPERATORS):
+            raise FormulaError(f"Operator {type(node.op).__name__} is not allowed in a formula")
+        return ast.BinOp(left=self.visit(node.left), op=node.op, right=self.visit(node.right))
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=operand)
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            return ast.UnaryOp(op=node.op, operand=operand)
+        raise FormulaError(f"Operator {type(node.op).__name__} is not allowed in a formula")
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_Compare(self, node):
+        left = self.visit(node.left)
+        pairs = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if not isinstance(op, _COMPARE_OPERATORS):
+                raise FormulaError(f"Comparison {type(op).__name__} is not allowed in a formula")
+            right = self.visit(comparator)
+            pairs.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        result = pairs[0]
+        for pair in pairs[1:]:
+            result = ast.BinOp(left=result, op=ast.BitAnd(), right=pair)
+        return result
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FORMULA_FUNCTIONS:
+            raise FormulaError(f"Unknown function in formula: {ast.unparse(node.func)}")
+        if node.keywords:
+            raise FormulaError(f"{node.func.id} takes no keyword arguments")
+        return ast.Call(func=node.func, args=[self.visit(arg) for arg in node.args], keywords=[])
+
+def compile_formula(text):
+    """
+    Parse a formula over nutrient columns into compiled NumPy column code
+
+    Formulas are Python-like expressions of numbers, column names, the
+    arithmetic operators, comparisons, and, or, not, and the functions in
+    FORMULA_FUNCTIONS. Column names are written with underscores in place
+    of spaces, e.g. Dietary_Fiber for 'Dietary Fiber'.
+
+    Parameters:
+    - text: Formula text
+
+    Returns:
+    - Tuple: (code object, set of column names used)
+
+    Raises:
+    - FormulaError if the formula is invalid
+    """
+    try:
+        tree = ast.parse(str(text).strip(), mode='eval')
+    except SyntaxError as e:
+        raise FormulaError(f"Cannot parse formula {text!r}: {e.msg}") from None
+
+    compiler = _FormulaCompiler()
+    tree = ast.fix_missing_locations(compiler.visit(tree))
+    return compile(tree, '<formula>', 'eval'), compiler.columns
+
+class Scorer:
+    """
+    A compiled scoring formula with an optional filter
+
+    score() evaluates the formula over whole columns at once. Rows that
+    fail the filter score NaN. Columns missing from the table count as 0,
+    missing values stay NaN, so their rows score NaN as well.
+    """
+    def __init__(self, name, score, where=None):
+        self.name = name
+        self.formula = score
+        self.where = where
+        self.score_code, score_columns = compile_formula(score)
+        if where:
+            self.where_code, where_columns = compile_formula(where)
+        else:
+            self.where_code, where_columns = None, set()
+        self.columns = score_columns | where_columns
+        # Identifies the formulas in cache keys, so tuned weights are not served stale
+        self.key = (name, score, where)
+
+        # Type errors, e.g. not applied to a number, only show when evaluated
+        try:
+            self.score(pd.DataFrame({column: [0.0] for column in self.columns}))
+        except Exception as e:
+            raise FormulaError(f"Cannot evaluate scorer {name!r}: {e}") from None
+
+    def score(self, food_data):
+        """
+        Score every row of a food DataFrame
+
+        Returns:
+        - Float array with one score per row
+        """
+        columns = {}
+        for name in self.columns:
+            column = name.replace('_', ' ')
+            if column in food_data.columns:
+                columns[name] = pd.to_numeric(food_data[column], errors='coerce').to_numpy(dtype=np.float64)
+            elif name in food_data.columns:
+                columns[name] = pd.to_numeric(food_data[name], errors='coerce').to_numpy(dtype=np.float64)
+            else:
+                columns[name] = np.zeros(len(food_data))
+
+        namespace = {"__builtins__": {}, **FORMULA_FUNCTIONS}
+        with np.errstate(all='ignore'):
+            scores = np.broadcast_to(np.asarray(eval(self.score_code, namespace, columns), dtype=np.float64),
+                                     (len(food_data),))
+            if self.where_code is None:
+                return scores.copy()
+            keep = np.broadcast_to(np.asarray(eval(self.where_code, namespace, columns), dtype=bool),
+                                   (len(food_data),))
+            return np.where(keep, scores, np.nan)
+
+class ScoringConfig:
+    """
+    Compiled scorers of a scoring config, and how user goals map to them
+
+    Scorers the config leaves out keep their DEFAULT_SCORING_CONFIG formulas.
+    """
+    def __init__(self, config):
+        specs = dict(DEFAULT_SCORING_CONFIG["scorers"])
+        specs.update({str(name).lower(): spec for name, spec in config.get("scorers", {}).items()})
+        self.scorers = {name: Scorer(name, spec["score"], spec.get("where")) for name, spec in specs.items()}
+        self.goals = [str(goal).lower() for goal in config.get("goals", [])]
+        self.default_goal = str(config.get("default_goal", "")).lower()
+
+        for goal in self.goals + [self.default_goal]:
+            if goal not in self.scorers:
+                raise FormulaError(f"No scorer for goal {goal!r}")
+
+    def goal_scorer(self, goal):
+        """
+        Scorer of the first configured goal named in a user's goal, or of the default goal
+        """
+        goal = (goal or '').lower()
+        for name in self.goals:
+            if name in goal:
+                return self.scorers[name]
+        return self.scorers[self.default_goal]
+
+_config = None
+_config_stamp = None
+_config_lock = threading.Lock()
+
+def get_scoring_config(path=SCORING_CONFIG_PATH):
+    """
+    Get the compiled scoring config
+
+    The config file is compiled once and again whenever it changes, so
+    weights can be tuned while the app runs. An unreadable or invalid file
+    keeps the last good config, or DEFAULT_SCORING_CONFIG if there is none.
+    """
+    global _config, _config_stamp
+    try:
+        stat = os.stat(path)
+        stamp = (path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stamp = None
+
+    with _config_lock:
+        if _config is not None and stamp == _config_stamp:
+            return _config
+
+        config = None
+        if stamp is not None:
+            try:
+                with open(path, 'r') as f:
+                    config = ScoringConfig(json.load(f))
+            except Exception as e:
+                print(f"Error loading scoring formulas: {e}")
+
+        if config is None:
+            config = _config or ScoringConfig(DEFAULT_SCORING_CONFIG)
+
+        _config = config
+        _config_stamp = stamp
+        return config
+
+def get_scorer(name):
+    """
+    Get a compiled scorer by name, e.g. 'high protein'
+
+    Raises:
+    - KeyError if no scorer has this name
+    """
+    return get_scoring_config().scorers[name.lower()]
+
+def get_goal_scorer(goal):
+    """
+    Get the compiled scorer for a user's goal
+    """
+    return get_scoring_config().goal_scorer(goal)
+
+class FoodRanking:
+    """
+    Foods of one diet ranked by one scorer
+
+    Foods scoring NaN are left out. The ranking is extended on demand:
+    asking for the top k selects them with argpartition and keeps them in
+    order, so later requests for up to k foods are a slice.
+    """
+    def __init__(self, rows, scores):
+        scored = ~np.isnan(scores)
+        self.rows = rows[scored]
+        self.scores = scores[scored]
+        self.ranked = np.empty(0, dtype=np.intp)
+
+    def top(self, k):
+        """
+        Positions in rows and scores of the k best foods, best first
+        """
+        k = max(min(k, len(self.scores)), 0)
+        if k > len(self.ranked):
+            if k < len(self.scores):
+                candidates = np.argpartition(-self.scores, k - 1)[:k]
+            else:
+                candidates = np.arange(len(self.scores))
+            # Best score first, earlier rows first among equal scores
+            self.ranked = candidates[np.lexsort((candidates, -self.scores[candidates]))]
+        return self.ranked[:k]
+
+    def top_foods(self, food_data, k):
+        """
+        The k best foods as DataFrame rows, and their scores
+
+        Parameters:
+        - food_data: The DataFrame the ranking was built from
+
+        Returns:
+        - Tuple: (DataFrame, float array of scores)
+        """
+        top = self.top(k)
+        if not food_data.index.is_unique:
+            food_data = food_data.reset_index(drop=True)
+        return food_data.iloc[self.rows[top]], self.scores[top]
+
+    def excluding(self, excluded):
+        """
+        Ranking of the same foods without those a boolean mask over food rows marks
+
+        The foods already ranked stay ranked, in the same order.
+        """
+        keep = ~excluded[self.rows]
+        ranking = FoodRanking(self.rows[keep], self.scores[keep])
+        ranking.ranked = (np.cumsum(keep) - 1)[self.ranked[keep[self.ranked]]]
+        return ranking
+
+def build_food_ranking(food_data, scorer, diet='both', allergies=()):
+    """
+    Score the foods of a diet and rank them, leaving out foods the allergies rule out
+    """
+    if not food_data.index.is_unique:
+        food_data = food_data.reset_index(drop=True)
+    filtered_foods = filter_foods_by_preference(food_data, diet)
+    rows = food_data.index.get_indexer(filtered_foods.index)
+    scores = scorer.score(filtered_foods)
+    if allergies:
+        scores[get_exclusion_mask(food_data, allergies)[rows]] = np.nan
+    return FoodRanking(rows, scores)
+
+def get_food_ranking(food_data, scorer, diet='both', allergies=()):
+    """
+    Get the ranking of a diet's foods by a scorer, built once per food
+    dataset version and formula. Foods a tuple of allergies from
+    parse_allergies rules out are dropped from the cached ranking per call
+    """
+    diet = (diet or 'both').lower()
+    ranking = get_dataset_artifact(food_data, ('food_ranking', scorer.key, diet),
+                                   lambda data: build_food_ranking(data, scorer, diet))
+    if allergies:
+        ranking = ranking.excluding(get_exclusion_mask(food_data, allergies))
+    return ranking
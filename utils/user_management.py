@@ -1,10 +1,20 @@
+import copy
 import json
+import threading
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from utils.data_processing import calculate_bmi, save_user_records, load_user_records
+from utils.data_processing import calculate_bmi
+from utils.datasets import invalidate_dataset
+from utils.user_store import get_user_store
 
-def create_new_user(first_name, last_name, gender, height, weight, diet, goal, health_conditions):
+# In-process cache of user records, valid while the store's files are unchanged
+_user_cache = {}
+_cache_fingerprint = None
+_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_cache_lock = threading.Lock()
+
+def create_new_user(first_name, last_name, gender, height, weight, diet, goal, health_conditions, **profile_fields):
     """
     Create a new user record
     
@@ -17,24 +27,19 @@ def create_new_user(first_name, last_name, gender, height, weight, diet, goal, h
     - diet: Diet preference
     - goal: Fitness goal
     - health_conditions: Any health conditions
+    - profile_fields: Further profile fields, e.g. age, activity_level,
+      allergies, preferred_cuisines
     
     Returns:
     - Tuple: (success, message, user_id)
     """
     try:
-        # Load existing records
-        user_records = load_user_records()
-        
         # Create name
         name = f"{first_name.strip().lower()} {last_name.strip().lower()}"
         
         # Calculate BMI
         bmi, health_status = calculate_bmi(weight, height)
         
-        # Generate a new user ID
-        records = user_records.get("records", {})
-        new_id = str(len(records) + 1)
-        
         # Create new user record
         new_user = {
             "name": name,
@@ -54,15 +59,20 @@ def create_new_user(first_name, last_name, gender, height, weight, diet, goal, h
             ],
             "health_status": health_status
         }
+        new_user.update(profile_fields)
         
-        # Add to records
-        records[new_id] = new_user
-        user_records["records"] = records
+        # Add to the store, which assigns the new user ID
+        store = get_user_store()
+        validate_user_cache(store)
+        new_id = store.add_user(new_user)
         
-        # Save updated records
-        save_success = save_user_records(user_records)
+        if new_id is not None:
+            write_through_user_cache(store, new_id, record=new_user)
         
-        if save_success:
+        # Sessions share one copy of the user records, reload it on next access
+        invalidate_dataset("user_records")
+        
+        if new_id is not None:
             return True, f"Record {new_id} inserted successfully!", new_id
         else:
             return False, "Failed to save user record.", None
@@ -82,41 +92,38 @@ def update_user(user_id, data):
     - Tuple: (success, message)
     """
     try:
-        # Load existing records
-        user_records = load_user_records()
-        
-        # Check if user exists
-        records = user_records.get("records", {})
-        if user_id not in records:
-            return False, f"User ID {user_id} not found."
-        
-        # Get current user data
-        user_data = records[user_id]
-        
-        # Update fields
-        for key, value in data.items():
-            user_data[key] = value
+        def apply_update(user_data):
+            # Update fields
+            for key, value in data.items():
+                user_data[key] = value
+            
+            # Recalculate BMI if height or weight were updated
+            if 'height' in data or 'weight' in data:
+                height = user_data['height']
+                weight = user_data['weight']
+                bmi, health_status = calculate_bmi(weight, height)
+                user_data['bmi'] = bmi
+                user_data['health_status'] = health_status
         
-        # Recalculate BMI if height or weight were updated
-        if 'height' in data or 'weight' in data:
-            height = user_data['height']
-            weight = user_data['weight']
-            bmi, health_status = calculate_bmi(weight, height)
-            user_data['bmi'] = bmi
-            user_data['health_status'] = health_status
+        # The store applies the update under its lock and retries it if
+        # another session changed the records concurrently
+        store = get_user_store()
+        validate_user_cache(store)
+        save_success = store.update_user(user_id, apply_update)
         
-        # Update record
-        records[user_id] = user_data
-        user_records["records"] = records
+        if save_success:
+            write_through_user_cache(store, user_id, mutate=apply_update)
         
-        # Save updated records
-        save_success = save_user_records(user_records)
+        # Sessions share one copy of the user records, reload it on next access
+        invalidate_dataset("user_records")
         
         if save_success:
             return True, f"User {user_id} updated successfully!"
         else:
             return False, "Failed to save user record."
             
+    except KeyError:
+        return False, f"User ID {user_id} not found."
     except Exception as e:
         return False, f"Error updating user: {str(e)}"
 
@@ -131,26 +138,24 @@ def delete_user(user_id):
     - Tuple: (success, message)
     """
     try:
-        # Load existing records
-        user_records = load_user_records()
-        
-        # Check if user exists
-        records = user_records.get("records", {})
-        if user_id not in records:
-            return False, f"User ID {user_id} not found."
-        
         # Delete record
-        del records[user_id]
-        user_records["records"] = records
+        store = get_user_store()
+        validate_user_cache(store)
+        save_success = store.delete_user(user_id)
         
-        # Save updated records
-        save_success = save_user_records(user_records)
+        if save_success:
+            write_through_user_cache(store, user_id)
+        
+        # Sessions share one copy of the user records, reload it on next access
+        invalidate_dataset("user_records")
         
         if save_success:
             return True, f"User {user_id} deleted successfully!"
         else:
             return False, "Failed to save user record."
             
+    except KeyError:
+        return False, f"User ID {user_id} not found."
     except Exception as e:
         return False, f"Error deleting user: {str(e)}"
 
@@ -165,12 +170,30 @@ def get_user(user_id):
     - User data dict or None if not found
     """
     try:
-        # Load records
-        user_records = load_user_records()
+        store = get_user_store()
+        validate_user_cache(store)
+        
+        with _cache_lock:
+            if user_id in _user_cache:
+                _cache_stats["hits"] += 1
+                # Hand out a copy so callers can't change the cached record
+                return copy.deepcopy(_user_cache[user_id])
+            _cache_stats["misses"] += 1
+            fingerprint = _cache_fingerprint
+        
+        # Get user data, taking every user at once if the store reads them all anyway
+        if store.LOADS_ALL_USERS:
+            users = store.get_all_users()
+        else:
+            user_data = store.get_user(user_id)
+            users = {user_id: user_data} if user_data is not None else {}
+        
+        with _cache_lock:
+            # Only fill the cache if no write invalidated it while we were loading
+            if _cache_fingerprint == fingerprint:
+                _user_cache.update(users)
         
-        # Get user data
-        records = user_records.get("records", {})
-        return records.get(user_id)
+        return copy.deepcopy(users.get(user_id))
             
     except Exception as e:
         print(f"Error getting user: {str(e)}")
@@ -188,16 +211,12 @@ def update_user_progress(user_id, weight):
     - Tuple: (success, message)
     """
     try:
-        # Load existing records
-        user_records = load_user_records()
-        
-        # Check if user exists
-        records = user_records.get("records", {})
-        if user_id not in records:
-            return False, f"User ID {user_id} not found."
+        store = get_user_store()
         
         # Get current user data
-        user_data = records[user_id]
+        user_data = get_user(user_id)
+        if user_data is None:
+            return False, f"User ID {user_id} not found."
         
         # Calculate new BMI
         height = user_data['height']
@@ -210,26 +229,29 @@ def update_user_progress(user_id, weight):
             "bmi": bmi
         }
         
-        # Add to progress history
-        if 'progress_history' not in user_data:
-            user_data['progress_history'] = []
-        
-        user_data['progress_history'].append(progress_entry)
-        
         # Update current weight and BMI
         old_weight = user_data.get('weight', 0)
         old_bmi = user_data.get('bmi', 0)
         
-        user_data['weight'] = float(weight)
-        user_data['bmi'] = bmi
-        user_data['health_status'] = health_status
+        updates = {
+            "weight": float(weight),
+            "bmi": bmi,
+            "health_status": health_status
+        }
+        
+        # Add to progress history
+        validate_user_cache(store)
+        save_success = store.append_progress(user_id, progress_entry, updates)
         
-        # Update record
-        records[user_id] = user_data
-        user_records["records"] = records
+        if save_success:
+            def apply_progress(cached):
+                cached.setdefault('progress_history', []).append(progress_entry)
+                cached.update(updates)
+            
+            write_through_user_cache(store, user_id, mutate=apply_progress)
         
-        # Save updated records
-        save_success = save_user_records(user_records)
+        # Sessions share one copy of the user records, reload it on next access
+        invalidate_dataset("user_records")
         
         if save_success:
             return True, f"Progress updated! Previous: {old_weight}kg (BMI: {old_bmi}), New: {weight}kg (BMI: {bmi})"
@@ -247,12 +269,77 @@ def get_all_users():
     - Dict of all user records
     """
     try:
-        # Load records
-        user_records = load_user_records()
-        
         # Return all records
-        return user_records.get("records", {})
+        return get_user_store().get_all_users()
             
     except Exception as e:
         print(f"Error getting users: {str(e)}")
         return {}
+
+def validate_user_cache(store):
+    """
+    Drop cached users if the store's files changed since the cache was filled
+    
+    Returns:
+    - The store fingerprint the cache is now valid for
+    """
+    global _cache_fingerprint
+    
+    fingerprint = store.fingerprint()
+    with _cache_lock:
+        if fingerprint != _cache_fingerprint:
+            if _user_cache:
+                _cache_stats["invalidations"] += 1
+            _user_cache.clear()
+            _cache_fingerprint = fingerprint
+    return fingerprint
+
+def write_through_user_cache(store, user_id, mutate=None, record=None):
+    """
+    Apply a successful write to the cached copy of a user
+    
+    The cache adopts the fingerprint of exactly the write the store made.
+    If the store cannot tie a fingerprint to the write, or the cache was not
+    current just before it, the user is dropped instead and the cache
+    fingerprint is left alone, so the next read revalidates the cache.
+    
+    Parameters:
+    - store: The user store that was written
+    - user_id: ID of the written user
+    - mutate: Function changing the cached user dict in place
+    - record: New record to cache for the user
+    
+    Without mutate or record the user is dropped from the cache.
+    """
+    global _cache_fingerprint
+    
+    commit = store.last_commit()
+    
+    with _cache_lock:
+        if commit is None or commit[0] != _cache_fingerprint:
+            # Another writer may have changed the files too, don't vouch for them
+            _user_cache.pop(user_id, None)
+            return
+        
+        if mutate is not None:
+            if user_id in _user_cache:
+                mutate(_user_cache[user_id])
+        elif record is not None:
+            _user_cache[user_id] = copy.deepcopy(record)
+        else:
+            _user_cache.pop(user_id, None)
+        
+        # Only our own write changed the files, the cache is still current
+        _cache_fingerprint = commit[1]
+
+def get_user_cache_stats():
+    """
+    Get hit and miss counters of the user cache
+    
+    Returns:
+    - Dict with hits, misses, invalidations and the number of cached users
+    """
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["cached_users"] = len(_user_cache)
+    return stats
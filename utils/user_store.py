@@ -0,0 +1,803 @@
+import argparse
+import copy
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from utils.data_processing import load_user_records, save_user_records, USER_RECORDS_PATH
+from utils.progress import normalize_progress_entry, normalize_progress_history
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks on this platform, writers rely on the version check alone
+    fcntl = None
+
+# Storage backend for user records: 'json' (records.json) or 'sqlite'
+USER_STORE_BACKEND = os.environ.get('SMA_USER_STORE', 'json').lower()
+USER_DB_PATH = os.environ.get('SMA_USER_DB', 'attached_assets/users.db')
+
+class JsonUserStore:
+    """
+    User records kept in a single JSON document
+
+    Reads parse the whole file and profile writes rewrite it. Progress
+    entries are the exception: they are appended to a JSON Lines journal
+    next to the records file and folded into the records on read. Once the
+    journal grows past JOURNAL_COMPACT_BYTES it is folded back into the
+    records file by a background thread.
+
+    Journal lines carry an increasing sequence number, and the records file
+    stores the highest sequence number already folded into it
+    ("journal_seq"), so an entry is never applied twice even if compaction
+    is interrupted.
+
+    Writes to the records file are optimistic: see _commit.
+    """
+    JOURNAL_COMPACT_BYTES = 256 * 1024
+    MAX_COMMIT_ATTEMPTS = 20
+
+    def __init__(self, path=USER_RECORDS_PATH, journal_path=None):
+        self.path = path
+        self.journal_path = journal_path or os.path.splitext(path)[0] + '.journal.jsonl'
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._compacting = False
+
+    # Any read parses every user, so callers caching users should take them all
+    LOADS_ALL_USERS = True
+
+    def fingerprint(self):
+        """
+        Stamp of every file the records are read from, changes on any write
+        """
+        journal_stamps = [file_stamp(path) for path in [self.journal_path + '.compacting', self.journal_path]]
+        # An empty journal holds nothing, appends create one before writing to it
+        return (file_stamp(self.path),) + tuple(stamp if stamp and stamp[2] else None for stamp in journal_stamps)
+
+    def last_commit(self):
+        """
+        Fingerprints just before and just after this thread's last write
+
+        Returns:
+        - Tuple: (fingerprint before, fingerprint after), or None if the last
+          write failed or another writer may have changed the files in between
+        """
+        return getattr(self._local, 'last_commit', None)
+
+    def get_user(self, user_id):
+        user_data = self._load().get("records", {}).get(user_id)
+        return _with_normalized_progress(user_data) if user_data is not None else None
+
+    def get_all_users(self):
+        records = self._load().get("records", {})
+        return {user_id: _with_normalized_progress(user_data) for user_id, user_data in records.items()}
+
+    def iter_users(self, batch_size=500):
+        # The records are one JSON document, so they are parsed at once, but
+        # users are still handed out one at a time
+        for user_id, user_data in self._load().get("records", {}).items():
+            yield user_id, _with_normalized_progress(user_data)
+
+    def add_user(self, record):
+        new_ids = self.add_users([record])
+        return new_ids[0] if new_ids else None
+
+    def add_users(self, records):
+        """
+        Add several users with a single write of the records file
+
+        Returns:
+        - List of the new user IDs, or None if the write failed
+        """
+        def insert(user_records):
+            stored = user_records.setdefault("records", {})
+            first_id = _next_user_id(stored)
+            new_ids = []
+            for offset, record in enumerate(records):
+                new_id = str(first_id + offset)
+                stored[new_id] = record
+                new_ids.append(new_id)
+            return new_ids
+
+        success, new_ids = self._commit(insert)
+        return new_ids if success else None
+
+    def update_user(self, user_id, mutate):
+        def update(user_records):
+            records = user_records.setdefault("records", {})
+            if user_id not in records:
+                raise KeyError(user_id)
+            mutate(records[user_id])
+
+        success, _ = self._commit(update)
+        return success
+
+    def delete_user(self, user_id):
+        def delete(user_records):
+            records = user_records.setdefault("records", {})
+            if user_id not in records:
+                raise KeyError(user_id)
+            del records[user_id]
+
+        success, _ = self._commit(delete)
+        return success
+
+    def normalize_progress(self):
+        """
+        Rewrite legacy progress entries in the records file in the current shape
+
+        Returns:
+        - Number of entries rewritten, or None if the write failed
+        """
+        def normalize(user_records):
+            changed = 0
+            for user_data in user_records.get("records", {}).values():
+                if user_data.get('progress_history'):
+                    user_data['progress_history'], count = normalize_progress_history(user_data['progress_history'])
+                    changed += count
+            return changed
+
+        success, changed = self._commit(normalize)
+        return changed if success else None
+
+    def append_progress(self, user_id, entry, updates):
+        """
+        Append a progress entry to the journal with a single fsync'd write
+
+        Appends hold the journal's own lock, not the records file lock, so a
+        weigh-in never waits for a profile write. The user is not looked up,
+        entries for users that no longer exist are dropped when the journal
+        is folded.
+        """
+        self.append_progress_batch([(user_id, entry, updates)])
+        return True
+
+    def append_progress_batch(self, items):
+        """
+        Append several progress entries to the journal with a single fsync'd write
+
+        Parameters:
+        - items: List of (user_id, entry, updates) tuples
+
+        Returns:
+        - Number of entries appended
+        """
+        self._local.last_commit = None
+        if not items:
+            return 0
+
+        while True:
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+
+                # Compaction may have moved the journal aside while we waited
+                if os.fstat(fd).st_ino != os.stat(self.journal_path).st_ino:
+                    continue
+
+                # Sequence numbers are taken under the lock, so file order
+                # and sequence order always agree
+                before = self.fingerprint()
+                first_seq = self._next_seq(len(items))
+                lines = "".join(
+                    json.dumps({
+                        "seq": first_seq + i,
+                        "user_id": user_id,
+                        "entry": entry,
+                        "updates": updates
+                    }) + "\n"
+                    for i, (user_id, entry, updates) in enumerate(items)
+                )
+                os.write(fd, lines.encode('utf-8'))
+                os.fsync(fd)
+                journal_size = os.fstat(fd).st_size
+
+                # No other append can touch the journal while we hold its lock,
+                # the records file and a moved-aside journal can still change
+                after = self.fingerprint()
+                if before[:2] == after[:2]:
+                    self._local.last_commit = (before, after)
+                break
+            except FileNotFoundError:
+                continue
+            finally:
+                os.close(fd)
+
+        if journal_size > self.JOURNAL_COMPACT_BYTES:
+            self.compact_journal_in_background()
+
+        return len(items)
+
+    def compact_journal(self):
+        """
+        Fold the progress journal into the records file
+
+        The live journal is first moved aside under its lock, so appends
+        made during compaction go to a fresh journal and are not lost. The
+        whole compaction holds the records file lock: the moved-aside file
+        is only removed by the compaction that folded it, never by one that
+        read the journals before a newer file was moved aside.
+        """
+        compacting_path = self.journal_path + '.compacting'
+
+        with self._lock, self._file_lock():
+            if not os.path.exists(compacting_path):
+                if not os.path.exists(self.journal_path):
+                    return True
+
+                with open(self.journal_path, 'a') as journal:
+                    if fcntl is not None:
+                        fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+                    os.replace(self.journal_path, compacting_path)
+
+            # Loading folds the journal and advances journal_seq past it,
+            # so saving the loaded records unchanged is the compaction
+            user_records = self._load()
+            user_records["version"] = user_records.get("version", 0) + 1
+            if not save_user_records(user_records, self.path):
+                return False
+
+            os.remove(compacting_path)
+            return True
+
+    def compact_journal_in_background(self):
+        """
+        Start compact_journal on a daemon thread unless one is already running
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact_journal()
+            except Exception as e:
+                print(f"Error compacting progress journal: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _commit(self, mutate):
+        """
+        Apply a change to the records file with optimistic concurrency control
+
+        The records are read and changed without holding the lock. The lock
+        is only taken to check that nobody replaced the file in the meantime
+        and to write the result; if somebody did, the change is retried on
+        the fresh records instead of blocking other writers for the whole
+        read-modify-write cycle.
+
+        Parameters:
+        - mutate: Function changing the records dict in place. It may be
+          called more than once and may raise KeyError for a missing user
+
+        Returns:
+        - Tuple: (success, value returned by mutate). last_commit tells the
+          fingerprints the write went from and to
+        """
+        self._local.last_commit = None
+        for attempt in range(self.MAX_COMMIT_ATTEMPTS):
+            stamp = self._stamp()
+            user_records = self._load()
+            result = mutate(user_records)
+
+            with self._file_lock():
+                before = self.fingerprint()
+                if before[0] == stamp:
+                    user_records["version"] = user_records.get("version", 0) + 1
+                    success = save_user_records(user_records, self.path)
+
+                    # Journal appends do not take the records lock, the write
+                    # is only tied to the new fingerprint if none happened
+                    after = self.fingerprint()
+                    if success and before[1:] == after[1:]:
+                        self._local.last_commit = (before, after)
+                    return success, result
+
+            # Lost the race to another writer, back off briefly and retry
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+
+        print(f"Giving up on user records write after {self.MAX_COMMIT_ATTEMPTS} conflicts")
+        return False, None
+
+    def _stamp(self):
+        """
+        Version stamp of the records file on disk
+
+        Every save replaces the file with a new one, so the inode changes on
+        each write even when the size and modification time do not.
+        """
+        return file_stamp(self.path)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Hold the advisory lock that serializes writers of the records file
+        """
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        """
+        Load the records file with the progress journal folded in
+
+        Compaction can move the live journal aside between reading the two
+        journal files. Entries read from the fresh journal would then advance
+        journal_seq past the moved entries that were never read, so the
+        files are read again until neither was replaced during the read.
+        """
+        journal_paths = [self.journal_path + '.compacting', self.journal_path]
+        while True:
+            before = [file_stamp(path) for path in journal_paths]
+            user_records = load_user_records(self.path)
+            journals = [self._read_journal(path) for path in journal_paths]
+            after = [file_stamp(path) for path in journal_paths]
+            # Appends only grow a journal, a different inode means it was moved or removed
+            if [stamp and stamp[0] for stamp in before] == [stamp and stamp[0] for stamp in after]:
+                break
+
+        records = user_records.setdefault("records", {})
+        journal_seq = user_records.get("journal_seq", 0)
+
+        for items in journals:
+            for item in items:
+                if item['seq'] <= journal_seq:
+                    continue
+                journal_seq = item['seq']
+
+                user_data = records.get(item['user_id'])
+                if user_data is None:
+                    continue
+                user_data.setdefault('progress_history', []).append(item['entry'])
+                user_data.update(item['updates'])
+
+        if journal_seq:
+            user_records["journal_seq"] = journal_seq
+        return user_records
+
+    def _read_journal(self, path):
+        """
+        Read the entries of a journal file, skipping a torn last line
+        """
+        if not os.path.exists(path):
+            return []
+
+        items = []
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    # A crash mid-append can leave an incomplete final line
+                    continue
+        return items
+
+    def _next_seq(self, count=1):
+        """
+        Reserve count journal sequence numbers and return the first one
+        (caller holds the journal lock)
+
+        The last number handed out is kept in a small counter file shared by
+        all processes, so numbers only ever increase, whatever the clock
+        does. If the counter file is lost, counting resumes after the
+        highest number already folded into the records file or written to a
+        journal, so a new entry is never at or below journal_seq.
+        """
+        seq_path = self.journal_path + '.seq'
+        try:
+            with open(seq_path, 'r') as f:
+                last_seq = int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            last_seq = self._highest_seq()
+
+        # Replace the counter atomically, a torn write would reset it
+        tmp_path = f"{seq_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(last_seq + count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, seq_path)
+        return last_seq + 1
+
+    def _highest_seq(self):
+        """
+        Highest sequence number in the records file or either journal file
+        """
+        highest = load_user_records(self.path).get("journal_seq", 0)
+        for path in [self.journal_path + '.compacting', self.journal_path]:
+            for item in self._read_journal(path):
+                highest = max(highest, item.get('seq', 0))
+        return highest
+
+class SqliteUserStore:
+    """
+    User records kept in an SQLite database
+
+    Profiles live in the users table as JSON documents keyed by user ID and
+    progress entries live in the progress table, indexed by user, so reading
+    or writing one user touches only that user's rows. Progress history is
+    appended through append_progress. update_user hands mutate the full
+    record like the JSON store does, and rewrites the user's progress rows
+    when mutate changed the history.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            profile TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS progress (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            timestamp TEXT,
+            weight REAL,
+            bmi REAL,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_progress_user ON progress(user_id, entry_id);
+        CREATE TABLE IF NOT EXISTS store_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO store_version (id, version) VALUES (0, 0);
+    """
+
+    def __init__(self, path=USER_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """
+        Get this thread's connection, opening it on first use
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    LOADS_ALL_USERS = False
+
+    def fingerprint(self):
+        """
+        Version of the database, increased by every write the store commits
+
+        File stamps cannot be tied to one commit once its lock is released,
+        so every write transaction bumps a version row instead.
+        """
+        (version,) = self._connect().execute("SELECT version FROM store_version WHERE id = 0").fetchone()
+        return (version,)
+
+    def last_commit(self):
+        """
+        Fingerprints just before and just after this thread's last write
+
+        Returns:
+        - Tuple: (fingerprint before, fingerprint after), or None if the last write failed
+        """
+        return getattr(self._local, 'last_commit', None)
+
+    def _bump_version(self, conn):
+        """
+        Increase the database version inside the caller's write transaction
+
+        Returns:
+        - Tuple: (fingerprint before, fingerprint after) of the transaction
+        """
+        self._local.last_commit = None
+        conn.execute("UPDATE store_version SET version = version + 1 WHERE id = 0")
+        (version,) = conn.execute("SELECT version FROM store_version WHERE id = 0").fetchone()
+        return (version - 1,), (version,)
+
+    def get_user(self, user_id):
+        conn = self._connect()
+        row = conn.execute("SELECT profile FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+
+        user_data = json.loads(row[0])
+        user_data['progress_history'] = self._progress_history(conn, user_id)
+        return user_data
+
+    def get_all_users(self):
+        conn = self._connect()
+        records = {}
+        for user_id, profile in conn.execute("SELECT user_id, profile FROM users"):
+            records[user_id] = json.loads(profile)
+            records[user_id]['progress_history'] = []
+
+        for user_id, entry in conn.execute("SELECT user_id, entry FROM progress ORDER BY entry_id"):
+            if user_id in records:
+                records[user_id]['progress_history'].append(normalize_progress_entry(json.loads(entry)))
+
+        return records
+
+    def iter_users(self, batch_size=500):
+        conn = self._connect()
+        cursor = conn.execute("SELECT user_id, profile FROM users ORDER BY CAST(user_id AS INTEGER), user_id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for user_id, profile in rows:
+                user_data = json.loads(profile)
+                user_data['progress_history'] = self._progress_history(conn, user_id)
+                yield user_id, user_data
+
+    def add_user(self, record):
+        return self.add_users([record])[0]
+
+    def add_users(self, records):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            (first_id,) = conn.execute(
+                "SELECT COALESCE(MAX(CAST(user_id AS INTEGER)), 0) + 1 FROM users"
+            ).fetchone()
+            new_ids = []
+            for offset, record in enumerate(records):
+                new_id = str(first_id + offset)
+                self._insert(conn, new_id, record)
+                new_ids.append(new_id)
+        self._local.last_commit = commit
+        return new_ids
+
+    def update_user(self, user_id, mutate):
+        with self._connect() as conn:
+            # Take the write lock up front so the read-modify-write is atomic
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            row = conn.execute("SELECT profile FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                raise KeyError(user_id)
+
+            profile = json.loads(row[0])
+            history = self._progress_history(conn, user_id)
+            profile['progress_history'] = copy.deepcopy(history)
+            mutate(profile)
+
+            # A changed history is written through, as the JSON store keeps it
+            new_history = profile.pop('progress_history', [])
+            conn.execute(
+                "UPDATE users SET profile = ? WHERE user_id = ?",
+                (json.dumps(profile), user_id)
+            )
+            if new_history != history:
+                conn.execute("DELETE FROM progress WHERE user_id = ?", (user_id,))
+                for entry in new_history:
+                    self._insert_progress(conn, user_id, entry)
+        self._local.last_commit = commit
+        return True
+
+    def delete_user(self, user_id):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            cursor = conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+            if cursor.rowcount == 0:
+                raise KeyError(user_id)
+        self._local.last_commit = commit
+        return True
+
+    def append_progress(self, user_id, entry, updates):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            row = conn.execute("SELECT profile FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                raise KeyError(user_id)
+
+            profile = json.loads(row[0])
+            profile.update(updates)
+            conn.execute(
+                "UPDATE users SET profile = ? WHERE user_id = ?",
+                (json.dumps(profile), user_id)
+            )
+            self._insert_progress(conn, user_id, entry)
+        self._local.last_commit = commit
+        return True
+
+    def append_progress_batch(self, items):
+        """
+        Append several progress entries in one transaction
+
+        Entries for users that do not exist are skipped.
+
+        Returns:
+        - Number of entries appended
+        """
+        appended = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            for user_id, entry, updates in items:
+                row = conn.execute("SELECT profile FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                if row is None:
+                    continue
+
+                if updates:
+                    profile = json.loads(row[0])
+                    profile.update(updates)
+                    conn.execute(
+                        "UPDATE users SET profile = ? WHERE user_id = ?",
+                        (json.dumps(profile), user_id)
+                    )
+                self._insert_progress(conn, user_id, entry)
+                appended += 1
+        self._local.last_commit = commit
+        return appended
+
+    def normalize_progress(self):
+        """
+        Rewrite legacy progress rows in the current shape
+
+        Returns:
+        - Number of entries rewritten
+        """
+        changed = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            commit = self._bump_version(conn)
+            rows = conn.execute("SELECT entry_id, entry FROM progress").fetchall()
+            for entry_id, entry in rows:
+                entry = json.loads(entry)
+                normalized = normalize_progress_entry(entry)
+                if normalized == entry:
+                    continue
+                conn.execute(
+                    "UPDATE progress SET timestamp = ?, weight = ?, bmi = ?, entry = ? WHERE entry_id = ?",
+                    (normalized.get('timestamp'), normalized.get('weight'), normalized.get('bmi'),
+                     json.dumps(normalized), entry_id)
+                )
+                changed += 1
+        self._local.last_commit = commit
+        return changed
+
+    def _insert(self, conn, user_id, record):
+        """
+        Insert or replace a full user record, including its progress history
+        """
+        profile = {key: value for key, value in record.items() if key != 'progress_history'}
+        conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, profile) VALUES (?, ?)",
+            (user_id, json.dumps(profile))
+        )
+        conn.execute("DELETE FROM progress WHERE user_id = ?", (user_id,))
+        for entry in record.get('progress_history', []):
+            self._insert_progress(conn, user_id, entry)
+
+    def _progress_history(self, conn, user_id):
+        """
+        Progress entries of a user in the order they were added
+        """
+        return [
+            normalize_progress_entry(json.loads(entry)) for (entry,) in conn.execute(
+                "SELECT entry FROM progress WHERE user_id = ? ORDER BY entry_id", (user_id,)
+            )
+        ]
+
+    def _insert_progress(self, conn, user_id, entry):
+        entry = normalize_progress_entry(entry)
+        conn.execute(
+            "INSERT INTO progress (user_id, timestamp, weight, bmi, entry) VALUES (?, ?, ?, ?, ?)",
+            (user_id, entry.get('timestamp'), entry.get('weight'), entry.get('bmi'), json.dumps(entry))
+        )
+
+def _next_user_id(records):
+    """
+    Lowest numeric user ID above every existing one
+    """
+    numeric_ids = [int(user_id) for user_id in records if str(user_id).isdigit()]
+    return max(numeric_ids, default=0) + 1
+
+def _with_normalized_progress(user_data):
+    """
+    Copy of a user record with legacy progress entries in the current shape
+    """
+    if not user_data.get('progress_history'):
+        return user_data
+    user_data = dict(user_data)
+    user_data['progress_history'], _ = normalize_progress_history(user_data['progress_history'])
+    return user_data
+
+def file_stamp(path):
+    """
+    (inode, modification time, size) of a file, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_user_store():
+    """
+    Get the user store for the configured backend (SMA_USER_STORE)
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if USER_STORE_BACKEND == 'sqlite':
+                _store = SqliteUserStore(USER_DB_PATH)
+            elif USER_STORE_BACKEND == 'json':
+                _store = JsonUserStore(USER_RECORDS_PATH)
+            else:
+                raise ValueError(f"Unknown user store backend: {USER_STORE_BACKEND}")
+        return _store
+
+def load_user_records_from_store():
+    """
+    Load all user records from the configured store in the records.json layout
+    """
+    try:
+        return {"records": get_user_store().get_all_users()}
+    except Exception as e:
+        print(f"Error loading user records: {e}")
+        return {"records": {}}
+
+def migrate_json_to_sqlite(json_path=USER_RECORDS_PATH, db_path=USER_DB_PATH):
+    """
+    Import all users from a records.json file into an SQLite user store
+
+    Users that already exist in the database are replaced, so running the
+    migration twice leaves the same result.
+
+    Returns:
+    - Number of users imported
+    """
+    records = load_user_records(json_path).get("records", {})
+    store = SqliteUserStore(db_path)
+
+    with store._connect() as conn:
+        for user_id, record in records.items():
+            store._insert(conn, user_id, record)
+
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="User store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Import records.json into an SQLite database")
+    migrate_parser.add_argument("--json", default=USER_RECORDS_PATH, help="Source records.json file")
+    migrate_parser.add_argument("--db", default=USER_DB_PATH, help="Target SQLite database")
+
+    subparsers.add_parser(
+        "normalize-progress",
+        help="Rewrite legacy progress entries (old_/new_ weight and BMI) in the configured store"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_json_to_sqlite(args.json, args.db)
+        print(f"Imported {count} users into {args.db}")
+    elif args.command == "normalize-progress":
+        count = get_user_store().normalize_progress()
+        if count is None:
+            print("Failed to write the user records")
+        else:
+            print(f"Rewrote {count} progress entries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import numpy as np
+
+# Default variety rules: how often a food may appear in any WEEK_DAYS days,
+# and how many days must pass before it appears again (1 allows the next day,
+# 0 also allows a second time on the same day)
+MAX_WEEKLY_REPEATS = 2
+MIN_REPEAT_GAP_DAYS = 2
+WEEK_DAYS = 7
+
+class VarietyTracker:
+    """
+    Tracks which foods may still be used while a plan is built day by day
+
+    allowed is a boolean mask over pool indices. It is updated for the few
+    foods concerned whenever foods are used or a new day starts, so checking
+    a candidate is a single lookup. Counts are kept in plain lists, which
+    beat array operations for the handful of foods a meal touches.
+
+    A food is blocked while it was used max_weekly_repeats times in the
+    last WEEK_DAYS days, or was last used fewer than min_repeat_gap days
+    ago. Foods left out of base_allowed, e.g. by variety_mask, stay blocked.
+    """
+    def __init__(self, pool_size, max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS,
+                 base_allowed=None):
+        self.max_weekly_repeats = max_weekly_repeats
+        self.min_repeat_gap = min_repeat_gap
+        self.base_allowed = base_allowed
+        self.allowed = np.ones(pool_size, dtype=bool) if base_allowed is None else base_allowed.copy()
+        self.week_counts = [0] * pool_size
+        self.last_day = [-WEEK_DAYS - min_repeat_gap] * pool_size
+        self.day = 0
+        # Foods used on each day of the current window
+        self.day_uses = {}
+
+    def start_day(self, day):
+        """
+        Move to a later day, releasing foods whose uses left the window
+        """
+        self.day = day
+        for old_day in [d for d in self.day_uses if d <= day - WEEK_DAYS]:
+            for i in self.day_uses.pop(old_day):
+                self.week_counts[i] -= 1
+                self._refresh(i)
+
+        # Gaps grow with the day, so every food of the window is checked again
+        for uses in self.day_uses.values():
+            for i in uses:
+                self._refresh(i)
+
+    def use(self, indices):
+        """
+        Record foods used on the current day
+        """
+        day_uses = self.day_uses.setdefault(self.day, [])
+        for i in indices:
+            self.week_counts[i] += 1
+            self.last_day[i] = self.day
+            day_uses.append(i)
+            self._refresh(i)
+
+    def _refresh(self, i):
+        """
+        Recompute allowed for pool index i
+        """
+        allowed = (self.week_counts[i] < self.max_weekly_repeats and
+                   self.day - self.last_day[i] >= self.min_repeat_gap)
+        if self.base_allowed is not None:
+            allowed = allowed and self.base_allowed[i]
+        self.allowed[i] = allowed
+
+def variety_mask(pool_size, uses, day, max_weekly_repeats=MAX_WEEKLY_REPEATS, min_repeat_gap=MIN_REPEAT_GAP_DAYS):
+    """
+    Foods that may be used on a day planned again between other planned days
+
+    Uses on either side of the day are counted in one window reaching
+    WEEK_DAYS - 1 days each way, which is stricter than any single week.
+
+    Parameters:
+    - pool_size: Number of entries in the pool
+    - uses: (day, pool index) pairs of the foods planned on the other days
+      and meals that are kept
+    - day: Day being planned
+    - max_weekly_repeats, min_repeat_gap: Variety rules
+
+    Returns:
+    - Boolean mask of allowed pool indices
+    """
+    allowed = np.ones(pool_size, dtype=bool)
+    counts = np.zeros(pool_size, dtype=np.int32)
+
+    for use_day, i in uses:
+        distance = abs(use_day - day)
+        if distance < min_repeat_gap:
+            allowed[i] = False
+        if distance < WEEK_DAYS:
+            counts[i] += 1
+
+    return allowed & (counts < max_weekly_repeats)
+
+def plan_variety(meal_plan):
+    """
+    Measure how varied the foods of a meal plan are
+
+    Returns:
+    - Dict with:
+      - foods: Number of food entries in the plan
+      - unique_foods: Number of different foods
+      - unique_share: unique_foods / foods
+      - evenness: Entropy of the food counts relative to a plan without
+        repeats, 1 when every entry is a different food
+      - max_weekly_repeats: Most uses of one food within any WEEK_DAYS days
+      - min_repeat_gap: Fewest days between two uses of a food, None if no
+        food repeats
+    """
+    food_days = {}
+    for day in meal_plan.get("days", []):
+        for meal in day["meals"]:
+            for food in meal["foods"]:
+                food_days.setdefault(food["name"], []).append(day["day"])
+
+    counts = np.array([len(days) for days in food_days.values()])
+    total = int(counts.sum())
+
+    if total > 1:
+        probabilities = counts / total
+        evenness = float(-(probabilities * np.log(probabilities)).sum() / np.log(total))
+    else:
+        evenness = 1.0
+
+    max_weekly = 1 if total else 0
+    min_gap = None
+    for days in food_days.values():
+        if len(days) == 1:
+            continue
+        # Days are collected in plan order, already sorted
+        start = 0
+        for end, day in enumerate(days):
+            while day - days[start] >= WEEK_DAYS:
+                start += 1
+            max_weekly = max(max_weekly, end - start + 1)
+            if end > 0:
+                gap = day - days[end - 1]
+                min_gap = gap if min_gap is None else min(min_gap, gap)
+
+    return {
+        "foods": total,
+        "unique_foods": len(food_days),
+        "unique_share": len(food_days) / total if total else 1.0,
+        "evenness": evenness,
+        "max_weekly_repeats": max_weekly,
+        "min_repeat_gap": min_gap
+    }
@@ -1,10 +1,10 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+from utils.progress import ProgressSeries, build_progress_series
 
 def create_macronutrient_chart(macros):
     """
@@ -65,12 +65,15 @@ def create_weight_progress_chart(progress_data):
     Create a line chart showing weight progress over time
     
     Parameters:
-    - progress_data: list of dicts with 'timestamp' and 'weight' keys
+    - progress_data: ProgressSeries, or list of dicts with 'timestamp' and 'weight' keys
     
     Returns:
     - Plotly figure object
     """
-    if not progress_data:
+    if not isinstance(progress_data, ProgressSeries):
+        progress_data = build_progress_series(progress_data or [])
+    
+    if len(progress_data) == 0:
         # Return empty figure if no data
         fig = go.Figure()
         fig.update_layout(
@@ -81,22 +84,16 @@ def create_weight_progress_chart(progress_data):
         )
         return fig
     
-    # Convert list of dicts to dataframe
-    df = pd.DataFrame(progress_data)
-    
-    # Convert timestamps to datetime objects
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    # Sort by timestamp
-    df = df.sort_values('timestamp')
+    # The series is already sorted with parsed timestamps
+    dates = progress_data.dates
+    weights = progress_data.weights
     
     # Create the line chart
     fig = px.line(
-        df, 
-        x='timestamp', 
-        y='weight',
+        x=dates, 
+        y=weights,
         markers=True,
-        labels={'timestamp': 'Date', 'weight': 'Weight (kg)'},
+        labels={'x': 'Date', 'y': 'Weight (kg)'},
         title='Weight Progress'
     )
     
@@ -117,12 +114,11 @@ def create_weight_progress_chart(progress_data):
     )
     
     # Add trendline
-    if len(df) > 1:
+    if len(progress_data) > 1:
         fig.add_traces(
             px.scatter(
-                df, 
-                x='timestamp', 
-                y='weight', 
+                x=dates, 
+                y=weights, 
                 trendline='ols'
             ).data[1]
         )
@@ -271,7 +267,51 @@ def create_meal_plan_calories_chart(meal_plan):
         plot_bgcolor='white',
         yaxis=dict(gridcolor='lightgray')
     )
-    
+
+    return fig
+
+def create_micronutrient_coverage_chart(columns, coverage, max_percent=200):
+    """
+    Create a bar chart of a meal plan's vitamin and mineral coverage
+
+    Parameters:
+    - columns: Nutrient names
+    - coverage: Average daily share of each nutrient's reference intake,
+      as returned by plan_micronutrients
+    - max_percent: Bars are cut off at this percentage, labels show the full value
+
+    Returns:
+    - Plotly figure object
+    """
+    percents = np.asarray(coverage, dtype=float) * 100
+    colors = ['#4CAF50' if percent >= 100 else '#FFC107' if percent >= 50 else '#F44336'
+              for percent in percents]
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=list(columns),
+        y=np.minimum(percents, max_percent),
+        text=[f"{percent:.0f}%" for percent in percents],
+        textposition='outside',
+        name='Daily Coverage',
+        marker_color=colors
+    ))
+
+    # Reference intake line
+    fig.add_hline(y=100, line=dict(color='red', width=2, dash='dash'))
+
+    fig.update_layout(
+        title='Average Daily Vitamins and Minerals (% of Reference Intake)',
+        xaxis_title='Nutrient',
+        yaxis_title='% of Reference Intake',
+        height=400,
+        margin=dict(l=20, r=20, t=50, b=20),
+        showlegend=False,
+        plot_bgcolor='white',
+        yaxis=dict(gridcolor='lightgray', range=[0, max_percent * 1.15])
+    )
+
     return fig
 
 def create_nutrient_comparison_chart(foods, nutrient='Protein'):